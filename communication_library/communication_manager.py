@@ -1,12 +1,16 @@
 from typing import Callable, List, Optional
 from collections import deque
 import os
+import time
 
 from communication_library.exceptions import (MissingHeaderError,
                                                                  UnregisteredCallbackError)
 
 from communication_library.exceptions import TransportError  # pylint: disable=ungrouped-imports
 from communication_library.tcp_transport import TcpTransport # pylint: disable=ungrouped-imports
+from communication_library.loopback_transport import LoopbackTransport # pylint: disable=ungrouped-imports
+from communication_library.recording_transport import RecordingTransport, ReplayTransport # pylint: disable=ungrouped-imports
+from communication_library.impaired_transport import ImpairedTransport, NetworkImpairment # pylint: disable=ungrouped-imports
 from communication_library.frame import Frame # pylint: disable=ungrouped-imports
 from communication_library.protocol import GroundStationProtocol # pylint: disable=ungrouped-imports
 
@@ -15,7 +19,8 @@ from communication_library.ids import PriorityID
 from communication_library.transport import (TransportSettings,
                                                                 TransportOptions,
                                                                 TransportInfo,
-                                                                TransportType)
+                                                                TransportType,
+                                                                Transport)
 
 
 class CommunicationManager:
@@ -43,10 +48,40 @@ class CommunicationManager:
         if transport_type == TransportType.TCP:
             self._transport = TcpTransport()
 
+        elif transport_type == TransportType.LOOPBACK:
+            self._transport = LoopbackTransport()
+
+        elif transport_type == TransportType.REPLAY:
+            self._transport = ReplayTransport()
 
         else:
             raise TransportError(f'Attempted to use non existent transport: {transport_type}')
 
+    def set_transport(self, transport: Transport):
+        """
+        Uses an already constructed transport, e.g. a wrapper such as RecordingTransport.
+        """
+        if self.is_connected:
+            self._transport.close()
+
+        self._transport = transport
+
+    def record_transport(self, path: str):
+        """
+        Wraps the current transport so that every chunk read and written is appended to a recording file.
+        Must be called before connect().
+        :param path: recording file, replayable with TransportType.REPLAY
+        """
+        self._transport = RecordingTransport(self._transport, path)
+
+    def impair_transport(self, impairment: NetworkImpairment, clock: Callable[[], float] = time.monotonic):
+        """
+        Wraps the current transport so that every frame read and written goes through impairment.
+        Can be called before or after connect().
+        :param clock: time source of the delays
+        """
+        self._transport = ImpairedTransport(self._transport, impairment, clock)
+
     @property
     def transport_options(self) -> TransportOptions:
         return self._transport.options()
@@ -128,6 +163,12 @@ class CommunicationManager:
             self._transport.write(frame_bytes)
         return frame
 
+    def send_encoded(self, data: bytes) -> None:
+        """
+        Writes already encoded frames to the transport in one write, bypassing the priority buffer.
+        """
+        self._transport.write(data)
+
     def receive(self) -> Frame:
         """
         Receives some data from the transport, governed by the protocol.
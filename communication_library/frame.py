@@ -5,6 +5,11 @@ from dataclasses import dataclass, field, fields, asdict, InitVar
 from communication_library import ids
 
 
+def _board_name(board: int) -> str:
+    # boards between ROCKET and LAST_BOARD have numbers, not names
+    return ids.BoardID(board).name if board in ids.BoardID.__members__.values() else hex(board)
+
+
 @dataclass(frozen=True, order=True)
 class Frame:
     """
@@ -105,10 +110,10 @@ class Frame:
 
     def as_mono_str(self) -> str:
         device_name = ids.DeviceID(self.device_type).name
-        return ' '.join((f'{ids.BoardID(self.destination).name:<9}',
+        return ' '.join((f'{_board_name(self.destination):<9}',
                          f'{ids.PriorityID(self.priority).name:<4}',
                          f'{ids.ActionID(self.action).name:<8}',
-                         f'{ids.BoardID(self.source).name:<7}',
+                         f'{_board_name(self.source):<7}',
                          f'{device_name:<9}',
                          f'{self.device_id:<2}',
                          f'{self.payload_format_str(self.data_type):<7}',
@@ -117,10 +122,10 @@ class Frame:
 
     def __str__(self):
         device_name = ids.DeviceID(self.device_type).name
-        return ', '.join((f'Frame({ids.BoardID(self.destination).name}',
+        return ', '.join((f'Frame({_board_name(self.destination)}',
                           f'{ids.PriorityID(self.priority).name}',
                           f'{ids.ActionID(self.action).name}',
-                          f'{ids.BoardID(self.source).name}',
+                          f'{_board_name(self.source)}',
                           f'{device_name}',
                           f'{self.device_id}',
                           f'{ids.DataTypeID(self.data_type).name}',
@@ -16,6 +16,7 @@ class DeviceID(IntEnum):
     SERVO = 0x00
     RELAY = 0x01
     SENSOR = 0x02
+    PROXY = 0x03
 
 
 @unique
@@ -65,10 +66,18 @@ class _RelayOperationID(IntEnum):
 class _SensorOperationID(IntEnum):
     READ = 0x01
 
+@unique
+class _ProxyOperationID(IntEnum):
+    SUBSCRIBE = 0x01
+    UNSUBSCRIBE = 0x02
+    CLEAR_SUBSCRIPTIONS = 0x03
+    CONFLATE = 0x04
+
 class OperationID(Enum):
     SERVO = _ServoOperationID
     RELAY = _RelayOperationID 
     SENSOR = _SensorOperationID
+    PROXY = _ProxyOperationID
 
 
 class AckStatus(IntEnum):
@@ -0,0 +1,287 @@
+from typing import Callable, List, Optional, Union
+from dataclasses import dataclass
+import itertools
+import heapq
+import random
+import time
+import csv
+
+from communication_library.exceptions import TransportTimeoutError
+from communication_library.ids import PriorityID
+from communication_library.protocol import GroundStationProtocol, FrameStreamParser, FrameHeader
+
+from communication_library.transport import (TransportOptions,
+                                                                TransportInfo,
+                                                                TransportSettings,
+                                                                Transport)
+
+# largest chunk pulled from the wrapped transport at once, the read cache size of the transports
+MAX_READ_CHUNK = 8192
+DIRECTIONS = ('read', 'write')
+DELAY_DISTRIBUTIONS = ('constant', 'uniform', 'normal', 'exponential')
+
+
+@dataclass
+class Impairment:
+    """
+    What happens to the frames of one direction and priority.
+    :param delay: seconds, a number or {distribution: constant|uniform|normal|exponential, ...}
+                  with value, min/max, mean/stddev or mean respectively
+    :param drop: probability that a frame is lost
+    :param duplicate: probability that a frame is delivered twice, the copy with its own delay
+    :param reorder: probability that a frame is held back by reorder_delay, so later frames overtake it
+    :param bit_flip: probability that one random bit of a frame is flipped
+    """
+    delay: Union[float, dict] = 0.0
+    drop: float = 0.0
+    duplicate: float = 0.0
+    reorder: float = 0.0
+    reorder_delay: float = 0.1
+    bit_flip: float = 0.0
+
+    def __post_init__(self):
+        if isinstance(self.delay, dict) and self.delay.get('distribution', 'constant') not in DELAY_DISTRIBUTIONS:
+            raise ValueError(f'Unknown delay distribution "{self.delay["distribution"]}", '
+                             f'expected one of {", ".join(DELAY_DISTRIBUTIONS)}')
+
+    def sample_delay(self, rng: random.Random) -> float:
+        if not isinstance(self.delay, dict):
+            return float(self.delay)
+
+        distribution = self.delay.get('distribution', 'constant')
+        if distribution == 'uniform':
+            delay = rng.uniform(self.delay['min'], self.delay['max'])
+        elif distribution == 'normal':
+            delay = rng.gauss(self.delay['mean'], self.delay['stddev'])
+        elif distribution == 'exponential':
+            delay = rng.expovariate(1.0 / self.delay['mean'])
+        else:
+            delay = self.delay['value']
+        return max(0.0, delay)
+
+
+@dataclass
+class FrameRecord:
+    """
+    One frame that went through a NetworkImpairment, left is None while it is delayed or if it was dropped.
+    """
+    direction: str
+    header: FrameHeader
+    entered: float
+    left: Optional[float] = None
+    dropped: bool = False
+    duplicate: bool = False
+    reordered: bool = False
+    corrupted: bool = False
+
+    @property
+    def latency(self) -> Optional[float]:
+        return None if self.left is None else self.left - self.entered
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class NetworkImpairment:
+    """
+    Decides the fate of every frame crossing a link: delay, loss, duplication, reordering and
+    bit flips, configured per direction and priority and drawn from a seeded RNG, so a run
+    can be repeated exactly. Keeps a FrameRecord of every frame for the latency report.
+    :param config: {seed, read: {default, high, low}, write: {...}}, each entry keyword
+                   arguments of Impairment, high and low override default, see impairment_config.yaml
+    """
+
+    def __init__(self, config: Optional[dict] = None, seed: Optional[int] = None):
+        config = config or {}
+        self.seed = config.get('seed') if seed is None else seed
+        self._rng = random.Random(self.seed)
+        self.impairments = {}
+        for direction in DIRECTIONS:
+            section = config.get(direction) or {}
+            unknown = set(section) - {'default'} - {priority.name.lower() for priority in PriorityID}
+            if unknown:
+                raise ValueError(f'Unknown {direction} impairment sections: {", ".join(sorted(unknown))}')
+            for priority in PriorityID:
+                settings = {**(section.get('default') or {}), **(section.get(priority.name.lower()) or {})}
+                self.impairments[direction, int(priority)] = Impairment(**settings)
+        self.records: List[FrameRecord] = []
+
+    def impair(self, direction: str, frame: bytes, now: float) -> list[tuple[float, bytes, FrameRecord]]:
+        """
+        Returns (release time, bytes, record) of every copy of frame that will be delivered.
+        """
+        impairment = self.impairments[direction, GroundStationProtocol.peek_priority(frame)]
+        header = GroundStationProtocol.peek_header(frame)
+        rng = self._rng
+        record = FrameRecord(direction, header, now)
+        self.records.append(record)
+        if rng.random() < impairment.drop:
+            record.dropped = True
+            return []
+
+        records = [record]
+        if rng.random() < impairment.duplicate:
+            records.append(FrameRecord(direction, header, now, duplicate=True))
+            self.records.append(records[-1])
+
+        deliveries = []
+        for copy in records:
+            data = frame
+            if rng.random() < impairment.bit_flip:
+                bit = rng.randrange(len(frame) * 8)
+                data = bytearray(frame)
+                data[bit // 8] ^= 1 << (bit % 8)
+                data = bytes(data)
+                copy.corrupted = True
+            delay = impairment.sample_delay(rng)
+            if rng.random() < impairment.reorder:
+                delay += impairment.reorder_delay
+                copy.reordered = True
+            deliveries.append((now + delay, data, copy))
+        return deliveries
+
+    def latencies(self, direction: str, priority: Optional[int] = None) -> List[float]:
+        return sorted(record.latency for record in self.records
+                      if record.direction == direction and record.latency is not None
+                      and (priority is None or record.header.priority == priority))
+
+    def latency_percentile(self, direction: str, fraction: float, priority: Optional[int] = None) -> Optional[float]:
+        latencies = self.latencies(direction, priority)
+        return _percentile(latencies, fraction) if latencies else None
+
+    def format_report(self) -> str:
+        """
+        Frames, impairments and the latency they experienced, per direction and priority.
+        """
+        lines = [f'{"direction":<10}{"priority":<9}{"frames":>8}{"dropped":>8}{"dup":>6}{"reord":>6}{"flip":>6}'
+                 f'{"mean ms":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"max ms":>9}']
+        for direction in DIRECTIONS:
+            for priority in PriorityID:
+                records = [record for record in self.records
+                           if record.direction == direction and record.header.priority == priority]
+                if not records:
+                    continue
+                latencies = self.latencies(direction, priority)
+                line = (f'{direction:<10}{priority.name.lower():<9}{len(records):>8}'
+                        f'{sum(record.dropped for record in records):>8}'
+                        f'{sum(record.duplicate for record in records):>6}'
+                        f'{sum(record.reordered for record in records):>6}'
+                        f'{sum(record.corrupted for record in records):>6}')
+                if latencies:
+                    line += (f'{sum(latencies) / len(latencies) * 1000:>9.1f}'
+                             + ''.join(f'{_percentile(latencies, fraction) * 1000:>9.1f}'
+                                       for fraction in (0.5, 0.95, 0.99, 1.0)))
+                lines.append(line)
+        return '\n'.join(lines)
+
+    def write_csv(self, path: str):
+        """
+        One row per frame copy with the time it entered and left the impairment stage.
+        """
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['direction', *FrameHeader._fields, 'entered', 'left', 'latency',
+                             'dropped', 'duplicate', 'reordered', 'corrupted'])
+            for record in self.records:
+                writer.writerow([record.direction, *record.header, record.entered, record.left, record.latency,
+                                 int(record.dropped), int(record.duplicate), int(record.reordered),
+                                 int(record.corrupted)])
+
+
+class ImpairedOptions(TransportOptions):
+    def __init__(self):
+        self.impairment: str = 'NetworkImpairment applied to every frame, see impairment_config.yaml'
+        self.transport: str = 'wrapped transport, opened with its own settings'
+
+
+class ImpairedTransport(Transport):
+    """
+    Transport wrapper passing every frame read and written through a NetworkImpairment.
+    Delayed frames are held until their release time and go out on the next read or write,
+    so the transport has to be polled, as the receive loops do anyway. A frame's latency
+    is the time from entering the wrapper to being handed on, including that polling.
+    :param clock: time source of the delays, e.g. the simulation clock to delay in simulated seconds
+    """
+
+    def __init__(self, transport: Transport, impairment: NetworkImpairment,
+                 clock: Callable[[], float] = time.monotonic):
+        self._transport = transport
+        self.impairment = impairment
+        self._clock = clock
+        self._parsers = {direction: FrameStreamParser() for direction in DIRECTIONS}
+        self._delayed = []
+        self._sequence = itertools.count()
+        self._receive_cache = bytearray()
+
+    @property
+    def read_timeout(self) -> float:
+        return self._transport.read_timeout
+
+    @property
+    def write_timeout(self) -> float:
+        return self._transport.write_timeout
+
+    @classmethod
+    def options(cls) -> ImpairedOptions:
+        return ImpairedOptions()
+
+    @property
+    def info(self) -> TransportInfo:
+        return self._transport.info
+
+    @property
+    def is_open(self) -> bool:
+        return self._transport.is_open
+
+    def open(self, settings: TransportSettings, read_timeout: float = 0,
+             write_timeout: Optional[float] = 1) -> None:
+        self._transport.open(settings, read_timeout, write_timeout)
+
+    def close(self) -> None:
+        self._transport.close()
+
+    def _enqueue(self, direction: str, data: bytes, now: float) -> None:
+        for frame in self._parsers[direction].feed(data):
+            for release_time, frame_data, record in self.impairment.impair(direction, frame, now):
+                # the sequence number keeps frames released at the same time in order
+                heapq.heappush(self._delayed, (release_time, next(self._sequence), direction, frame_data, record))
+
+    def _poll(self) -> None:
+        now = self._clock()
+        while True:
+            try:
+                data = self._transport.read(1)
+                data += self._transport.read(min(self._transport.read_buffer_size, MAX_READ_CHUNK - 1))
+            except TransportTimeoutError:
+                break
+            self._enqueue('read', data, now)
+
+        outgoing = []
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, direction, data, record = heapq.heappop(self._delayed)
+            record.left = now
+            if direction == 'write':
+                outgoing.append(data)
+            else:
+                self._receive_cache += data
+        if outgoing:
+            self._transport.write(b''.join(outgoing))
+
+    def write(self, data: bytes) -> None:
+        self._enqueue('write', data, self._clock())
+        self._poll()
+
+    def read(self, number_of_bytes: int = 1) -> bytes:
+        self._poll()
+        if len(self._receive_cache) < number_of_bytes:
+            raise TransportTimeoutError('Timeout while reading from impaired transport')
+
+        data = bytes(self._receive_cache[:number_of_bytes])
+        del self._receive_cache[:number_of_bytes]
+        return data
+
+    @property
+    def read_buffer_size(self) -> int:
+        self._poll()
+        return len(self._receive_cache)
@@ -0,0 +1,201 @@
+from typing import Optional, Callable, Dict, List
+from collections import deque
+
+from communication_library.exceptions import (
+    ClosedTransportError,
+    TransportTimeoutError,
+    TransportError)
+
+from communication_library.transport import (TransportOptions,
+                                                                TransportInfo,
+                                                                TransportSettings,
+                                                                Transport)
+
+
+class LoopbackOptions(TransportOptions):
+    def __init__(self):
+        self.proxy: str = 'LoopbackProxy instance'
+        self.port: str = 'port registered on the proxy'
+
+
+class LoopbackInfo(TransportInfo):
+    def __init__(self, active: bool, transport_type: str, address: str, port: int):
+        self.status = 'Active' if active else 'Inactive'
+        self.transport_type = transport_type
+        self.address = address
+        self.port = port
+
+    def __dict__(self) -> dict:
+        return {
+            'Status': self.status,
+            'Type': self.transport_type,
+            'Address': self.address,
+            'Port': self.port
+        }
+
+
+class LoopbackSettings(TransportSettings):
+    def __init__(self, proxy: 'LoopbackProxy', port: int):
+        self.address = 'loopback'
+        self.proxy = proxy
+        self.port = port
+
+    @classmethod
+    def options(cls) -> LoopbackOptions:
+        return LoopbackOptions()
+
+    def validate(self):
+        if self.port not in self.proxy.ports:
+            raise ValueError(f'Port: "{self.port}" is not served by the loopback proxy')
+
+
+class LoopbackTransport(Transport):
+    """
+    In-memory transport. Bytes written to one endpoint become readable on the
+    endpoint(s) it is linked with, either directly (see pair()) or through a LoopbackProxy.
+    """
+
+    def __init__(self):
+        self._receive_cache = deque()
+        self._receive_cache_size = 8192
+        self._route: Optional[Callable[[bytes], None]] = None
+        self._proxy: Optional['LoopbackProxy'] = None
+        self._address = None
+        self._port = None
+        self._open = False
+
+    @classmethod
+    def pair(cls) -> tuple['LoopbackTransport', 'LoopbackTransport']:
+        """
+        Creates two open endpoints connected directly to each other.
+        """
+        first, second = cls(), cls()
+        first._connect(second.deliver, 'pair', 0)
+        second._connect(first.deliver, 'pair', 1)
+        return first, second
+
+    @property
+    def read_timeout(self) -> float:
+        return 0
+
+    @property
+    def write_timeout(self) -> float:
+        return 0
+
+    @classmethod
+    def options(cls) -> LoopbackOptions:
+        return LoopbackSettings.options()
+
+    @property
+    def info(self) -> LoopbackInfo:
+        return LoopbackInfo(active=self.is_open,
+                            transport_type=type(self).__name__,
+                            address=self._address,
+                            port=self._port)
+
+    @property
+    def is_open(self) -> bool:
+        return self._open
+
+    def open(self, settings: LoopbackSettings, read_timeout: float = 0,
+             write_timeout: Optional[float] = 1) -> None:
+        """
+        Attaches the transport to a loopback proxy port.
+        Timeouts are ignored, reads never block.
+
+        :param settings: proxy and port to attach to
+        :param read_timeout: ignored, kept for interface compatibility
+        :param write_timeout: ignored, kept for interface compatibility
+        """
+        try:
+            settings.validate()
+        except ValueError as err:
+            raise TransportError(str(err))
+
+        self._receive_cache.clear()
+        self._proxy = settings.proxy
+        route = settings.proxy.attach(self, settings.port)
+        self._connect(route, settings.address, settings.port)
+
+    def _connect(self, route: Callable[[bytes], None], address: str, port: int) -> None:
+        self._route = route
+        self._address = address
+        self._port = port
+        self._open = True
+
+    def close(self) -> None:
+        if self._proxy is not None:
+            self._proxy.detach(self)
+            self._proxy = None
+        self._route = None
+        self._open = False
+
+    def write(self, data: bytes) -> None:
+        if not self._open:
+            raise ClosedTransportError('Writing to a closed loopback transport')
+        self._route(bytes(data))
+
+    def deliver(self, data: bytes) -> None:
+        """
+        Makes data available for reading on this endpoint. Called by the linked endpoint or proxy.
+        """
+        if self._open:
+            self._receive_cache.extend(data)
+
+    def read(self, number_of_bytes: int = 1) -> bytes:
+        if not self._open:
+            raise ClosedTransportError('Reading from a closed loopback transport')
+
+        if number_of_bytes > self._receive_cache_size:
+            raise ValueError(
+                f'Requested amount of bytes: {number_of_bytes}, '
+                f'exceeds max cache size of: {self._receive_cache_size}. '
+                f'This read will never succeed. Please perform a smaller read.')
+
+        if len(self._receive_cache) < number_of_bytes:
+            raise TransportTimeoutError('Timeout while reading from loopback transport')
+
+        return bytes(self._receive_cache.popleft() for _ in range(number_of_bytes))
+
+    @property
+    def read_buffer_size(self) -> int:
+        return len(self._receive_cache)
+
+
+class LoopbackProxy:
+    """
+    In-process stand-in for tcp_proxy.py. Owns two segments ("software" and "hardware")
+    identified by port numbers; data written on one segment is delivered to every
+    transport on the other one, and mirrored to the other clients of the mirroring segment.
+    """
+
+    def __init__(self, software_port: int = 3000, hardware_port: int = 3001,
+                 mirror_software_frames: bool = True):
+        self._clients: Dict[int, List[LoopbackTransport]] = {software_port: [], hardware_port: []}
+        self._peer_port = {software_port: hardware_port, hardware_port: software_port}
+        self._mirror_frames = {software_port: mirror_software_frames, hardware_port: False}
+
+    @property
+    def ports(self) -> tuple:
+        return tuple(self._clients)
+
+    def attach(self, transport: LoopbackTransport, port: int) -> Callable[[bytes], None]:
+        """
+        Registers the transport on a segment and returns the routing callable for its writes.
+        """
+        self._clients[port].append(transport)
+        return lambda data: self.forward(transport, port, data)
+
+    def detach(self, transport: LoopbackTransport) -> None:
+        for clients in self._clients.values():
+            if transport in clients:
+                clients.remove(transport)
+
+    def forward(self, sender: LoopbackTransport, port: int, data: bytes) -> None:
+        for client in self._clients[self._peer_port[port]]:
+            client.deliver(data)
+
+        if self._mirror_frames[port]:
+            for client in self._clients[port]:
+                if client is not sender:
+                    client.deliver(data)
@@ -1,21 +1,40 @@
 import struct
+import binascii
+from typing import NamedTuple
 
 import bitstruct
-from crccheck.crc import Crc32Mpeg2
 
 from communication_library.exceptions import (
     ChecksumMismatchError, ProtocolError)
 from communication_library.frame import Frame
 from communication_library.ids import HEADER_ID
 
+# translation table reversing the bit order of every byte
+_REVERSED_BITS = bytes(int(f'{byte:08b}'[::-1], 2) for byte in range(256))
+# data_type -> compiled payload format, filled on first use
+_PAYLOAD_PACKERS = {}
+
+
+class FrameHeader(NamedTuple):
+    destination: int
+    priority: int
+    action: int
+    source: int
+    device_type: int
+    device_id: int
+    data_type: int
+    operation: int
+
 
 class GroundStationProtocol:
     """
     AGH Space Systems main ground station protocol for rocket communication.
     """
     HEADER_BYTE_LENGTH = 1
+    VALUES_BYTE_LENGTH = 5
     PAYLOAD_BYTE_LENGTH = 4
     CRC_BYTE_LENGTH = 4
+    FRAME_BYTE_LENGTH = HEADER_BYTE_LENGTH + VALUES_BYTE_LENGTH + PAYLOAD_BYTE_LENGTH + CRC_BYTE_LENGTH
 
     @classmethod
     def encode(cls, frame: Frame) -> bytes:
@@ -37,6 +56,29 @@ class GroundStationProtocol:
         payload = bitstruct.pack('<' + Frame.payload_format_str(frame.data_type), *frame.payload)
         return header + values + payload
 
+    @classmethod
+    def encode_template(cls, frame: Frame) -> bytes:
+        """
+        Encodes everything of frame before the payload, for encode_with_template.
+        Frames that differ only in payload share the template.
+        """
+        data = cls.encode(frame)
+        return data[:cls.HEADER_BYTE_LENGTH + cls.VALUES_BYTE_LENGTH]
+
+    @classmethod
+    def encode_with_template(cls, template: bytes, data_type: int, payload: tuple) -> bytes:
+        """
+        Same bytes as encode() of the templated frame with the given payload, without building a Frame.
+        """
+        packer = _PAYLOAD_PACKERS.get(data_type)
+        if packer is None:
+            packer = _PAYLOAD_PACKERS[data_type] = bitstruct.compile('<' + Frame.payload_format_str(data_type))
+        try:
+            data = template + packer.pack(*payload).translate(_REVERSED_BITS)
+        except bitstruct.Error as err:
+            raise ProtocolError(f'Encoding payload {payload} failed:' + str(err))
+        return data + cls.calculate_crc(data)
+
     @classmethod
     def decode(cls, data: bytes) -> Frame:
         data, crc = data[:-cls.CRC_BYTE_LENGTH], data[-cls.CRC_BYTE_LENGTH:]
@@ -49,6 +91,43 @@ class GroundStationProtocol:
         except bitstruct.Error as err:
             raise ProtocolError(f'Decoding {data} to frame failed:' + str(err))
 
+    @classmethod
+    def peek_header(cls, data: bytes) -> FrameHeader:
+        """
+        Reads the header fields straight from encoded frame bytes, without checking
+        the CRC or decoding the payload. Cheap enough to run on every forwarded frame.
+        """
+        # bit positions after _reverse_bits, fields are packed LSB first
+        return FrameHeader(destination=data[1] & 0x1F,
+                           priority=(data[1] >> 5) & 0x03,
+                           action=(data[1] >> 7) | ((data[2] & 0x07) << 1),
+                           source=data[2] >> 3,
+                           device_type=data[3] & 0x3F,
+                           device_id=(data[3] >> 6) | ((data[4] & 0x0F) << 2),
+                           data_type=data[4] >> 4,
+                           operation=data[5])
+
+    @classmethod
+    def encode_reply(cls, data: bytes, action: int) -> bytes:
+        """
+        Reply to an encoded frame: source and destination swapped, action replaced and the rest,
+        payload included, kept as received. Builds no Frame, so it also answers frames whose
+        fields are unknown to ids.
+        """
+        header = cls.peek_header(data)
+        values = bitstruct.pack('<' + Frame.values_format_str(), header.source, header.priority, action,
+                                header.destination, *header[4:])
+        values_end = cls.HEADER_BYTE_LENGTH + cls.VALUES_BYTE_LENGTH
+        reply = data[:cls.HEADER_BYTE_LENGTH] + values.translate(_REVERSED_BITS) + data[values_end:-cls.CRC_BYTE_LENGTH]
+        return reply + cls.calculate_crc(reply)
+
+    @staticmethod
+    def peek_priority(data: bytes) -> int:
+        """
+        Reads only the priority field of an encoded frame, see peek_header.
+        """
+        return (data[1] >> 5) & 0x03
+
     @classmethod
     def _unpack(cls, data: bytes) -> Frame:
         data, payload = data[:-cls.PAYLOAD_BYTE_LENGTH], data[-cls.PAYLOAD_BYTE_LENGTH:]
@@ -68,9 +147,67 @@ class GroundStationProtocol:
             data += (4 - (len(data) % 4)) * b'\x00'
         format_str = int(len(data)/4)*'I'
         big_endian_data = struct.pack('>' + format_str, *struct.unpack(format_str, data))
-        return Crc32Mpeg2.calc(big_endian_data).to_bytes(cls.CRC_BYTE_LENGTH, return_endianess)
+        # CRC-32/MPEG-2 is the unreflected variant of zlib's CRC-32: reflect the input bytes,
+        # undo zlib's final xor and reflect the 32 bit result back
+        crc = binascii.crc32(big_endian_data.translate(_REVERSED_BITS)) ^ 0xFFFFFFFF
+        crc = int.from_bytes(crc.to_bytes(4, 'little').translate(_REVERSED_BITS), 'big')
+        return crc.to_bytes(cls.CRC_BYTE_LENGTH, return_endianess)
 
     @classmethod
     def _reverse_bits(cls, byte: int) -> int:
         # Reversing bit order using int's binary padded string representation
-        return int(f'{byte:08b}'[::-1], 2)
\ No newline at end of file
+        return int(f'{byte:08b}'[::-1], 2)
+
+
+class FrameStreamParser:
+    """
+    Splits a raw byte stream into encoded frames. Bytes before a header are skipped
+    and a header whose frame fails the CRC check is treated as noise, so the parser
+    resynchronises on the next header byte instead of passing corrupt frames on.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.valid_frames = 0
+        self.corrupt_frames = 0
+        self.skipped_bytes = 0
+
+    @property
+    def buffered_bytes(self) -> int:
+        return len(self._buffer)
+
+    def feed(self, data: bytes) -> list:
+        """
+        Appends data to the internal buffer and returns every complete, valid frame found.
+        Incomplete trailing bytes are kept for the next call.
+        """
+        frame_length = GroundStationProtocol.FRAME_BYTE_LENGTH
+        crc_start = frame_length - GroundStationProtocol.CRC_BYTE_LENGTH
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        position = 0
+
+        while True:
+            header_position = buffer.find(HEADER_ID, position)
+            if header_position < 0:
+                self.skipped_bytes += len(buffer) - position
+                position = len(buffer)
+                break
+
+            self.skipped_bytes += header_position - position
+            position = header_position
+            if len(buffer) - position < frame_length:
+                break
+
+            frame = bytes(buffer[position:position + frame_length])
+            if GroundStationProtocol.calculate_crc(frame[:crc_start]) == frame[crc_start:]:
+                frames.append(frame)
+                position += frame_length
+            else:
+                self.corrupt_frames += 1
+                position += 1
+
+        del buffer[:position]
+        self.valid_frames += len(frames)
+        return frames
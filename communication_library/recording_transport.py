@@ -0,0 +1,282 @@
+from typing import Optional, List, Tuple
+from collections import deque
+from enum import IntEnum
+import struct
+import mmap
+import time
+import os
+
+from communication_library.exceptions import (
+    ClosedTransportError,
+    TransportTimeoutError,
+    TransportError)
+
+from communication_library.transport import (TransportOptions,
+                                                                TransportInfo,
+                                                                TransportSettings,
+                                                                Transport)
+
+RECORDING_MAGIC = b'CMREC1\n'
+# monotonic timestamp, direction, chunk length
+RECORD_HEADER = struct.Struct('<dBI')
+
+
+class RecordDirection(IntEnum):
+    READ = 0
+    WRITE = 1
+
+
+class RecordingOptions(TransportOptions):
+    def __init__(self):
+        self.path: str = 'path of the recording file, appended to if it exists'
+        self.transport: str = 'wrapped transport, opened with its own settings'
+
+
+class RecordingTransport(Transport):
+    """
+    Transport wrapper that appends every raw chunk read from and written to the wrapped
+    transport, together with a monotonic timestamp, to a recording file.
+    """
+
+    def __init__(self, transport: Transport, path: str):
+        self._transport = transport
+        self._path = path
+        self._file = None
+
+    @property
+    def read_timeout(self) -> float:
+        return self._transport.read_timeout
+
+    @property
+    def write_timeout(self) -> float:
+        return self._transport.write_timeout
+
+    @classmethod
+    def options(cls) -> RecordingOptions:
+        return RecordingOptions()
+
+    @property
+    def info(self) -> TransportInfo:
+        return self._transport.info
+
+    @property
+    def is_open(self) -> bool:
+        return self._transport.is_open
+
+    def open(self, settings: TransportSettings, read_timeout: float = 0,
+             write_timeout: Optional[float] = 1) -> None:
+        """
+        Opens the wrapped transport and the recording file (in append mode).
+        """
+        self._transport.open(settings, read_timeout, write_timeout)
+        self._file = open(self._path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(RECORDING_MAGIC)
+
+    def close(self) -> None:
+        self._transport.close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _record(self, direction: RecordDirection, data: bytes) -> None:
+        if self._file is None or not data:
+            return
+        self._file.write(RECORD_HEADER.pack(time.monotonic(), direction, len(data)) + data)
+        self._file.flush()
+
+    def write(self, data: bytes) -> None:
+        self._transport.write(data)
+        self._record(RecordDirection.WRITE, data)
+
+    def read(self, number_of_bytes: int = 1) -> bytes:
+        data = self._transport.read(number_of_bytes)
+        self._record(RecordDirection.READ, data)
+        return data
+
+    @property
+    def read_buffer_size(self) -> int:
+        return self._transport.read_buffer_size
+
+
+class ReplayOptions(TransportOptions):
+    def __init__(self):
+        self.path: str = 'path to a RecordingTransport file'
+        self.speed: str = '0 (as fast as possible) or playback multiplier > 0'
+
+
+class ReplayInfo(TransportInfo):
+    def __init__(self, active: bool, transport_type: str, path: str, speed: float):
+        self.status = 'Active' if active else 'Inactive'
+        self.transport_type = transport_type
+        self.path = path
+        self.speed = speed
+
+    def __dict__(self) -> dict:
+        return {
+            'Status': self.status,
+            'Type': self.transport_type,
+            'Path': self.path,
+            'Speed': self.speed
+        }
+
+
+class ReplaySettings(TransportSettings):
+    def __init__(self, path: str, speed: float = 1.0):
+        self.path = path
+        self.speed = speed
+
+    @classmethod
+    def options(cls) -> ReplayOptions:
+        return ReplayOptions()
+
+    def validate(self):
+        if not os.path.isfile(self.path):
+            raise ValueError(f'Recording: "{self.path}" does not exist')
+
+        if self.speed < 0:
+            raise ValueError(f'Speed: "{self.speed}" must not be negative')
+
+
+class ReplayTransport(Transport):
+    """
+    Plays back the READ chunks of a recording made by RecordingTransport.
+    Chunks become readable at their recorded offsets divided by the speed
+    (speed 0 releases them as soon as they are needed). Written data is not
+    sent anywhere, it is kept in `written` with its replay timestamp.
+    """
+
+    def __init__(self):
+        self._receive_cache = deque()
+        self._receive_cache_size = 8192
+        self._file = None
+        self._mmap = None
+        self._offset = 0
+        self._path = None
+        self._speed = 1.0
+        self._first_timestamp = None
+        self._start_time = None
+        self._open = False
+        self.written: List[Tuple[float, bytes]] = []
+
+    @property
+    def read_timeout(self) -> float:
+        return 0
+
+    @property
+    def write_timeout(self) -> float:
+        return 0
+
+    @classmethod
+    def options(cls) -> ReplayOptions:
+        return ReplaySettings.options()
+
+    @property
+    def info(self) -> ReplayInfo:
+        return ReplayInfo(active=self.is_open,
+                          transport_type=type(self).__name__,
+                          path=self._path,
+                          speed=self._speed)
+
+    @property
+    def is_open(self) -> bool:
+        return self._open
+
+    def open(self, settings: ReplaySettings, read_timeout: float = 0,
+             write_timeout: Optional[float] = 1) -> None:
+        """
+        Memory-maps the recording and starts the playback clock.
+        :param settings: recording path and playback speed
+        :param read_timeout: ignored, reads never block
+        :param write_timeout: ignored, writes are only stored
+        """
+        try:
+            settings.validate()
+        except ValueError as err:
+            raise TransportError(str(err))
+
+        self._file = open(settings.path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise TransportError(f'Recording: "{settings.path}" is empty')
+
+        if self._mmap[:len(RECORDING_MAGIC)] != RECORDING_MAGIC:
+            self.close()
+            raise TransportError(f'Recording: "{settings.path}" has an unknown format')
+
+        self._path = settings.path
+        self._speed = settings.speed
+        self._offset = len(RECORDING_MAGIC)
+        self._receive_cache.clear()
+        self.written.clear()
+        self._first_timestamp = None
+        self._start_time = time.monotonic()
+        self._open = True
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._open = False
+
+    @property
+    def finished(self) -> bool:
+        """
+        True when every recorded chunk has been released and read.
+        """
+        return self._mmap is None or (self._offset >= len(self._mmap) and not self._receive_cache)
+
+    def _elapsed(self) -> float:
+        return (time.monotonic() - self._start_time) * self._speed
+
+    def _release_due_chunks(self, number_of_bytes: int) -> None:
+        while self._offset + RECORD_HEADER.size <= len(self._mmap):
+            timestamp, direction, length = RECORD_HEADER.unpack_from(self._mmap, self._offset)
+            if self._first_timestamp is None:
+                self._first_timestamp = timestamp
+
+            if direction == RecordDirection.READ:
+                if self._speed == 0:
+                    if len(self._receive_cache) >= number_of_bytes:
+                        return
+                elif timestamp - self._first_timestamp > self._elapsed():
+                    return
+                start = self._offset + RECORD_HEADER.size
+                self._receive_cache.extend(self._mmap[start:start + length])
+
+            self._offset += RECORD_HEADER.size + length
+
+    def write(self, data: bytes) -> None:
+        if not self._open:
+            raise ClosedTransportError('Writing to a closed replay transport')
+        self.written.append((time.monotonic() - self._start_time, bytes(data)))
+
+    def read(self, number_of_bytes: int = 1) -> bytes:
+        if not self._open:
+            raise ClosedTransportError('Reading from a closed replay transport')
+
+        if number_of_bytes > self._receive_cache_size:
+            raise ValueError(
+                f'Requested amount of bytes: {number_of_bytes}, '
+                f'exceeds max cache size of: {self._receive_cache_size}. '
+                f'This read will never succeed. Please perform a smaller read.')
+
+        if len(self._receive_cache) < number_of_bytes:
+            self._release_due_chunks(number_of_bytes)
+
+        if len(self._receive_cache) < number_of_bytes:
+            if self._offset >= len(self._mmap):
+                self._open = False
+                raise ClosedTransportError('Replay finished')
+            raise TransportTimeoutError('Timeout while reading from replay')
+
+        return bytes(self._receive_cache.popleft() for _ in range(number_of_bytes))
+
+    @property
+    def read_buffer_size(self) -> int:
+        return len(self._receive_cache)
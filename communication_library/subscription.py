@@ -0,0 +1,83 @@
+from typing import Optional
+from dataclasses import dataclass
+
+from communication_library.frame import Frame
+from communication_library import ids
+
+
+@dataclass(frozen=True)
+class FramePattern:
+    """
+    Pattern of frames a proxy client is interested in. None matches any value.
+    :param action:       ActionID of matching frames
+    :param source:       BoardID the matching frames are sent from
+    :param device_type:  DeviceID of matching frames
+    :param device_id:    id of the device within its device type
+    """
+    action: Optional[int] = None
+    source: Optional[int] = None
+    device_type: Optional[int] = None
+    device_id: Optional[int] = None
+
+    # (field, bit width) in payload order, all bits set means "any"
+    _PAYLOAD_LAYOUT = (('action', 4), ('source', 5), ('device_type', 6), ('device_id', 6))
+
+    def matches(self, action: int, source: int, device_type: int, device_id: int) -> bool:
+        return ((self.action is None or self.action == action)
+                and (self.source is None or self.source == source)
+                and (self.device_type is None or self.device_type == device_type)
+                and (self.device_id is None or self.device_id == device_id))
+
+    def to_payload(self) -> int:
+        payload = 0
+        shift = 0
+        for field_name, bits in self._PAYLOAD_LAYOUT:
+            value = getattr(self, field_name)
+            payload |= ((1 << bits) - 1 if value is None else int(value)) << shift
+            shift += bits
+        return payload
+
+    @classmethod
+    def from_payload(cls, payload: int) -> 'FramePattern':
+        values = {}
+        for field_name, bits in cls._PAYLOAD_LAYOUT:
+            value = payload & ((1 << bits) - 1)
+            values[field_name] = None if value == (1 << bits) - 1 else value
+            payload >>= bits
+        return cls(**values)
+
+
+def _proxy_control_frame(operation: int, payload: int, source: int) -> Frame:
+    return Frame(destination=ids.BoardID.PROXY,
+                 priority=ids.PriorityID.LOW,
+                 action=ids.ActionID.SERVICE,
+                 source=source,
+                 device_type=ids.DeviceID.PROXY,
+                 device_id=0,
+                 data_type=ids.DataTypeID.UINT32,
+                 operation=operation,
+                 payload=(payload,))
+
+
+def subscription_frame(pattern: Optional[FramePattern],
+                       operation: int = ids.OperationID.PROXY.value.SUBSCRIBE,
+                       source: int = ids.BoardID.SOFTWARE) -> Frame:
+    """
+    Builds a control frame for tcp_proxy. Once a client sends at least one SUBSCRIBE,
+    the proxy forwards to it only frames matching one of its patterns.
+    :param pattern: pattern to (un)subscribe, ignored for CLEAR_SUBSCRIPTIONS
+    :param operation: one of ids.OperationID.PROXY
+    :param source: board the client speaks for
+    """
+    pattern = pattern or FramePattern()
+    return _proxy_control_frame(operation, pattern.to_payload(), source)
+
+
+def conflation_frame(enabled: bool, source: int = ids.BoardID.SOFTWARE) -> Frame:
+    """
+    Builds a control frame switching latest-value conflation of LOW priority FEED
+    frames on or off for the sending client.
+    :param enabled: True to keep only the newest queued value per sensor
+    :param source: board the client speaks for
+    """
+    return _proxy_control_frame(ids.OperationID.PROXY.value.CONFLATE, int(enabled), source)
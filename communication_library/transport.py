@@ -6,6 +6,8 @@ class TransportType(IntEnum):
     SERIAL = 0
     TCP = 1
     WEBSOCKET = 2
+    LOOPBACK = 3
+    REPLAY = 4
 
 
 class TransportOptions(ABC):
@@ -0,0 +1,178 @@
+from typing import Callable, Hashable, Optional
+
+from communication_library.frame import Frame
+from communication_library.protocol import GroundStationProtocol
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel: items are kept in slots of resolution seconds, so scheduling is O(1)
+    and advancing only looks at the slots the clock passed. Deadlines further away than one
+    rotation stay in their slot until the round they are due in.
+    """
+
+    def __init__(self, resolution: float = 0.005, slots: int = 512, now: float = 0.0):
+        self.resolution = resolution
+        self._slots = [[] for _ in range(slots)]
+        self._tick = self._to_tick(now)
+
+    def _to_tick(self, at: float) -> int:
+        return int(at / self.resolution)
+
+    def schedule(self, item, at: float):
+        # a deadline already passed fires on the next advance
+        tick = max(self._to_tick(at), self._tick)
+        self._slots[tick % len(self._slots)].append((tick, item))
+
+    def advance(self, now: float) -> list:
+        """
+        Returns the items due up to now, in deadline order.
+        """
+        now_tick = self._to_tick(now)
+        due = []
+        if now_tick < self._tick:
+            return due
+
+        slots = len(self._slots)
+        # past one full rotation every slot has to be looked at once
+        for tick in range(self._tick, min(now_tick, self._tick + slots - 1) + 1):
+            slot = self._slots[tick % slots]
+            if not slot:
+                continue
+            remaining = []
+            for entry in slot:
+                (due if entry[0] <= now_tick else remaining).append(entry)
+            slot[:] = remaining
+        self._tick = now_tick + 1
+        due.sort(key=lambda entry: entry[0])
+        return [item for _, item in due]
+
+
+class FeedTemplate:
+    """
+    One device feed: the frame fields and encoded bytes that never change, how to read the
+    current value, how often to feed it and what was last sent.
+    :param frame: feed frame of the device, its payload is ignored
+    :param read: returns the current value of the device
+    :param interval: seconds between feeds
+    :param state_intervals: intervals overriding interval while the simulation is in a given state
+    :param deadband: changes up to this size are not sent until the next heartbeat
+    """
+    __slots__ = ('fields', 'data_type', 'template', 'read', 'interval', 'state_intervals', 'current_interval',
+                 'deadband', 'deadline', 'generation', 'last_sent_value', 'last_sent_time')
+
+    def __init__(self, frame: Frame, read: Callable[[], object], interval: float,
+                 state_intervals: Optional[dict[Hashable, float]] = None, deadband: float = 0.0):
+        self.fields = {key: value for key, value in frame.as_dict().items() if key != 'payload'}
+        self.data_type = frame.data_type
+        self.template = GroundStationProtocol.encode_template(frame)
+        self.read = read
+        self.interval = interval
+        self.state_intervals = state_intervals or {}
+        self.current_interval = interval
+        self.deadband = deadband
+        self.deadline = None
+        # bumped on every reschedule, wheel entries of older generations are stale
+        self.generation = 0
+        self.last_sent_value = None
+        self.last_sent_time = None
+
+    def interval_in(self, state: Hashable) -> float:
+        return self.state_intervals.get(state, self.interval)
+
+    def should_send(self, value, now: float, heartbeat_interval: float) -> bool:
+        return (self.last_sent_value is None
+                or abs(value - self.last_sent_value) > self.deadband
+                or now - self.last_sent_time >= heartbeat_interval)
+
+    def encode(self, value) -> bytes:
+        return GroundStationProtocol.encode_with_template(self.template, self.data_type, (value,))
+
+    def as_frame(self, value) -> Frame:
+        return Frame(**self.fields, payload=(value,))
+
+
+class FeedPublisher:
+    """
+    Feeds every device on its own cadence, which may depend on the simulation state, through
+    a timer wheel. When a device is due only a value that moved beyond its deadband since it
+    was last sent goes out, or any value once heartbeat_interval has passed since then.
+    A tick is encoded into one buffer, written with a single transport write.
+    :param heartbeat_interval: seconds after which a value is sent even if unchanged, 0 = always
+    """
+
+    def __init__(self, heartbeat_interval: float = 5.0, now: float = 0.0):
+        self.heartbeat_interval = heartbeat_interval
+        self.templates: list[FeedTemplate] = []
+        self.state = None
+        self.sent_values = 0
+        self.suppressed_values = 0
+        self._wheel = TimerWheel(now=now)
+
+    def _schedule(self, template: FeedTemplate, at: float):
+        template.deadline = at
+        template.generation += 1
+        self._wheel.schedule((template, template.generation), at)
+
+    def add(self, template: FeedTemplate, now: float):
+        template.current_interval = template.interval_in(self.state)
+        self.templates.append(template)
+        self._schedule(template, now + template.current_interval)
+
+    def schedule_all(self, at: float):
+        """
+        Moves the next feed of every device to at.
+        """
+        for template in self.templates:
+            self._schedule(template, at)
+
+    def set_state(self, state: Hashable, now: float):
+        """
+        Switches to the intervals of state, devices whose interval changed are fed right away.
+        """
+        self.state = state
+        for template in self.templates:
+            interval = template.interval_in(state)
+            if interval != template.current_interval:
+                template.current_interval = interval
+                self._schedule(template, now)
+
+    def pending(self, now: float) -> list[tuple[FeedTemplate, object]]:
+        """
+        Returns (template, value) of every feed the tick at now has to send, see mark_sent.
+        """
+        pending = []
+        for template, generation in self._wheel.advance(now):
+            if generation != template.generation:
+                # rescheduled since this entry was added
+                continue
+            # keep the cadence, but don't fire a burst after a stall
+            deadline = template.deadline + template.current_interval
+            self._schedule(template, deadline if deadline > now else now + template.current_interval)
+
+            value = template.read()
+            if template.should_send(value, now, self.heartbeat_interval):
+                pending.append((template, value))
+            else:
+                self.suppressed_values += 1
+        return pending
+
+    @staticmethod
+    def encode(pending: list[tuple[FeedTemplate, object]]) -> bytes:
+        return b''.join(template.encode(value) for template, value in pending)
+
+    def mark_sent(self, pending: list[tuple[FeedTemplate, object]], now: float):
+        """
+        Call once the values from pending are out, or retry() if the write failed.
+        """
+        for template, value in pending:
+            template.last_sent_value = value
+            template.last_sent_time = now
+        self.sent_values += len(pending)
+
+    def retry(self, pending: list[tuple[FeedTemplate, object]], now: float):
+        """
+        The write of pending failed, feeds them again on the next tick.
+        """
+        for template, _ in pending:
+            self._schedule(template, now)
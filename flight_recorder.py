@@ -0,0 +1,331 @@
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from enum import IntEnum
+from typing import Iterator, Optional
+
+from communication_library.exceptions import CommunicationError
+from communication_library.protocol import GroundStationProtocol
+from communication_library import ids
+
+from argparse import ArgumentParser
+
+SEGMENT_MAGIC = b'PXREC1\n'
+INDEX_MAGIC = b'PXIDX1\n'
+# monotonic timestamp, direction, client id, raw frame
+RECORD = struct.Struct(f'<dBI{GroundStationProtocol.FRAME_BYTE_LENGTH}s')
+# first timestamp, last timestamp, records, time index entries, keys
+INDEX_HEADER = struct.Struct('<ddIII')
+# timestamp, record number
+TIME_INDEX_ENTRY = struct.Struct('<dI')
+# source, device_type, device_id, record numbers
+KEY_INDEX_HEADER = struct.Struct('<BBBI')
+CLIENTS_FILE = 'clients.jsonl'
+
+
+class FrameDirection(IntEnum):
+    FROM_CLIENT = 0
+    TO_CLIENT = 1
+
+
+def segment_path(directory: str, number: int) -> str:
+    return os.path.join(directory, f'frames_{number:06d}.bin')
+
+
+def index_path(path: str) -> str:
+    return path[:-len('.bin')] + '.idx'
+
+
+class _SegmentIndex:
+    """
+    Built by the writer thread while a segment is written and stored next to it when the segment
+    is closed: a sparse time index and the record numbers of every (source, device_type, device_id).
+    """
+    TIME_INDEX_INTERVAL = 1024
+
+    def __init__(self):
+        self.records = 0
+        self.first_timestamp = 0.0
+        self.last_timestamp = 0.0
+        self.time_index: list[tuple[float, int]] = []
+        self.keys: dict[tuple, array] = {}
+
+    def add(self, timestamp: float, data: bytes):
+        if self.records % self.TIME_INDEX_INTERVAL == 0:
+            self.time_index.append((timestamp, self.records))
+        if not self.records:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+
+        header = GroundStationProtocol.peek_header(data)
+        key = (header.source, header.device_type, header.device_id)
+        numbers = self.keys.get(key)
+        if numbers is None:
+            numbers = self.keys[key] = array('I')
+        numbers.append(self.records)
+        self.records += 1
+
+    def save(self, path: str):
+        with open(path, 'wb') as index_file:
+            index_file.write(INDEX_MAGIC)
+            index_file.write(INDEX_HEADER.pack(self.first_timestamp, self.last_timestamp, self.records,
+                                               len(self.time_index), len(self.keys)))
+            for entry in self.time_index:
+                index_file.write(TIME_INDEX_ENTRY.pack(*entry))
+            for key, numbers in self.keys.items():
+                index_file.write(KEY_INDEX_HEADER.pack(*key, len(numbers)))
+                index_file.write(numbers.tobytes())
+
+    @classmethod
+    def load(cls, path: str) -> Optional['_SegmentIndex']:
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as index_file:
+            data = index_file.read()
+        if not data.startswith(INDEX_MAGIC):
+            return None
+
+        index = cls()
+        offset = len(INDEX_MAGIC)
+        index.first_timestamp, index.last_timestamp, index.records, time_entries, keys = \
+            INDEX_HEADER.unpack_from(data, offset)
+        offset += INDEX_HEADER.size
+        for _ in range(time_entries):
+            index.time_index.append(TIME_INDEX_ENTRY.unpack_from(data, offset))
+            offset += TIME_INDEX_ENTRY.size
+        for _ in range(keys):
+            *key, count = KEY_INDEX_HEADER.unpack_from(data, offset)
+            offset += KEY_INDEX_HEADER.size
+            numbers = array('I')
+            numbers.frombytes(data[offset:offset + count * numbers.itemsize])
+            offset += count * numbers.itemsize
+            index.keys[tuple(key)] = numbers
+        return index
+
+
+class FlightRecorder:
+    """
+    Appends frames passing through the proxy to segmented binary files in a directory.
+    Every proxy session needs an empty directory: client ids and monotonic timestamps
+    are only meaningful within one session, so sessions are never mixed in one recording.
+    The event loop only puts records on a queue, a writer thread packs and writes them,
+    rotates segments and writes the sidecar index of every closed segment.
+    :param directory: where segments, indexes and the client list are stored
+    :param segment_bytes: segment size after which a new file is started
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.recorded_frames = 0
+        os.makedirs(directory, exist_ok=True)
+        if os.listdir(directory):
+            raise FileExistsError(f'Recording directory "{directory}" is not empty, '
+                                  f'it holds the recording of another session')
+        self._segment_number = 0
+        self._segment = None
+        self._index = None
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write_loop, name='flight-recorder', daemon=True)
+        self._thread.start()
+
+    def record_frames(self, direction: FrameDirection, client_id: int, frames: list):
+        self._queue.put((time.monotonic(), direction, client_id, frames))
+
+    def register_client(self, client_id: int, segment: str, name: str):
+        self._queue.put((time.monotonic(), None, client_id, (segment, name)))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _open_segment(self):
+        self._segment_number += 1
+        self._segment = open(segment_path(self.directory, self._segment_number), 'wb')
+        self._segment.write(SEGMENT_MAGIC)
+        self._index = _SegmentIndex()
+
+    def _close_segment(self):
+        if self._segment is None:
+            return
+        self._segment.close()
+        self._index.save(index_path(self._segment.name))
+        self._segment = None
+
+    def _write_batch(self, batch: list):
+        chunks = []
+        for timestamp, direction, client_id, frames in batch:
+            if direction is None:
+                with open(os.path.join(self.directory, CLIENTS_FILE), 'a') as clients_file:
+                    segment, name = frames
+                    clients_file.write(json.dumps({'client_id': client_id, 'segment': segment, 'name': name,
+                                                   'connected_at': timestamp}) + '\n')
+                continue
+            for data in frames:
+                chunks.append(RECORD.pack(timestamp, direction, client_id, data))
+                self._index.add(timestamp, data)
+        self._segment.write(b''.join(chunks))
+        self._segment.flush()
+        self.recorded_frames += len(chunks)
+
+    def _write_loop(self):
+        self._open_segment()
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                batch = batch[:batch.index(None)]
+                running = False
+
+            self._write_batch(batch)
+            if self._segment.tell() >= self.segment_bytes:
+                self._close_segment()
+                self._open_segment()
+        self._close_segment()
+
+
+class RecordingReader:
+    """
+    Memory-maps the segments of a FlightRecorder directory and extracts records by time
+    range and sensor. Segments with a sidecar index are searched through it, segments
+    without one (e.g. the last segment of a proxy that was killed) are scanned.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.segments = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                               if name.startswith('frames_') and name.endswith('.bin'))
+
+    def clients(self) -> dict:
+        path = os.path.join(self.directory, CLIENTS_FILE)
+        if not os.path.isfile(path):
+            return {}
+        with open(path) as clients_file:
+            return {entry['client_id']: entry for entry in map(json.loads, clients_file)}
+
+    @staticmethod
+    def _record(records: mmap.mmap, number: int) -> tuple:
+        return RECORD.unpack_from(records, len(SEGMENT_MAGIC) + number * RECORD.size)
+
+    def _first_record_after(self, records: mmap.mmap, count: int, index: Optional[_SegmentIndex],
+                            start: float) -> int:
+        low, high = 0, count
+        if index is not None and index.time_index:
+            # narrow the binary search down to one interval of the sparse time index
+            position = bisect_left([timestamp for timestamp, _ in index.time_index], start)
+            if position > 0:
+                low = index.time_index[position - 1][1]
+            if position < len(index.time_index):
+                high = index.time_index[position][1]
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(records, middle)[0] < start:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None,
+              key: Optional[tuple] = None, direction: Optional[FrameDirection] = None) -> Iterator[tuple]:
+        """
+        Yields (timestamp, direction, client id, frame bytes) records.
+        :param start: first monotonic timestamp to include
+        :param end: last monotonic timestamp to include
+        :param key: (source, device_type, device_id) of the sensor, None = every frame
+        :param direction: only records of this direction
+        """
+        for path in self.segments:
+            index = _SegmentIndex.load(index_path(path))
+            if index is not None and ((start is not None and index.last_timestamp < start)
+                                      or (end is not None and index.first_timestamp > end)):
+                continue
+
+            with open(path, 'rb') as segment:
+                if os.fstat(segment.fileno()).st_size <= len(SEGMENT_MAGIC):
+                    continue
+                with mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as records:
+                    count = (len(records) - len(SEGMENT_MAGIC)) // RECORD.size
+                    first = 0 if start is None else self._first_record_after(records, count, index, start)
+                    if key is not None and index is not None:
+                        numbers = index.keys.get(key, ())
+                        numbers = numbers[bisect_left(numbers, first):]
+                    else:
+                        numbers = range(first, count)
+
+                    for number in numbers:
+                        record = self._record(records, number)
+                        if end is not None and record[0] > end:
+                            break
+                        if direction is not None and record[1] != direction:
+                            continue
+                        if key is not None and index is None:
+                            header = GroundStationProtocol.peek_header(record[3])
+                            if (header.source, header.device_type, header.device_id) != key:
+                                continue
+                        yield record
+
+
+def _parse_id(value: str, enum) -> int:
+    return int(value) if value.isdigit() else int(enum[value.upper()])
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Query a tcp_proxy.py --record-dir recording.')
+    parser.add_argument('directory')
+    parser.add_argument('--start', default=None, type=float,
+                        help='Seconds since the first record.')
+    parser.add_argument('--end', default=None, type=float,
+                        help='Seconds since the first record.')
+    parser.add_argument('--source', default=None, help='BoardID name or number.')
+    parser.add_argument('--device-type', default=None, help='DeviceID name or number.')
+    parser.add_argument('--device-id', default=None, type=int)
+    parser.add_argument('--direction', default=None, choices=[direction.name.lower() for direction in FrameDirection])
+    parser.add_argument('--raw', default=None,
+                        help='Write the matching raw frames to this file instead of printing them.')
+    cl_args = parser.parse_args()
+
+    reader = RecordingReader(cl_args.directory)
+    first_record = next(reader.query(), None)
+    if first_record is None:
+        print('Recording is empty')
+        raise SystemExit
+    origin = first_record[0]
+
+    key = None
+    if cl_args.source is not None or cl_args.device_type is not None or cl_args.device_id is not None:
+        if None in (cl_args.source, cl_args.device_type, cl_args.device_id):
+            parser.error('--source, --device-type and --device-id select a sensor together')
+        key = (_parse_id(cl_args.source, ids.BoardID), _parse_id(cl_args.device_type, ids.DeviceID),
+               cl_args.device_id)
+
+    records = reader.query(start=None if cl_args.start is None else origin + cl_args.start,
+                           end=None if cl_args.end is None else origin + cl_args.end,
+                           key=key,
+                           direction=None if cl_args.direction is None else FrameDirection[cl_args.direction.upper()])
+
+    if cl_args.raw:
+        with open(cl_args.raw, 'wb') as raw_file:
+            for record in records:
+                raw_file.write(record[3])
+    else:
+        clients = reader.clients()
+        for timestamp, direction, client_id, data in records:
+            client = clients.get(client_id, {})
+            try:
+                frame = GroundStationProtocol.decode(data)
+            except (CommunicationError, ValueError, KeyError, AssertionError):
+                # frames with fields unknown to ids, e.g. rejected proxy control frames
+                frame = f'undecodable frame {data.hex()}'
+            print(f'{timestamp - origin:12.6f} {FrameDirection(direction).name:<11} '
+                  f'{client.get("segment", "?")}#{client_id:<5} {frame}')
@@ -0,0 +1,163 @@
+from communication_library.communication_manager import TransportType
+from communication_library.loopback_transport import LoopbackProxy, LoopbackSettings, LoopbackTransport
+from communication_library.protocol import GroundStationProtocol, FrameStreamParser
+from communication_library.impaired_transport import ImpairedTransport, NetworkImpairment
+
+from software_simulation import SoftwareSimulation
+from tcp_simulator import StandaloneMock, Integrator
+from simulation_clock import VirtualClock
+
+from typing import Callable, Optional
+from argparse import ArgumentParser
+import yaml
+
+
+def _keep_running(mock: StandaloneMock, max_time: Optional[float]) -> bool:
+    return mock.should_run and (max_time is None or mock.clock.now() < max_time)
+
+
+def _delay_first_feed(mock: StandaloneMock, first_feed_delay: Optional[float]):
+    if first_feed_delay is not None:
+        mock.feed_publisher.schedule_all(mock.clock.now() + first_feed_delay)
+
+
+def run_loopback_simulation(hardware_config: str, feed_interval: float,
+                            time_multiplier: float, verbose: bool = False,
+                            first_feed_delay: Optional[float] = None, max_time: Optional[float] = None,
+                            on_step: Optional[Callable[[StandaloneMock], None]] = None,
+                            physics_rate: Optional[float] = None,
+                            integrator: Integrator = Integrator.EULER,
+                            impairment: Optional[NetworkImpairment] = None) -> StandaloneMock:
+    """
+    Runs StandaloneMock and SoftwareSimulation in one interpreter, linked by an in-process
+    LoopbackProxy instead of tcp_proxy.py. Returns the mock after the flight has ended.
+    :param first_feed_delay: simulated seconds until the first feed, by default one feed interval
+    :param max_time: simulated seconds after which the flight is abandoned
+    :param on_step: called with the mock after every loop iteration
+    :param impairment: applied to every frame between the rocket and the ground, delays in simulated seconds
+    """
+    proxy = LoopbackProxy()
+
+    mock = StandaloneMock(None, None,
+                          hardware_config,
+                          feed_interval,
+                          no_print=False,
+                          verbose=verbose,
+                          time_multiplier=time_multiplier,
+                          transport_type=TransportType.LOOPBACK,
+                          transport_settings=LoopbackSettings(proxy, 3001),
+                          physics_rate=physics_rate,
+                          integrator=integrator)
+    if impairment is not None:
+        mock.manager.impair_transport(impairment, mock.clock.now)
+
+    sim = SoftwareSimulation(transport_type=TransportType.LOOPBACK)
+    sim.connect(LoopbackSettings(proxy, 3000))
+    _delay_first_feed(mock, first_feed_delay)
+    sim.begin_oxidizing()
+
+    while _keep_running(mock, max_time):
+        mock.run_once()
+        sim.receive_pending()
+        if on_step is not None:
+            on_step(mock)
+
+    return mock
+
+
+def run_headless_simulation(hardware_config: str, feed_interval: float,
+                            dt: float = StandaloneMock.PHYSICS_INTERVAL, verbose: bool = False,
+                            first_feed_delay: Optional[float] = None, max_time: Optional[float] = None,
+                            on_step: Optional[Callable[[StandaloneMock], None]] = None,
+                            physics_rate: Optional[float] = None,
+                            integrator: Integrator = Integrator.EULER,
+                            impairment: Optional[NetworkImpairment] = None) -> StandaloneMock:
+    """
+    Same flight as run_loopback_simulation, but the mock runs on a VirtualClock and is driven
+    through StandaloneMock.step, so the whole flight takes as long as the CPU needs.
+    Returns the mock after the flight has ended.
+    """
+    proxy = LoopbackProxy()
+
+    mock = StandaloneMock(None, None,
+                          hardware_config,
+                          feed_interval,
+                          no_print=False,
+                          verbose=verbose,
+                          time_multiplier=1.0,
+                          transport_type=None,
+                          clock=VirtualClock(),
+                          physics_rate=physics_rate,
+                          integrator=integrator)
+
+    # the hardware end of the link, frames go through it to and from mock.step
+    wire = LoopbackTransport()
+    wire.open(LoopbackSettings(proxy, 3001))
+    if impairment is not None:
+        # delays are released on the step they fall in, at most dt late
+        wire = ImpairedTransport(wire, impairment, mock.clock.now)
+    parser = FrameStreamParser()
+
+    sim = SoftwareSimulation(transport_type=TransportType.LOOPBACK)
+    sim.connect(LoopbackSettings(proxy, 3000))
+    _delay_first_feed(mock, first_feed_delay)
+    sim.begin_oxidizing()
+
+    while _keep_running(mock, max_time):
+        data = wire.read(wire.read_buffer_size) if wire.read_buffer_size else b''
+        incoming_frames = [GroundStationProtocol.decode(frame) for frame in parser.feed(data)]
+        outgoing_data = mock.step(dt, incoming_frames)
+        if outgoing_data:
+            wire.write(outgoing_data)
+        sim.receive_pending()
+        if on_step is not None:
+            on_step(mock)
+
+    return mock
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--feed-interval', default=1, type=float)
+    parser.add_argument('--hardware-config', default='simulator_config.yaml')
+    parser.add_argument('--verbose', default=False, action='store_true')
+    parser.add_argument('--time-multiplier', default=1.0, type=float,
+                        help='Simulation speed multiplier. 1.0 = real-time, 2.0 = 2x faster, 0.5 = 2x slower.')
+    parser.add_argument('--headless', default=False, action='store_true',
+                        help='Run on a virtual clock as fast as possible, --time-multiplier is ignored.')
+    parser.add_argument('--dt', default=StandaloneMock.PHYSICS_INTERVAL, type=float,
+                        help='Simulated seconds per step with --headless.')
+    parser.add_argument('--physics-rate', default=1 / StandaloneMock.PHYSICS_INTERVAL, type=float,
+                        help='Fixed physics steps per simulated second.')
+    parser.add_argument('--integrator', default=Integrator.EULER.value, choices=[method.value for method in Integrator])
+    parser.add_argument('--impairment-config', default=None,
+                        help='Delay, drop, duplicate, reorder and corrupt frames as in this file, see impairment_config.yaml.')
+    parser.add_argument('--latency-csv', default=None,
+                        help='With --impairment-config, write the latency of every frame to this file.')
+    cl_args = parser.parse_args()
+
+    impairment = None
+    if cl_args.impairment_config:
+        with open(cl_args.impairment_config, 'r') as impairment_file:
+            impairment = NetworkImpairment(yaml.safe_load(impairment_file))
+    if cl_args.headless:
+        run_headless_simulation(cl_args.hardware_config,
+                                cl_args.feed_interval,
+                                cl_args.dt,
+                                cl_args.verbose,
+                                physics_rate=cl_args.physics_rate,
+                                integrator=Integrator(cl_args.integrator),
+                                impairment=impairment)
+    else:
+        run_loopback_simulation(cl_args.hardware_config,
+                                cl_args.feed_interval,
+                                cl_args.time_multiplier,
+                                cl_args.verbose,
+                                physics_rate=cl_args.physics_rate,
+                                integrator=Integrator(cl_args.integrator),
+                                impairment=impairment)
+
+    if impairment is not None:
+        print(impairment.format_report())
+        if cl_args.latency_csv:
+            impairment.write_csv(cl_args.latency_csv)
@@ -0,0 +1,334 @@
+import csv
+import time
+from argparse import ArgumentParser
+from enum import IntEnum
+
+import numpy as np
+
+from tcp_simulator import SimulationState, StandaloneMock
+
+STATE_CODES = {state: code for code, state in enumerate(SimulationState)}
+FUEL_FILLED = STATE_CODES[SimulationState.FUEL_FILLED]
+FLIGHT = STATE_CODES[SimulationState.FLIGHT]
+APOGEE = STATE_CODES[SimulationState.APOGEE]
+PARACHUTE_DEPLOYED = STATE_CODES[SimulationState.PARACHUTE_DEPLOYED]
+FREEFALL = STATE_CODES[SimulationState.FREEFALL]
+EXPLOSION = STATE_CODES[SimulationState.EXPLOSION]
+LANDED = STATE_CODES[SimulationState.LANDED]
+
+GRAVITY = 9.81
+
+# name -> (low, high) of the uniform distribution every run draws its value from
+DEFAULT_PARAMETER_RANGES = {
+    # pressure (bar) at which the controller switches the heater off
+    'heater_cutoff': (50.0, 70.0),
+    # seconds the oxidizer main valve opens after the fuel main valve, negative = before
+    'valve_skew': (-1.5, 1.5),
+    # seconds between the later main valve and the igniter
+    'igniter_delay': (0.0, 1.5),
+    # engine dispersion, multiplies the thrust multiplier derived from the ignition pressure
+    'thrust_scale': (0.8, 1.2),
+    # seconds between apogee and the parachute relay
+    'parachute_delay': (0.0, 15.0),
+}
+
+
+class FlightOutcome(IntEnum):
+    RUNNING = 0
+    LANDED = 1
+    CRASH_LANDING = 2
+    IGNITION_FAILED = 3
+    TANK_OVERPRESSURE = 4
+    VALVE_IMBALANCE = 5
+    ENGINE_FLOODED = 6
+    SINGLE_PROPELLANT = 7
+    IGNITION_OVERPRESSURE = 8
+    PARACHUTE_UNDER_THRUST = 9
+    TIMEOUT = 10
+
+
+class BatchFlight:
+    """
+    N independent rockets advanced together with the rules of StandaloneMock.update_physics,
+    every quantity is an array with one element per rocket and every branch of the scalar
+    if/elif chain is a mask over the rockets in that state.
+    Rockets start in FUEL_FILLED with full tanks, 30 bar and the heater on (the fill phases have
+    nothing to vary). A scripted controller stands in for software_simulation.py: heater off at
+    heater_cutoff, main valves valve_skew apart, the igniter igniter_delay after the later valve
+    and the parachute parachute_delay after apogee.
+    :param parameters: name -> array with one value per rocket, see DEFAULT_PARAMETER_RANGES
+    :param dt: physics step in simulated seconds
+    """
+
+    def __init__(self, parameters: dict[str, np.ndarray], dt: float = StandaloneMock.PHYSICS_INTERVAL):
+        self.parameters = parameters
+        self.runs = len(next(iter(parameters.values())))
+        self.dt = dt
+        self.time = 0.0
+
+        runs = self.runs
+        self.state = np.full(runs, FUEL_FILLED, dtype=np.int8)
+        self.outcome = np.full(runs, FlightOutcome.RUNNING, dtype=np.int8)
+        self.fuel_level = np.full(runs, 100.0)
+        self.oxidizer_level = np.full(runs, 100.0)
+        self.oxidizer_pressure = np.full(runs, 30.0)
+        self.altitude = np.zeros(runs)
+        self.angle = np.full(runs, 2.0)
+        self.velocity = np.zeros(runs)
+        self.max_altitude = np.zeros(runs)
+        self.thrust_multiplier = np.ones(runs)
+        self.heater = np.ones(runs, dtype=bool)
+        self.parachute = np.zeros(runs, dtype=bool)
+        self.parachute_ripped = np.zeros(runs, dtype=bool)
+
+        # scheduled event times, NaN until the controller decides on them
+        self.fuel_main_time = np.full(runs, np.nan)
+        self.oxidizer_main_time = np.full(runs, np.nan)
+        self.igniter_time = np.full(runs, np.nan)
+        self.ignition_pressure = np.full(runs, np.nan)
+        self.liftoff_time = np.full(runs, np.nan)
+        self.apogee_time = np.full(runs, np.nan)
+        self.end_time = np.full(runs, np.nan)
+
+    @classmethod
+    def sample(cls, runs: int, seed: int = 0, ranges: dict = None,
+               dt: float = StandaloneMock.PHYSICS_INTERVAL) -> 'BatchFlight':
+        rng = np.random.default_rng(seed)
+        ranges = {**DEFAULT_PARAMETER_RANGES, **(ranges or {})}
+        return cls({name: rng.uniform(low, high, runs) for name, (low, high) in ranges.items()}, dt)
+
+    def _finish(self, rockets: np.ndarray, state: int, outcome: FlightOutcome):
+        self.state[rockets] = state
+        self.outcome[rockets] = outcome
+        self.end_time[rockets] = self.time
+
+    def _ballistic(self, rockets: np.ndarray):
+        self.velocity = np.where(rockets, self.velocity - GRAVITY * self.dt, self.velocity)
+        self.altitude = np.where(rockets, self.altitude + self.velocity * self.dt, self.altitude)
+
+    def _update_pad(self, rockets: np.ndarray):
+        dt = self.dt
+        heating = rockets & self.heater
+        self.oxidizer_pressure = np.where(heating, np.minimum(90.0, self.oxidizer_pressure + dt * 2.5),
+                                          np.where(rockets, np.maximum(30.0, self.oxidizer_pressure - dt * 1.0),
+                                                   self.oxidizer_pressure))
+        overpressure = heating & (self.oxidizer_pressure >= 90.0)
+        self._finish(overpressure, EXPLOSION, FlightOutcome.TANK_OVERPRESSURE)
+
+        # the checks of the scalar chain in order, every rocket stops at the first one it fails
+        pending = (rockets & ~overpressure & (self.fuel_main_time <= self.time)
+                   & (self.oxidizer_main_time <= self.time) & (self.igniter_time <= self.time))
+        first_valve = np.fmin(self.fuel_main_time, self.oxidizer_main_time)
+        checks = (
+            (np.abs(self.fuel_main_time - self.oxidizer_main_time) > 1.0, FlightOutcome.VALVE_IMBALANCE),
+            ((np.abs(self.igniter_time - self.fuel_main_time) > 1.0)
+             | (np.abs(self.igniter_time - self.oxidizer_main_time) > 1.0), FlightOutcome.ENGINE_FLOODED),
+            (self.igniter_time < first_valve, FlightOutcome.SINGLE_PROPELLANT),
+            (self.oxidizer_pressure > 65.0, FlightOutcome.IGNITION_OVERPRESSURE),
+        )
+        for failed, outcome in checks[:3]:
+            self._finish(pending & failed, EXPLOSION, outcome)
+            pending &= ~failed
+
+        # the igniter is reset and the controller does not try again, the rocket stays on the pad
+        too_low = pending & (self.oxidizer_pressure < 40.0)
+        self._finish(too_low, FUEL_FILLED, FlightOutcome.IGNITION_FAILED)
+        self.igniter_time[too_low] = np.nan
+        pending &= ~too_low
+
+        failed, outcome = checks[3]
+        self._finish(pending & failed, EXPLOSION, outcome)
+        pending &= ~failed
+
+        pressure = self.oxidizer_pressure
+        deviation = np.minimum(np.abs(pressure - 55.0), np.abs(pressure - 65.0))
+        multiplier = np.where(pressure >= 55.0, 1.0, np.maximum(0.5, 1.0 - (deviation / 15.0) * 0.5))
+        self.thrust_multiplier = np.where(pending, multiplier, self.thrust_multiplier)
+        self.ignition_pressure[pending] = pressure[pending]
+        self.liftoff_time[pending] = self.time
+        self.state[pending] = FLIGHT
+
+    def _update_flight(self, rockets: np.ndarray):
+        dt = self.dt
+        burning = rockets & (self.fuel_level > 0)
+        coasting = rockets & ~burning
+
+        self._finish(burning & self.parachute, EXPLOSION, FlightOutcome.PARACHUTE_UNDER_THRUST)
+        burning &= ~self.parachute
+        self.fuel_level = np.where(burning, np.maximum(0.0, self.fuel_level - dt * 8.0), self.fuel_level)
+        self.oxidizer_level = np.where(burning, np.maximum(0.0, self.oxidizer_level - dt * 8.0), self.oxidizer_level)
+        self.oxidizer_pressure = np.where(burning, np.maximum(30.0, self.oxidizer_pressure - dt * 3.0),
+                                          self.oxidizer_pressure)
+        thrust = 15.0 * self.thrust_multiplier * self.parameters['thrust_scale']
+        self.velocity = np.where(burning, self.velocity + (thrust - GRAVITY) * dt, self.velocity)
+        self.altitude = np.where(burning, self.altitude + self.velocity * dt, self.altitude)
+        self.angle = np.where(burning, np.minimum(30.0, self.angle + dt * 2.0), self.angle)
+
+        ripped = coasting & self.parachute & (self.velocity > 30.0)
+        self.parachute_ripped |= ripped
+        deployed = coasting & self.parachute & ~ripped
+        self.state[deployed] = PARACHUTE_DEPLOYED
+        coasting &= ~deployed
+
+        self._ballistic(coasting)
+        self.angle = np.where(coasting, np.minimum(90.0, self.angle + dt * 15.0), self.angle)
+        self.max_altitude = np.where(coasting, np.maximum(self.max_altitude, self.altitude), self.max_altitude)
+        apogee = coasting & (self.velocity <= 0) & np.isnan(self.apogee_time)
+        self.apogee_time[apogee] = self.time
+        self.state[apogee] = APOGEE
+
+    def _update_apogee(self, rockets: np.ndarray):
+        self.angle = np.where(rockets, np.minimum(180.0, self.angle + self.dt * 20.0), self.angle)
+        deployed = rockets & self.parachute
+        self.state[deployed] = PARACHUTE_DEPLOYED
+        freefall = rockets & ~deployed & (self.time - self.apogee_time > 10.0)
+        self.state[freefall] = FREEFALL
+        self._ballistic(rockets & ~deployed & ~freefall)
+
+    def _update_parachute_deployed(self, rockets: np.ndarray):
+        dt = self.dt
+        self.velocity = np.where(rockets, np.maximum(-5.0, self.velocity - GRAVITY * dt), self.velocity)
+        self.altitude = np.where(rockets, self.altitude + self.velocity * dt, self.altitude)
+        self.angle = np.where(rockets, np.sign(self.angle) * np.maximum(0.0, np.abs(self.angle) - dt * 30.0),
+                              self.angle)
+        self._land(rockets, FlightOutcome.LANDED)
+
+    def _update_freefall(self, rockets: np.ndarray):
+        self._ballistic(rockets)
+        self.angle = np.where(rockets, np.minimum(180.0, self.angle + self.dt * 20.0), self.angle)
+        ripped = rockets & self.parachute & (np.abs(self.velocity) > 30.0)
+        self.parachute_ripped |= ripped
+        self.state[rockets & self.parachute & ~ripped] = PARACHUTE_DEPLOYED
+        self._land(rockets, FlightOutcome.CRASH_LANDING)
+
+    def _land(self, rockets: np.ndarray, outcome: FlightOutcome):
+        landed = rockets & (self.altitude <= 0)
+        self.altitude[landed] = 0.0
+        self.velocity[landed] = 0.0
+        self._finish(landed, LANDED, outcome)
+
+    def _run_controller(self):
+        running = self.outcome == FlightOutcome.RUNNING
+        self.parachute |= self.apogee_time + self.parameters['parachute_delay'] <= self.time
+
+        heater_off = running & self.heater & (self.oxidizer_pressure >= self.parameters['heater_cutoff'])
+        self.heater &= ~heater_off
+        skew = self.parameters['valve_skew']
+        self.fuel_main_time = np.where(heater_off, self.time + np.maximum(-skew, 0.0), self.fuel_main_time)
+        self.oxidizer_main_time = np.where(heater_off, self.time + np.maximum(skew, 0.0), self.oxidizer_main_time)
+        self.igniter_time = np.where(heater_off, self.time + np.abs(skew) + self.parameters['igniter_delay'],
+                                     self.igniter_time)
+
+    def step(self):
+        self.time += self.dt
+        # like the scalar chain, a rocket is only updated by the branch of the state it started the tick in
+        running = self.outcome == FlightOutcome.RUNNING
+        state = self.state.copy()
+        self._update_pad(running & (state == FUEL_FILLED))
+        self._update_flight(running & (state == FLIGHT))
+        self._update_apogee(running & (state == APOGEE))
+        self._update_parachute_deployed(running & (state == PARACHUTE_DEPLOYED))
+        self._update_freefall(running & (state == FREEFALL))
+        self._run_controller()
+
+    def run(self, max_time: float = 600.0) -> int:
+        """
+        Steps until every rocket has an outcome, rockets still flying after max_time simulated
+        seconds end as TIMEOUT. Returns the number of steps.
+        """
+        steps = 0
+        while self.time < max_time and (self.outcome == FlightOutcome.RUNNING).any():
+            self.step()
+            steps += 1
+        timed_out = self.outcome == FlightOutcome.RUNNING
+        self.outcome[timed_out] = FlightOutcome.TIMEOUT
+        self.end_time[timed_out] = self.time
+        return steps
+
+    def results(self) -> dict[str, np.ndarray]:
+        return {**self.parameters,
+                'outcome': self.outcome,
+                'max_altitude': self.max_altitude,
+                'ignition_pressure': self.ignition_pressure,
+                'thrust_multiplier': self.thrust_multiplier,
+                'parachute_ripped': self.parachute_ripped,
+                'liftoff_time': self.liftoff_time,
+                'apogee_time': self.apogee_time,
+                'end_time': self.end_time}
+
+
+def print_outcomes(outcome: np.ndarray):
+    print(f'{"outcome":<24}{"runs":>8}{"%":>8}')
+    for value in FlightOutcome:
+        count = int(np.count_nonzero(outcome == value))
+        if count:
+            print(f'{value.name:<24}{count:>8}{100.0 * count / len(outcome):>8.1f}')
+
+
+def print_apogee(max_altitude: np.ndarray, bins: int = 10):
+    if not len(max_altitude):
+        print('no rocket reached apogee')
+        return
+    percentiles = np.percentile(max_altitude, [5, 50, 95])
+    print(f'apogee of {len(max_altitude)} rockets: mean={max_altitude.mean():.1f}m '
+          f'p5={percentiles[0]:.1f}m p50={percentiles[1]:.1f}m p95={percentiles[2]:.1f}m '
+          f'max={max_altitude.max():.1f}m')
+    counts, edges = np.histogram(max_altitude, bins=bins)
+    for count, low, high in zip(counts, edges, edges[1:]):
+        print(f'{low:8.1f} - {high:8.1f} m {count:>8} {"#" * int(50 * count / counts.max())}')
+
+
+def print_sensitivity(results: dict[str, np.ndarray], bins: int = 5):
+    """
+    For every varied parameter, splits the runs into quantile bins and shows how many of
+    them landed safely and their median apogee.
+    """
+    landed = results['outcome'] == FlightOutcome.LANDED
+    for name in DEFAULT_PARAMETER_RANGES:
+        values = results[name]
+        edges = np.quantile(values, np.linspace(0.0, 1.0, bins + 1))
+        print(f'{name}:')
+        for low, high in zip(edges, edges[1:]):
+            in_bin = (values >= low) & (values <= high)
+            flew = in_bin & (results['max_altitude'] > 0)
+            apogee = f'{np.median(results["max_altitude"][flew]):.1f}m' if flew.any() else '-'
+            print(f'  {low:8.2f} - {high:8.2f}  landed {100.0 * landed[in_bin].mean():5.1f}%  '
+                  f'median apogee {apogee}')
+
+
+def write_csv(path: str, results: dict[str, np.ndarray]):
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(results.keys())
+        for row in zip(*results.values()):
+            writer.writerow(FlightOutcome(value).name if name == 'outcome' else value
+                            for name, value in zip(results, row))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Monte Carlo of the StandaloneMock flight rules over many rockets at once.')
+    parser.add_argument('--runs', default=10000, type=int)
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--dt', default=StandaloneMock.PHYSICS_INTERVAL, type=float,
+                        help='Physics step in simulated seconds.')
+    parser.add_argument('--max-time', default=600.0, type=float,
+                        help='Simulated seconds after which a rocket still flying ends as TIMEOUT.')
+    for name, (low, high) in DEFAULT_PARAMETER_RANGES.items():
+        parser.add_argument(f'--{name.replace("_", "-")}', default=(low, high), type=float, nargs=2,
+                            metavar=('LOW', 'HIGH'), help=f'Uniform range, default {low} {high}.')
+    parser.add_argument('--csv', default=None, help='Write the parameters and results of every run to this file.')
+    cl_args = parser.parse_args()
+
+    ranges = {name: tuple(getattr(cl_args, name)) for name in DEFAULT_PARAMETER_RANGES}
+    flights = BatchFlight.sample(cl_args.runs, cl_args.seed, ranges, cl_args.dt)
+    start = time.perf_counter()
+    steps = flights.run(cl_args.max_time)
+    elapsed = time.perf_counter() - start
+    print(f'{cl_args.runs} rockets, {steps} steps ({flights.time:.1f} simulated s) in {elapsed:.2f}s')
+
+    results = flights.results()
+    print_outcomes(results['outcome'])
+    print_apogee(results['max_altitude'][results['max_altitude'] > 0])
+    print_sensitivity(results)
+    if cl_args.csv:
+        write_csv(cl_args.csv, results)
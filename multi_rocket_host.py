@@ -0,0 +1,193 @@
+import logging
+import sys
+import time
+from argparse import ArgumentParser
+from typing import Optional
+
+from communication_library import ids
+from communication_library.communication_manager import CommunicationManager, TransportType
+from communication_library.exceptions import TransportTimeoutError, UnregisteredCallbackError
+from communication_library.frame import Frame
+from communication_library.protocol import GroundStationProtocol
+from communication_library.tcp_transport import TcpSettings
+from communication_library.transport import TransportSettings
+
+from simulation_clock import RealTimeClock
+from tcp_simulator import StandaloneMock
+
+# every board a rocket can be, ROCKET up to LAST_BOARD
+ROCKET_BOARDS = list(range(ids.BoardID.ROCKET, ids.BoardID.LAST_BOARD + 1))
+
+
+class SharedLoopClock(RealTimeClock):
+    """
+    Real time clock of rockets sharing one loop, sleeping would stall all of them.
+    """
+
+    def sleep(self, seconds: float):
+        pass
+
+
+class MultiRocketHost:
+    """
+    Hosts many StandaloneMocks in one process, to load-test the proxy and the ground software.
+    Every rocket is a distinct board with its own config. They share one loop and one connection:
+    incoming frames are routed to rockets by destination (BROADCAST to all), and the ACKs and
+    feeds of all rockets in a loop iteration go out in a single write.
+    :param hardware_configs: config of every rocket, the first one on board ROCKET
+    :param mock_kwargs: passed on to every StandaloneMock, e.g. physics_rate or feed_deadband
+    """
+
+    def __init__(self, hardware_configs: list[str], feed_interval: float,
+                 transport_type: TransportType = TransportType.TCP,
+                 transport_settings: TransportSettings = None,
+                 time_multiplier: float = 1.0,
+                 verbose: bool = False,
+                 **mock_kwargs):
+        if len(hardware_configs) > len(ROCKET_BOARDS):
+            raise ValueError(f'At most {len(ROCKET_BOARDS)} rockets fit in boards '
+                             f'{ids.BoardID.ROCKET.name}..{ids.BoardID.LAST_BOARD.name}')
+
+        self.setup_loggers()
+        self._logger = logging.getLogger("main.host")
+        self.manager = CommunicationManager()
+        self.manager.change_transport_type(transport_type)
+        self.manager.connect(transport_settings)
+
+        self.clock = SharedLoopClock(time_multiplier)
+        self.rockets = {board: StandaloneMock(None, None, hardware_config, feed_interval,
+                                              no_print=True, verbose=verbose,
+                                              time_multiplier=time_multiplier,
+                                              transport_type=None, clock=self.clock,
+                                              board=board, **mock_kwargs)
+                        for board, hardware_config in zip(ROCKET_BOARDS, hardware_configs)}
+        self.verbose = verbose
+        self.frames_received = 0
+        self.unrouted_frames = 0
+        self.bytes_sent = 0
+        self.writes = 0
+        self.failed_writes = 0
+        self.last_status_print = time.perf_counter()
+
+    @staticmethod
+    def setup_loggers():
+        # the board is part of the log line, StandaloneMock.setup_loggers leaves a set up logger alone
+        logger_main = logging.getLogger("main")
+        logger_main.setLevel(logging.DEBUG)
+        if logger_main.handlers:
+            return
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter(fmt='[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s'))
+        logger_main.addHandler(console_handler)
+
+    @property
+    def running_rockets(self) -> list[StandaloneMock]:
+        return [mock for mock in self.rockets.values() if mock.should_run]
+
+    def receive_frames(self) -> list[Frame]:
+        """
+        Every frame already waiting on the connection.
+        """
+        frames = []
+        while True:
+            try:
+                frames.append(self.manager.receive())
+            except TransportTimeoutError:
+                return frames
+            except UnregisteredCallbackError as e:
+                frames.append(e.frame)
+
+    def route_frame(self, frame: Frame) -> list[Frame]:
+        if frame.destination == ids.BoardID.BROADCAST:
+            rockets = self.running_rockets
+        else:
+            mock = self.rockets.get(frame.destination)
+            rockets = [mock] if mock is not None and mock.should_run else []
+        if not rockets:
+            self.unrouted_frames += 1
+
+        responses = []
+        for mock in rockets:
+            responses += mock.handle_frame(frame)
+        return responses
+
+    def run_once(self):
+        responses = []
+        for frame in self.receive_frames():
+            self.frames_received += 1
+            responses += self.route_frame(frame)
+
+        now = self.clock.now()
+        feeds = []
+        for mock in self.running_rockets:
+            mock.update_physics_if_due()
+            if mock.should_run:
+                feeds.append((mock.feed_publisher, mock.pending_feeds(now)))
+
+        data = b''.join(GroundStationProtocol.encode(frame) for frame in responses)
+        data += b''.join(publisher.encode(pending) for publisher, pending in feeds)
+        if data:
+            try:
+                self.manager.send_encoded(data)
+            except TransportTimeoutError:
+                self.failed_writes += 1
+                for publisher, pending in feeds:
+                    publisher.retry(pending, now)
+                return
+            self.writes += 1
+            self.bytes_sent += len(data)
+            for publisher, pending in feeds:
+                publisher.mark_sent(pending, now)
+
+        current_time = time.perf_counter()
+        if not self.verbose and current_time > self.last_status_print + 1.0:
+            self.print_status()
+            self.last_status_print = current_time
+
+    def print_status(self):
+        states = {}
+        for mock in self.rockets.values():
+            states[mock.state.value] = states.get(mock.state.value, 0) + 1
+        feeds = sum(mock.feed_publisher.sent_values for mock in self.rockets.values())
+        self._logger.info(f'{len(self.running_rockets)}/{len(self.rockets)} rockets running, '
+                          f'{self.frames_received} frames received ({self.unrouted_frames} unrouted), '
+                          f'{feeds} feeds in {self.writes} writes ({self.failed_writes} failed), '
+                          f'{self.bytes_sent} bytes sent | '
+                          + ', '.join(f'{state}: {count}' for state, count in states.items()))
+
+    def run(self, max_time: Optional[float] = None):
+        while self.running_rockets and (max_time is None or self.clock.now() < max_time):
+            self.run_once()
+        self.print_status()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='Simulates many rockets, each on its own board, over one connection.')
+    parser.add_argument('--proxy-address', default="127.0.0.1")
+    parser.add_argument('--proxy-port', default=3001, type=int)
+    parser.add_argument('--rockets', default=len(ROCKET_BOARDS), type=int,
+                        help=f'Number of rockets, boards from ROCKET up to LAST_BOARD (at most {len(ROCKET_BOARDS)}).')
+    parser.add_argument('--hardware-configs', default=['simulator_config.yaml'], nargs='+',
+                        help='Configs given to the rockets in turn.')
+    parser.add_argument('--feed-interval', default=1, type=float)
+    parser.add_argument('--time-multiplier', default=1.0, type=float)
+    parser.add_argument('--physics-rate', default=1 / StandaloneMock.PHYSICS_INTERVAL, type=float)
+    parser.add_argument('--feed-deadband', default=0.0, type=float)
+    parser.add_argument('--feed-heartbeat', default=5.0, type=float)
+    parser.add_argument('--max-time', default=None, type=float, help='Simulated seconds after which the host stops.')
+    parser.add_argument('--verbose', default=False, action='store_true',
+                        help='Print all frames sent/received. If disabled, prints a summary every second.')
+    cl_args = parser.parse_args()
+
+    configs = [cl_args.hardware_configs[i % len(cl_args.hardware_configs)] for i in range(cl_args.rockets)]
+    host = MultiRocketHost(configs, cl_args.feed_interval,
+                           transport_settings=TcpSettings(address=cl_args.proxy_address, port=cl_args.proxy_port),
+                           time_multiplier=cl_args.time_multiplier,
+                           verbose=cl_args.verbose,
+                           physics_rate=cl_args.physics_rate,
+                           feed_deadband=cl_args.feed_deadband,
+                           feed_heartbeat=cl_args.feed_heartbeat)
+    try:
+        host.run(cl_args.max_time)
+    except KeyboardInterrupt:
+        host.print_status()
@@ -0,0 +1,65 @@
+import queue
+import threading
+from typing import TYPE_CHECKING
+
+from communication_library.frame import Frame
+
+if TYPE_CHECKING:
+    from tcp_simulator import StandaloneMock
+
+
+# seconds a thread may hold the GIL while another waits for it, for sys.setswitchinterval. The
+# I/O loop never blocks and would otherwise delay a due physics step by up to the default 5 ms
+GIL_SWITCH_INTERVAL = 0.0002
+
+
+class PhysicsThread(threading.Thread):
+    """
+    Runs the physics and frame handling of a real time StandaloneMock on its own thread, so
+    I/O bursts, slow log writes and the pauses after landing don't delay the physics steps.
+    Received frames come in and their ACKs go out through queues. After every tick and every
+    handled command the sensors and servo positions are published as copies swapped in with
+    one assignment each (see publish_feed_values), so a feed value is never half updated.
+    The GIL switch interval is process wide, so the thread leaves it alone: tcp_simulator.py
+    lowers it to GIL_SWITCH_INTERVAL at startup, embedding programs decide for themselves.
+    """
+
+    def __init__(self, mock: 'StandaloneMock'):
+        super().__init__(name='physics', daemon=True)
+        self.mock = mock
+        self.commands = queue.SimpleQueue()
+        self.responses = queue.SimpleQueue()
+
+    def take_responses(self) -> list[Frame]:
+        responses = []
+        while True:
+            try:
+                responses.append(self.responses.get_nowait())
+            except queue.Empty:
+                return responses
+
+    def _handle(self, frame: Frame):
+        responses = self.mock.handle_frame(frame)
+        self.mock.publish_feed_values()
+        for response in responses:
+            self.responses.put(response)
+
+    def run(self):
+        mock = self.mock
+        mock.publish_feed_values()
+        while mock.should_run:
+            if mock.update_physics_if_due():
+                mock.publish_feed_values()
+
+            # wait for the next step, a command wakes the thread right away
+            remaining = mock.last_physics_update + mock.physics_interval - mock.clock.now()
+            try:
+                frame = self.commands.get(timeout=max(0.0, remaining) / mock.time_multiplier)
+            except queue.Empty:
+                continue
+            self._handle(frame)
+            while True:
+                try:
+                    self._handle(self.commands.get_nowait())
+                except queue.Empty:
+                    break
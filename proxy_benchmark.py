@@ -0,0 +1,313 @@
+import asyncio
+import logging
+import multiprocessing
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from typing import Callable, Optional
+
+from communication_library.frame import Frame
+from communication_library.protocol import GroundStationProtocol
+from communication_library import ids
+
+from tcp_proxy import Proxy, Router, SchedulingPolicy
+
+# client SO_SNDBUF of the priority benchmark, so the backlog stays in the proxy's priority queues
+PRIORITY_SEND_BUFFER = 2048
+
+
+def make_feed_frame(device_id: int = 2, value: float = 0.0,
+                    priority: ids.PriorityID = ids.PriorityID.LOW) -> bytes:
+    frame = Frame(destination=ids.BoardID.SOFTWARE,
+                  priority=priority,
+                  action=ids.ActionID.FEED,
+                  source=ids.BoardID.ROCKET,
+                  device_type=ids.DeviceID.SENSOR,
+                  device_id=device_id,
+                  data_type=ids.DataTypeID.FLOAT,
+                  operation=ids.OperationID.SENSOR.value.READ,
+                  payload=(value,))
+    return GroundStationProtocol.encode(frame)
+
+
+async def start_proxies(address: str, port: int,
+                        configure: Optional[Callable[[Proxy], None]] = None) -> tuple[list[Proxy], list[asyncio.Task]]:
+    """
+    Starts the same software/hardware proxy pair as tcp_proxy.py inside the running loop.
+    Returns the proxies and their serve tasks, for stop_proxies.
+    :param configure: called with each proxy before it starts serving
+    """
+    router = Router.from_config(Router.default_config(port), address)
+    for proxy in router.segments:
+        logging.getLogger(proxy.name).setLevel(logging.WARNING)
+        if configure is not None:
+            configure(proxy)
+
+    tasks = [asyncio.create_task(proxy.serve()) for proxy in router.segments]
+    await asyncio.sleep(0.2)
+    return router.segments, tasks
+
+
+async def stop_proxies(proxies: list[Proxy], tasks: list[asyncio.Task]):
+    """
+    Closes the servers and clients of proxies from start_proxies and waits for all their tasks,
+    so nothing of them is left running into the next measurement.
+    """
+    await cancel_tasks(tasks)
+    for proxy in proxies:
+        await proxy.close()
+
+
+async def cancel_tasks(tasks: list[asyncio.Task]):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def close_writers(*writers: asyncio.StreamWriter):
+    for writer in writers:
+        writer.close()
+    for writer in writers:
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def measure_idle_cpu(duration: float) -> float:
+    """
+    Returns the CPU time used by this process while the proxies sit idle, as % of one core.
+    """
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    await asyncio.sleep(duration)
+    return 100.0 * (time.process_time() - cpu_start) / (time.perf_counter() - wall_start)
+
+
+async def measure_latency(address: str, port: int, frames: int) -> list[float]:
+    """
+    Sends feed frames one at a time from a hardware client and times their arrival
+    at a software client. Returns latencies in microseconds.
+    """
+    _, hardware_writer = await asyncio.open_connection(address, port + 1)
+    software_reader, software_writer = await asyncio.open_connection(address, port)
+    await asyncio.sleep(0.1)
+
+    data = make_feed_frame()
+    latencies = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        hardware_writer.write(data)
+        await software_reader.readexactly(len(data))
+        latencies.append((time.perf_counter() - start) * 1e6)
+
+    await close_writers(hardware_writer, software_writer)
+    return latencies
+
+
+async def measure_throughput(address: str, port: int, frames: int, software_clients: int = 1) -> float:
+    """
+    Writes a burst of feed frames from a hardware client as fast as possible and
+    returns how many frames per second reached every one of the software clients.
+    """
+    _, hardware_writer = await asyncio.open_connection(address, port + 1)
+    software_clients = [await asyncio.open_connection(address, port) for _ in range(software_clients)]
+    await asyncio.sleep(0.1)
+
+    data = make_feed_frame()
+
+    async def send_burst():
+        for _ in range(frames // 100):
+            hardware_writer.write(data * 100)
+            await hardware_writer.drain()
+
+    start = time.perf_counter()
+    sender = asyncio.create_task(send_burst())
+    await asyncio.gather(*(reader.readexactly(len(data) * (frames // 100) * 100) for reader, _ in software_clients))
+    elapsed = time.perf_counter() - start
+    await sender
+
+    await close_writers(hardware_writer, *(writer for _, writer in software_clients))
+    return (frames // 100) * 100 / elapsed
+
+
+async def measure_high_priority_wait(address: str, port: int, duration: float,
+                                     load_rate: int = 20000, read_rate: int = 5000) -> list[float]:
+    """
+    Saturates a slow software client with load_rate LOW priority feeds/s from a hardware
+    client and times HIGH priority frames sent every 10 ms through that backlog. The software
+    client reads at most read_rate frames/s through a small socket buffer, so the backlog
+    builds up in the proxy's client queue. Returns HIGH priority latencies in microseconds.
+    """
+    _, hardware_writer = await asyncio.open_connection(address, port + 1)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 2048)
+    sock.connect((address, port))
+    # a small stream limit keeps the reader from buffering the backlog in this process
+    software_reader, software_writer = await asyncio.open_connection(
+        sock=sock, limit=GroundStationProtocol.FRAME_BYTE_LENGTH * 100)
+    await asyncio.sleep(0.1)
+
+    low_data = make_feed_frame(device_id=2) * 100
+    sent_at = []
+    latencies = []
+    done = asyncio.Event()
+
+    async def send_load():
+        next_high = time.perf_counter()
+        while not done.is_set():
+            if time.perf_counter() >= next_high:
+                hardware_writer.write(make_feed_frame(device_id=3, value=len(sent_at), priority=ids.PriorityID.HIGH))
+                sent_at.append(time.perf_counter())
+                next_high += 0.01
+            hardware_writer.write(low_data)
+            await hardware_writer.drain()
+            await asyncio.sleep(100 / load_rate)
+
+    async def read_slowly():
+        frame_length = GroundStationProtocol.FRAME_BYTE_LENGTH
+        frames_per_read = 100
+        while not done.is_set():
+            chunk = await software_reader.readexactly(frame_length * frames_per_read)
+            received = time.perf_counter()
+            for offset in range(0, len(chunk), frame_length):
+                data = chunk[offset:offset + frame_length]
+                if GroundStationProtocol.peek_header(data).priority == ids.PriorityID.HIGH:
+                    index = int(GroundStationProtocol.decode(data).payload[0])
+                    latencies.append((received - sent_at[index]) * 1e6)
+            await asyncio.sleep(frames_per_read / read_rate)
+
+    tasks = [asyncio.create_task(send_load()), asyncio.create_task(read_slowly())]
+    await asyncio.sleep(duration)
+    done.set()
+    await cancel_tasks(tasks)
+
+    await close_writers(hardware_writer, software_writer)
+    return latencies
+
+
+async def generate_load(address: str, port: int, duration: float, software_clients: int) -> int:
+    """
+    One hardware client writing feed bursts for duration seconds and software_clients
+    clients counting what they receive. Returns the number of frames received.
+    """
+    _, hardware_writer = await asyncio.open_connection(address, port + 1)
+    readers = [await asyncio.open_connection(address, port) for _ in range(software_clients)]
+    await asyncio.sleep(0.5)
+
+    data = make_feed_frame() * 100
+    received = 0
+    done = asyncio.Event()
+
+    async def send_load():
+        while not done.is_set():
+            hardware_writer.write(data)
+            await hardware_writer.drain()
+
+    async def count(reader):
+        nonlocal received
+        while True:
+            received += len(await reader.read(1 << 16))
+
+    tasks = [asyncio.create_task(send_load())] + [asyncio.create_task(count(reader)) for reader, _ in readers]
+    await asyncio.sleep(duration)
+    done.set()
+    await cancel_tasks(tasks)
+    await close_writers(hardware_writer, *(writer for _, writer in readers))
+    return received // GroundStationProtocol.FRAME_BYTE_LENGTH
+
+
+def _load_process(address, port, duration, software_clients, results):
+    results.put(asyncio.run(generate_load(address, port, duration, software_clients)))
+
+
+def measure_worker_scaling(address: str, port: int, workers: int, load_processes: int,
+                           software_clients: int, duration: float) -> float:
+    """
+    Runs tcp_proxy.py with the given number of worker processes and loads it from
+    load_processes processes, each with one hardware and software_clients software clients.
+    Returns frames/s delivered to all software clients together.
+    """
+    proxy = subprocess.Popen([sys.executable, 'tcp_proxy.py', '--tcp-address', address, '--tcp-port', str(port),
+                              '--workers', str(workers)], stdout=subprocess.DEVNULL)
+    time.sleep(1.0)
+    results = multiprocessing.Queue()
+    loaders = [multiprocessing.Process(target=_load_process,
+                                       args=(address, port, duration, software_clients, results))
+               for _ in range(load_processes)]
+    for loader in loaders:
+        loader.start()
+    received = sum(results.get() for _ in loaders)
+    for loader in loaders:
+        loader.join()
+    proxy.terminate()
+    proxy.wait()
+    return received / duration
+
+
+def print_latency(name: str, latencies: list[float]):
+    latencies = sorted(latencies)
+    print(f'{name}: n={len(latencies)} '
+          f'p50={statistics.median(latencies):.0f}us '
+          f'p99={latencies[int(len(latencies) * 0.99) - 1]:.0f}us '
+          f'max={latencies[-1]:.0f}us')
+
+
+async def run_benchmark(cl_args):
+    proxies, tasks = await start_proxies(cl_args.tcp_address, cl_args.tcp_port)
+
+    idle_cpu = await measure_idle_cpu(cl_args.idle_seconds)
+    print(f'idle cpu: {idle_cpu:.1f}% of one core over {cl_args.idle_seconds}s')
+
+    latencies = await measure_latency(cl_args.tcp_address, cl_args.tcp_port, cl_args.frames)
+    print_latency('hardware -> software latency', latencies)
+
+    throughput = await measure_throughput(cl_args.tcp_address, cl_args.tcp_port, cl_args.burst_frames)
+    print(f'hardware -> software throughput: {throughput:.0f} frames/s')
+
+    throughput = await measure_throughput(cl_args.tcp_address, cl_args.tcp_port, cl_args.burst_frames // 8, 8)
+    print(f'hardware -> 8 software clients throughput: {throughput:.0f} frames/s per client')
+
+    await stop_proxies(proxies, tasks)
+
+    # every scheduling policy gets fresh proxies so the previous backlog does not leak in
+    for index, policy in enumerate(SchedulingPolicy):
+        port = cl_args.tcp_port + 2 * (index + 1)
+        proxies, tasks = await start_proxies(cl_args.tcp_address, port,
+                                             lambda proxy: (proxy.set_client_scheduling(policy),
+                                                            proxy.set_client_send_buffer(PRIORITY_SEND_BUFFER)))
+        latencies = await measure_high_priority_wait(cl_args.tcp_address, port, cl_args.load_seconds)
+        if latencies:
+            print_latency(f'HIGH priority latency under LOW load ({policy.value})', latencies)
+        else:
+            print(f'HIGH priority latency under LOW load ({policy.value}): no frame delivered')
+        await stop_proxies(proxies, tasks)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--tcp-address', default="127.0.0.1")
+    parser.add_argument('--tcp-port', default=4000, type=int)
+    parser.add_argument('--idle-seconds', default=2.0, type=float)
+    parser.add_argument('--frames', default=2000, type=int)
+    parser.add_argument('--burst-frames', default=50000, type=int)
+    parser.add_argument('--load-seconds', default=2.0, type=float)
+    parser.add_argument('--scaling-workers', default=None,
+                        help='Comma separated worker counts, e.g. 1,2,4. Instead of the single-process '
+                             'benchmark, measures tcp_proxy.py --workers throughput for each of them.')
+    parser.add_argument('--load-processes', default=4, type=int)
+    parser.add_argument('--software-clients', default=2, type=int,
+                        help='Software clients per load process.')
+    cl_args = parser.parse_args()
+
+    if cl_args.scaling_workers:
+        for index, workers in enumerate(map(int, cl_args.scaling_workers.split(','))):
+            throughput = measure_worker_scaling(cl_args.tcp_address, cl_args.tcp_port + 2 * index, workers,
+                                                cl_args.load_processes, cl_args.software_clients,
+                                                cl_args.load_seconds)
+            print(f'{workers} workers: {throughput:.0f} frames/s delivered to '
+                  f'{cl_args.load_processes * cl_args.software_clients} software clients')
+    else:
+        asyncio.run(run_benchmark(cl_args))
@@ -0,0 +1,200 @@
+import csv
+import itertools
+import logging
+import os
+import random
+import sys
+import time
+import traceback
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+import yaml
+
+from communication_library.impaired_transport import NetworkImpairment
+from loopback_simulation import run_headless_simulation, run_loopback_simulation
+from tcp_simulator import SimulationState, StandaloneMock
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """
+    One full-stack flight, StandaloneMock and SoftwareSimulation linked in-process.
+    :param time_multiplier: 0 runs headless on a virtual clock, otherwise real time scaled by it
+    :param seed: picks the phase of the first feed within the feed interval
+    :param max_time: simulated seconds after which the flight is abandoned as TIMEOUT
+    :param impairment_config: network impairment between the rocket and the ground, see impairment_config.yaml
+    """
+    hardware_config: str
+    feed_interval: float
+    time_multiplier: float
+    seed: int
+    max_time: float = 900.0
+    impairment_config: Optional[str] = None
+
+
+@dataclass
+class ScenarioResult:
+    scenario: Scenario
+    outcome: str
+    max_altitude: float = 0.0
+    simulated_time: float = 0.0
+    wall_time: float = 0.0
+    # simulated seconds spent in every state the rocket went through
+    phase_times: dict[str, float] = field(default_factory=dict)
+    # 95th percentile latency of frames to the rocket (commands) and from it (feeds, ACKs) in simulated seconds
+    command_latency_p95: Optional[float] = None
+    feed_latency_p95: Optional[float] = None
+    error: Optional[str] = None
+
+
+def build_matrix(hardware_configs: list[str], feed_intervals: list[float], time_multipliers: list[float],
+                 seeds: list[int], max_time: float,
+                 impairment_configs: list[Optional[str]] = (None,)) -> list[Scenario]:
+    return [Scenario(*values, max_time=max_time, impairment_config=impairment_config)
+            for impairment_config in impairment_configs
+            for values in itertools.product(hardware_configs, feed_intervals, time_multipliers, seeds)]
+
+
+def _outcome(mock: StandaloneMock, states: list[SimulationState]) -> str:
+    if mock.should_run:
+        return 'TIMEOUT'
+    if mock.state == SimulationState.LANDED and states[-2] == SimulationState.FREEFALL:
+        return 'CRASH_LANDING'
+    return mock.state.value
+
+
+def run_scenario(scenario: Scenario) -> ScenarioResult:
+    transitions = [(SimulationState.IDLE, 0.0)]
+
+    def record_transition(mock: StandaloneMock):
+        if mock.state != transitions[-1][0]:
+            transitions.append((mock.state, mock.clock.now()))
+
+    first_feed_delay = random.Random(scenario.seed).uniform(0.0, scenario.feed_interval)
+    start = time.perf_counter()
+    impairment = None
+    try:
+        if scenario.impairment_config:
+            with open(scenario.impairment_config, 'r') as impairment_file:
+                # the scenario seed replaces the one in the file, so seeds also vary the impairment
+                impairment = NetworkImpairment(yaml.safe_load(impairment_file), seed=scenario.seed)
+        if scenario.time_multiplier:
+            mock = run_loopback_simulation(scenario.hardware_config, scenario.feed_interval,
+                                           scenario.time_multiplier, first_feed_delay=first_feed_delay,
+                                           max_time=scenario.max_time, on_step=record_transition,
+                                           impairment=impairment)
+        else:
+            mock = run_headless_simulation(scenario.hardware_config, scenario.feed_interval,
+                                           first_feed_delay=first_feed_delay, max_time=scenario.max_time,
+                                           on_step=record_transition, impairment=impairment)
+    except Exception:
+        return ScenarioResult(scenario, 'ERROR', wall_time=time.perf_counter() - start,
+                              error=traceback.format_exc(limit=3))
+    wall_time = time.perf_counter() - start
+
+    record_transition(mock)
+    end = mock.clock.now()
+    phase_times = {}
+    for (state, entered), (_, left) in zip(transitions, transitions[1:] + [(None, end)]):
+        phase_times[state.value] = phase_times.get(state.value, 0.0) + left - entered
+    return ScenarioResult(scenario,
+                          _outcome(mock, [state for state, _ in transitions]),
+                          max_altitude=mock.max_altitude,
+                          simulated_time=end,
+                          wall_time=wall_time,
+                          phase_times=phase_times,
+                          command_latency_p95=impairment and impairment.latency_percentile('read', 0.95),
+                          feed_latency_p95=impairment and impairment.latency_percentile('write', 0.95))
+
+
+def _quiet_worker():
+    # a sweep prints a table, not the status of hundreds of rockets
+    logging.disable(logging.CRITICAL)
+    sys.stdout = open(os.devnull, 'w')
+
+
+def run_scenarios(scenarios: list[Scenario], jobs: Optional[int] = None) -> list[ScenarioResult]:
+    """
+    Runs the scenarios on a process pool, results come back in the order of scenarios.
+    Every flight has its own LoopbackProxy, so workers need no ports.
+    """
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_quiet_worker) as executor:
+        return list(executor.map(run_scenario, scenarios))
+
+
+def _phase_columns(results: list[ScenarioResult]) -> list[str]:
+    visited = {state for result in results for state in result.phase_times}
+    return [state.value for state in SimulationState if state.value in visited]
+
+
+def _format_latency(latency: Optional[float]) -> str:
+    return '-' if latency is None else f'{latency * 1000:.0f}'
+
+
+def print_results(results: list[ScenarioResult]):
+    phases = _phase_columns(results)
+    header = (f'{"config":<24}{"impairment":<18}{"feed":>6}{"mult":>6}{"seed":>6} {"outcome":<19}{"apogee":>9}'
+              f'{"sim s":>8}{"wall s":>8}{"cmd p95":>9}{"feed p95":>9}'
+              + ''.join(f'{phase[:11]:>12}' for phase in phases))
+    print(header)
+    for result in results:
+        scenario = result.scenario
+        impairment = os.path.basename(scenario.impairment_config) if scenario.impairment_config else '-'
+        print(f'{os.path.basename(scenario.hardware_config)[:23]:<24}{impairment[:17]:<18}{scenario.feed_interval:>6g}'
+              f'{scenario.time_multiplier:>6g}{scenario.seed:>6} {result.outcome:<19}'
+              f'{result.max_altitude:>9.1f}{result.simulated_time:>8.1f}{result.wall_time:>8.2f}'
+              f'{_format_latency(result.command_latency_p95):>9}{_format_latency(result.feed_latency_p95):>9}'
+              + ''.join(f'{result.phase_times.get(phase, 0.0):>12.1f}' for phase in phases))
+        if result.error:
+            print(result.error)
+
+    print()
+    outcomes = {}
+    for result in results:
+        outcomes[result.outcome] = outcomes.get(result.outcome, 0) + 1
+    for outcome, count in sorted(outcomes.items()):
+        print(f'{outcome:<19}{count:>6}')
+
+
+def write_csv(path: str, results: list[ScenarioResult]):
+    phases = _phase_columns(results)
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['hardware_config', 'impairment_config', 'feed_interval', 'time_multiplier', 'seed', 'outcome',
+                         'max_altitude', 'simulated_time', 'wall_time', 'command_latency_p95', 'feed_latency_p95']
+                        + phases)
+        for result in results:
+            scenario = result.scenario
+            writer.writerow([scenario.hardware_config, scenario.impairment_config, scenario.feed_interval,
+                             scenario.time_multiplier, scenario.seed, result.outcome, result.max_altitude,
+                             result.simulated_time, result.wall_time, result.command_latency_p95,
+                             result.feed_latency_p95] + [result.phase_times.get(phase, 0.0) for phase in phases])
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Runs a matrix of full-stack flights in parallel and tabulates the outcomes.')
+    parser.add_argument('--hardware-configs', default=['simulator_config.yaml'], nargs='+')
+    parser.add_argument('--feed-intervals', default=[1.0], type=float, nargs='+')
+    parser.add_argument('--time-multipliers', default=[0.0], type=float, nargs='+',
+                        help='0 runs headless on a virtual clock, other values in real time scaled by the value.')
+    parser.add_argument('--seeds', default=1, type=int, help='Every combination runs with seeds 0..N-1.')
+    parser.add_argument('--max-time', default=900.0, type=float,
+                        help='Simulated seconds after which a flight is abandoned as TIMEOUT.')
+    parser.add_argument('--jobs', default=None, type=int, help='Worker processes, by default one per CPU.')
+    parser.add_argument('--impairment-configs', default=['none'], nargs='+',
+                        help='Network impairments to fly every combination with, none for a perfect link.')
+    parser.add_argument('--csv', default=None, help='Also write the results to this file.')
+    cl_args = parser.parse_args()
+
+    impairment_configs = [None if config == 'none' else config for config in cl_args.impairment_configs]
+    scenarios = build_matrix(cl_args.hardware_configs, cl_args.feed_intervals, cl_args.time_multipliers,
+                             list(range(cl_args.seeds)), cl_args.max_time, impairment_configs)
+    start = time.perf_counter()
+    results = run_scenarios(scenarios, cl_args.jobs)
+    print_results(results)
+    print(f'{len(scenarios)} scenarios in {time.perf_counter() - start:.1f}s')
+    if cl_args.csv:
+        write_csv(cl_args.csv, results)
@@ -0,0 +1,62 @@
+import time
+from abc import ABC, abstractmethod
+
+
+class SimulationClock(ABC):
+    """
+    Source of simulation time in seconds. StandaloneMock reads time only through its clock,
+    so the same flight can run against the wall clock or against a virtual one.
+    """
+
+    @abstractmethod
+    def now(self) -> float:
+        pass
+
+    @abstractmethod
+    def advance(self, dt: float):
+        """
+        Moves a clock that does not run by itself forward by dt seconds.
+        """
+
+    @abstractmethod
+    def sleep(self, seconds: float):
+        """
+        Waits seconds of simulation time.
+        """
+
+
+class RealTimeClock(SimulationClock):
+    """
+    Wall clock scaled by time_multiplier, 2.0 runs the simulation twice as fast.
+    """
+
+    def __init__(self, time_multiplier: float = 1.0):
+        self.time_multiplier = time_multiplier
+        self._start = time.perf_counter()
+
+    def now(self) -> float:
+        return (time.perf_counter() - self._start) * self.time_multiplier
+
+    def advance(self, dt: float):
+        pass
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds / self.time_multiplier)
+
+
+class VirtualClock(SimulationClock):
+    """
+    Clock that only moves when advanced, for headless runs as fast as the CPU allows.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self._now = start
+
+    def now(self) -> float:
+        return self._now
+
+    def advance(self, dt: float):
+        self._now += dt
+
+    def sleep(self, seconds: float):
+        self._now += seconds
@@ -1,10 +1,13 @@
 from communication_library.communication_manager import CommunicationManager, TransportType
 from communication_library.tcp_transport import TcpSettings
+from communication_library.transport import TransportSettings
 from communication_library.frame import Frame
 from communication_library import ids
-from communication_library.exceptions import TransportTimeoutError, TransportError, UnregisteredCallbackError, CommunicationError
+from communication_library.recording_transport import ReplaySettings
+from communication_library.exceptions import TransportTimeoutError, TransportError, UnregisteredCallbackError, CommunicationError, ClosedTransportError, ChecksumMismatchError, MissingHeaderError
 
 from typing import Callable, Annotated
+from argparse import ArgumentParser
 from software_simulation_structure import *
 
 class SoftwareSimulation:
@@ -13,13 +16,13 @@ class SoftwareSimulation:
     Software driver of simulation
     """
 
-    def __init__(self):
+    def __init__(self, transport_type: TransportType = TransportType.TCP):
         self.variables = SoftwareSimulationVariables(on_oxidizing_finished=self.begin_fueling, on_fueling_finished=self.begin_heating,
                                                      on_heating_finished=self.begin_ignition,on_ignition_finished=self.flight,on_ignite=self.do_ignition)
         
         self.phase = PhaseEnum.PHASE_BEGIN
         self.communication_manager = CommunicationManager()
-        self.communication_manager.change_transport_type(TransportType.TCP)
+        self.communication_manager.change_transport_type(transport_type)
         self.register_simulation_callbacks()
 
     def register_simulation_callbacks(self):
@@ -78,18 +81,34 @@ class SoftwareSimulation:
             self.register_parachute_relay_open_callback()
             
 
-    def connect(self, settings: TcpSettings):
+    def connect(self, settings: TransportSettings):
         self.communication_manager.connect(settings)
 
     def receive_blocking(self):
         while True:
-            try:
-                frame = self.communication_manager.receive() # We can handle frames using callbacks or by getting frame right from receive() call
-            except TransportTimeoutError:
-                pass
-            except UnregisteredCallbackError as e:
-                pass #I could and probably should register and then log the states of servos, but I think it is negligible during this simulation
-                #print(f"unregistered frame received: {e.frame}")
+            self.receive_once()
+
+    def receive_once(self) -> bool:
+        """
+        Handles at most one incoming frame. Returns False if there was nothing to read.
+        """
+        try:
+            frame = self.communication_manager.receive() # We can handle frames using callbacks or by getting frame right from receive() call
+        except TransportTimeoutError:
+            return False
+        except UnregisteredCallbackError as e:
+            pass #I could and probably should register and then log the states of servos, but I think it is negligible during this simulation
+            #print(f"unregistered frame received: {e.frame}")
+        except (ChecksumMismatchError, MissingHeaderError):
+            pass # a corrupted frame is lost, the next call looks for the next header
+        return True
+
+    def receive_pending(self):
+        """
+        Handles every frame that is already waiting in the transport.
+        """
+        while self.receive_once():
+            pass
 
     #Function that are mostly called as a callback when a step is complete -> they update inner state and send open command
     def begin_oxidizing(self):
@@ -428,14 +447,33 @@ class SoftwareSimulation:
         
 
 if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--proxy-address', default="127.0.0.1")
+    parser.add_argument('--proxy-port', default=3000, type=int)
+    parser.add_argument('--record', default=None,
+                        help='Append every chunk read/written to this recording file.')
+    parser.add_argument('--replay', default=None,
+                        help='Feed a recording back instead of connecting to the proxy.')
+    parser.add_argument('--replay-speed', default=1.0, type=float,
+                        help='Playback multiplier for --replay, 0 = as fast as possible.')
+    cl_args = parser.parse_args()
+
     # We must create a frame that will serve as a pattern indicating what kind of frames we want to receive
     # During frame equality comparison the following fields are excluded: priority, data_type, payload
     # You can find more information in communication_library/frame.py
-    sim = SoftwareSimulation()
-
-    sim.connect(TcpSettings("127.0.0.1", 3000))
+    if cl_args.replay:
+        sim = SoftwareSimulation(transport_type=TransportType.REPLAY)
+        sim.connect(ReplaySettings(cl_args.replay, cl_args.replay_speed))
+    else:
+        sim = SoftwareSimulation()
+        if cl_args.record:
+            sim.communication_manager.record_transport(cl_args.record)
+        sim.connect(TcpSettings(cl_args.proxy_address, cl_args.proxy_port))
 
     #first phase -> next phase starts when begin_fueling() is called as a callback from sim.variables.oxidizer when it's done
     sim.begin_oxidizing()
 
-    sim.receive_blocking()
\ No newline at end of file
+    try:
+        sim.receive_blocking()
+    except ClosedTransportError:
+        print(f"Connection closed in phase {sim.phase.name}")
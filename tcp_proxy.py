@@ -1,21 +1,139 @@
 import asyncio
+import socket
 import logging
-from communication_library.protocol import GroundStationProtocol
-from communication_library.ids import HEADER_ID
+from communication_library.protocol import GroundStationProtocol, FrameStreamParser
+from communication_library.ids import PriorityID, BoardID, ActionID, OperationID, DeviceID, DataTypeID
+from communication_library.exceptions import ProtocolError
+from communication_library.subscription import FramePattern
+from flight_recorder import FlightRecorder, FrameDirection
 from collections import deque
+from enum import Enum
+from typing import Optional
 from pathlib import Path
 from os.path import join
 import sys
+import time
+import json
+import itertools
+import os
+import struct
+import multiprocessing
+import yaml
+import signal
 from datetime import datetime
 from argparse import ArgumentParser
 
 
+class OverflowPolicy(Enum):
+    DROP_OLDEST = 'drop-oldest'
+    DROP_LOW_PRIORITY = 'drop-low'
+    DISCONNECT = 'disconnect'
+
+
+class SlowClientError(Exception):
+    """Raised when a client's send queue overflows under the DISCONNECT policy"""
+
+
+class LatencyStats:
+    """
+    Running count, average and maximum of a latency, cumulative and since the last window reset.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._window_count = 0
+        self._window_total = 0.0
+        self._window_max = 0.0
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self._window_count += 1
+        self._window_total += seconds
+        self._window_max = max(self._window_max, seconds)
+
+    def snapshot(self, reset_window: bool = False) -> dict:
+        snapshot = {
+            'count': self.count,
+            'avg_us': round(1e6 * self.total / self.count, 1) if self.count else None,
+            'max_us': round(1e6 * self.max, 1),
+            'window_count': self._window_count,
+            'window_avg_us': round(1e6 * self._window_total / self._window_count, 1) if self._window_count else None,
+            'window_max_us': round(1e6 * self._window_max, 1),
+        }
+        if reset_window:
+            self._window_count = 0
+            self._window_total = 0.0
+            self._window_max = 0.0
+        return snapshot
+
+
+class SchedulingPolicy(Enum):
+    FIFO = 'fifo'
+    STRICT = 'strict'
+    WEIGHTED = 'weighted'
+
+
 class ProxyClient:
-    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    _client_ids = itertools.count(1)
+    DROP_REPORT_PERIOD = 5.0
+    READ_CHUNK_SIZE = 4096
+    # keep the backlog in the priority queues instead of the transport's and kernel's write buffers
+    WRITE_HIGH_WATERMARK = 4096
+    DEFAULT_PRIORITY_WEIGHTS = {int(PriorityID.HIGH): 8, int(PriorityID.LOW): 1}
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 max_queue_frames: Optional[int] = None,
+                 max_queue_bytes: Optional[int] = None,
+                 overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+                 conflate_feeds: bool = False,
+                 scheduling: SchedulingPolicy = SchedulingPolicy.STRICT,
+                 priority_weights: Optional[dict] = None,
+                 write_high_watermark: int = WRITE_HIGH_WATERMARK,
+                 socket_send_buffer: Optional[int] = None,
+                 logger: Optional[logging.Logger] = None):
         self.reader = reader
         self.writer = writer
-        self.send_queue = deque()
+        self.write_high_watermark = write_high_watermark
+        self.writer.transport.set_write_buffer_limits(high=write_high_watermark)
+        sock = writer.get_extra_info('socket')
+        if sock is not None and socket_send_buffer is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, socket_send_buffer)
+        self.name = str(writer.get_extra_info('peername'))
+        self.client_id = next(self._client_ids)
+        # one queue of [arrival, data] entries per priority, HIGH first
+        self.send_queues = {int(priority): deque() for priority in PriorityID}
+        self._send_event = asyncio.Event()
         self._should_stop = False
+        self.parser = FrameStreamParser()
+        self.subscriptions: set[FramePattern] = set()
+        self.max_queue_frames = max_queue_frames
+        self.max_queue_bytes = max_queue_bytes
+        self.overflow_policy = overflow_policy
+        self.scheduling = scheduling
+        self.priority_weights = priority_weights or self.DEFAULT_PRIORITY_WEIGHTS
+        self._scheduled_priority = int(PriorityID.HIGH)
+        self._scheduled_credits = self.priority_weights[self._scheduled_priority]
+        self.conflate_feeds = conflate_feeds
+        # (source, device_type, device_id) -> queued [arrival, data] entry of a LOW priority FEED frame
+        self._queued_feeds = {}
+        self.conflated_frames = 0
+        self.queued_frames = 0
+        self.queued_bytes = 0
+        self.dropped_frames = 0
+        self.dropped_bytes = 0
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+        self.peak_queue_frames = 0
+        self.hop_latency = LatencyStats()
+        self.connected_at = time.monotonic()
+        self._last_drop_report = None
+        self._logger = logger or logging.getLogger(__name__)
 
     @property
     def should_stop(self):
@@ -26,19 +144,203 @@ class ProxyClient:
 
     def stop(self):
         self._should_stop = True
+        self._send_event.set()
+        self.writer.close()
+
+    def wants(self, action, source, device_type, device_id):
+        if not self.subscriptions:
+            return True
+        return any(pattern.matches(action, source, device_type, device_id) for pattern in self.subscriptions)
+
+    def _priority(self, data: bytes) -> int:
+        priority = GroundStationProtocol.peek_priority(data)
+        return priority if priority in self.send_queues else int(PriorityID.LOW)
+
+    def _is_over_limit(self, extra_bytes=0):
+        if self.max_queue_frames is not None and self.queued_frames >= self.max_queue_frames:
+            return True
+        if self.max_queue_bytes is not None and self.queued_bytes + extra_bytes > self.max_queue_bytes:
+            return True
+        return False
+
+    def _record_drop(self, data):
+        self.dropped_frames += 1
+        self.dropped_bytes += len(data)
+        now = time.monotonic()
+        if self._last_drop_report is None or now - self._last_drop_report > self.DROP_REPORT_PERIOD:
+            self._last_drop_report = now
+            self._logger.warning(f'Client {self.name} is too slow, dropped {self.dropped_frames} frames '
+                                 f'({self.dropped_bytes} bytes) so far, policy: {self.overflow_policy.value}')
+
+    @staticmethod
+    def _feed_key(data: bytes):
+        header = GroundStationProtocol.peek_header(data)
+        if header.action != ActionID.FEED or header.priority != PriorityID.LOW:
+            return None
+        return header.source, header.device_type, header.device_id
+
+    def _forget_queued_feed(self, entry):
+        key = self._feed_key(entry[1])
+        if key is not None and self._queued_feeds.get(key) is entry:
+            del self._queued_feeds[key]
+
+    def set_feed_conflation(self, state: bool):
+        self.conflate_feeds = state
+        if not state:
+            self._queued_feeds.clear()
+
+    def _oldest_queue(self) -> deque:
+        return min((queue for queue in self.send_queues.values() if queue), key=lambda queue: queue[0][0])
+
+    def _pop_entry(self, queue: deque):
+        entry = queue.popleft()
+        if self._queued_feeds:
+            self._forget_queued_feed(entry)
+        self.queued_frames -= 1
+        self.queued_bytes -= len(entry[1])
+        return entry
+
+    def _drop_from(self, queue: deque):
+        _, data = self._pop_entry(queue)
+        self._record_drop(data)
+
+    # Replace the queued value of the same sensor in place, keeping its position in the queue
+    def _conflate(self, data: bytes, arrival: float) -> bool:
+        key = self._feed_key(data)
+        if key is None:
+            return False
+
+        entry = self._queued_feeds.get(key)
+        if entry is None:
+            return False
+
+        self.queued_bytes += len(data) - len(entry[1])
+        entry[0] = arrival
+        entry[1] = data
+        self.conflated_frames += 1
+        return True
+
+    def push_data_to_send(self, data: bytes, arrival: Optional[float] = None):
+        # data is shared between every client it is fanned out to, it must not be modified
+        arrival = time.monotonic() if arrival is None else arrival
+        if self.conflate_feeds and self._conflate(data, arrival):
+            return
+
+        priority = self._priority(data)
+        low_queue = self.send_queues[int(PriorityID.LOW)]
+        while self.queued_frames and self._is_over_limit(len(data)):
+            if self.overflow_policy == OverflowPolicy.DISCONNECT:
+                raise SlowClientError(f'Client {self.name} send queue is full')
+
+            if self.overflow_policy == OverflowPolicy.DROP_LOW_PRIORITY:
+                if low_queue:
+                    self._drop_from(low_queue)
+                    continue
+                if priority == PriorityID.LOW:
+                    self._record_drop(data)
+                    return
+
+            self._drop_from(self._oldest_queue())
+
+        entry = [arrival, data]
+        self.send_queues[priority].append(entry)
+        if self.conflate_feeds:
+            key = self._feed_key(data)
+            if key is not None:
+                self._queued_feeds[key] = entry
+        self.queued_frames += 1
+        self.queued_bytes += len(data)
+        self.peak_queue_frames = max(self.peak_queue_frames, self.queued_frames)
+        self._send_event.set()
 
-    def push_data_to_send(self, data):
-        self.send_queue.append(data)
+    def _next_queue(self) -> deque:
+        if self.scheduling == SchedulingPolicy.FIFO:
+            return self._oldest_queue()
+
+        if self.scheduling == SchedulingPolicy.WEIGHTED:
+            # weighted round robin: up to weight frames from a priority before moving to the next one
+            queue = self.send_queues[self._scheduled_priority]
+            if queue and self._scheduled_credits > 0:
+                self._scheduled_credits -= 1
+                return queue
+            priorities = list(self.send_queues)
+            start = priorities.index(self._scheduled_priority)
+            for offset in range(1, len(priorities) + 1):
+                priority = priorities[(start + offset) % len(priorities)]
+                if self.send_queues[priority]:
+                    self._scheduled_priority = priority
+                    self._scheduled_credits = self.priority_weights[priority] - 1
+                    return self.send_queues[priority]
+
+        for queue in self.send_queues.values():
+            if queue:
+                return queue
 
     def get_data_to_send(self):
-        return self.send_queue.popleft()
+        arrival, data = self._pop_entry(self._next_queue())
+        return arrival, data
+
+    def get_batch_to_send(self) -> list:
+        """
+        Takes queued (arrival, data) entries in scheduling order until they would fill the
+        transport's write buffer up to the high watermark, but at least one entry.
+        """
+        room = self.write_high_watermark - self.writer.transport.get_write_buffer_size()
+        batch = []
+        while self.queued_frames and (not batch or room > 0):
+            entry = self.get_data_to_send()
+            batch.append(entry)
+            room -= len(entry[1])
+        return batch
+
+    def record_received(self, data: bytes):
+        self.frames_in += 1
+        self.bytes_in += len(data)
 
-    async def write(self, data):
-        self.writer.write(data)
-        await self.writer.drain()
+    def record_written(self, batch: list):
+        now = time.monotonic()
+        for arrival, data in batch:
+            self.frames_out += 1
+            self.bytes_out += len(data)
+            self.hop_latency.record(now - arrival)
+
+    def stats_snapshot(self, reset_window: bool = False) -> dict:
+        return {
+            'client': self.name,
+            'connection_age_s': round(time.monotonic() - self.connected_at, 3),
+            'frames_in': self.frames_in,
+            'bytes_in': self.bytes_in,
+            'frames_out': self.frames_out,
+            'bytes_out': self.bytes_out,
+            'queue_frames': self.queued_frames,
+            'queue_frames_by_priority': {PriorityID(priority).name: len(queue)
+                                         for priority, queue in self.send_queues.items()},
+            'queue_bytes': self.queued_bytes,
+            'peak_queue_frames': self.peak_queue_frames,
+            'dropped_frames': self.dropped_frames,
+            'dropped_bytes': self.dropped_bytes,
+            'conflate_feeds': self.conflate_feeds,
+            'conflated_frames': self.conflated_frames,
+            'corrupt_frames': self.parser.corrupt_frames,
+            'subscriptions': len(self.subscriptions),
+            'hop_latency': self.hop_latency.snapshot(reset_window),
+        }
+
+    async def wait_for_data_to_send(self):
+        while not self.queued_frames and not self._should_stop:
+            self._send_event.clear()
+            await self._send_event.wait()
+
+    async def write(self, frames: list):
+        self.writer.write(b''.join(frames))
+        if self.writer.transport.get_write_buffer_size() > self.write_high_watermark:
+            await self.writer.drain()
+        else:
+            # let the other clients and the readers run between batches
+            await asyncio.sleep(0)
 
-    async def readexactly(self, amount):
-        return await self.reader.readexactly(amount)
+    async def read(self, amount=READ_CHUNK_SIZE):
+        return await self.reader.read(amount)
 
 
 class Proxy:
@@ -50,30 +352,122 @@ class Proxy:
         self.tcp_port = None
         self.mirror_frames = False
         self.clients = {}
+        self._server = None
+        # station and client tasks, cancelled by close()
+        self._tasks: set[asyncio.Task] = set()
+        self.max_client_queue_frames = None
+        self.max_client_queue_bytes = None
+        self.client_overflow_policy = OverflowPolicy.DROP_OLDEST
+        self.conflate_client_feeds = False
+        self.client_scheduling = SchedulingPolicy.STRICT
+        self.client_priority_weights = None
+        self.replay_last_state = True
+        self.client_write_high_watermark = ProxyClient.WRITE_HIGH_WATERMARK
+        self.client_socket_send_buffer = None
+        # (source, device_type, device_id) -> latest FEED frame fanned out to this segment's clients
+        self.last_state: dict[tuple, bytes] = {}
+        self.corrupt_frames = 0
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.frames_from_peer = 0
+        self.frames_from_bus = 0
+        self.unroutable_frames = 0
+        self._unroutable_destinations = set()
+        self.router: Optional[Router] = None
+        self.bus: Optional[ProxyBus] = None
+        self.recorder: Optional[FlightRecorder] = None
+        self.reuse_port = False
+        self.started_at = time.monotonic()
+        # (action, source, device_type, device_id) -> clients subscribed to such frames
+        self._subscribers_cache: dict[tuple, list[ProxyClient]] = {}
         self.setup_loggers()
         self._logger = logging.getLogger(self.name)
-        self._send_queue = deque()
-        self._external_receive_queue = deque()
+        # per-priority station queues, drained HIGH first
+        self._send_queues = {int(priority): deque() for priority in PriorityID}
+        self._send_event = asyncio.Event()
+        self._external_receive_queues = {int(priority): deque() for priority in PriorityID}
+        self._external_receive_event = asyncio.Event()
         self._external_listeners: list[Proxy] = []
 
-    def push_data_to_send(self, data):
-        self._send_queue.append(data)
+    @staticmethod
+    def _priority(data: bytes) -> int:
+        priority = GroundStationProtocol.peek_priority(data)
+        return priority if priority == PriorityID.HIGH else int(PriorityID.LOW)
+
+    @staticmethod
+    def _pop_highest_priority(queues: dict):
+        for queue in queues.values():
+            if queue:
+                return queue.popleft()
+
+    # Station queues hold (arrival time, frame bytes) so hop latency is measured from the first read
+    def push_data_to_send(self, data, arrival: Optional[float] = None):
+        self._send_queues[self._priority(data)].append((time.monotonic() if arrival is None else arrival, data))
+        self._send_event.set()
+
+    def push_frames_to_send(self, frames: list, arrival: float):
+        for data in frames:
+            self._send_queues[self._priority(data)].append((arrival, data))
+        self._send_event.set()
 
     def get_data_to_send(self):
-        return self._send_queue.popleft()
+        return self._pop_highest_priority(self._send_queues)
+
+    async def wait_for_data_to_send(self):
+        while not any(self._send_queues.values()):
+            self._send_event.clear()
+            await self._send_event.wait()
 
-    def push_external_data_to_forward(self, data):
-        return self._external_receive_queue.append(data)
+    def push_external_data_to_forward(self, data, arrival: Optional[float] = None):
+        self._external_receive_queues[self._priority(data)].append(
+            (time.monotonic() if arrival is None else arrival, data))
+        self._external_receive_event.set()
+
+    def push_external_frames_to_forward(self, frames: list, priority: int):
+        # frames are (arrival time, frame bytes) tuples taken from the peer's send queue of that priority
+        self.frames_from_peer += len(frames)
+        self._external_receive_queues[priority].extend(frames)
+        self._external_receive_event.set()
 
     def get_external_data_to_forward(self):
-        return self._external_receive_queue.popleft()
+        return self._pop_highest_priority(self._external_receive_queues)
+
+    async def wait_for_external_data_to_forward(self):
+        while not any(self._external_receive_queues.values()):
+            self._external_receive_event.clear()
+            await self._external_receive_event.wait()
 
     def register_external_listener(self, listener):
         self._external_listeners.append(listener)
 
+    def set_router(self, router: 'Router', boards: list):
+        self.router = router
+        names = [BoardID(board).name if board in BoardID.__members__.values() else hex(board) for board in boards]
+        self._logger.info(f'Routing frames for boards {names or "none"} to this segment')
+
+    # Group frames by the segments owning their destination, so every segment gets one batch
+    def forward_to_segments(self, frames: list, priority: int):
+        batches: dict[Proxy, list] = {}
+        for entry in frames:
+            destination = GroundStationProtocol.peek_header(entry[1]).destination
+            segments = self.router.route(self, destination)
+            if not segments and not self.router.is_owned_by(self, destination):
+                self.unroutable_frames += 1
+                if destination not in self._unroutable_destinations:
+                    self._unroutable_destinations.add(destination)
+                    self._logger.warning(f'No segment owns destination {destination:#x}, dropping its frames')
+            for segment in segments:
+                batches.setdefault(segment, []).append(entry)
+
+        for segment, batch in batches.items():
+            segment.push_external_frames_to_forward(batch, priority)
+
     def setup_loggers(self):
         logger_main = logging.getLogger(self.name)
         logger_main.setLevel(logging.DEBUG)
+        # another proxy of the same name in this process already set it up
+        if logger_main.handlers:
+            return
 
         fmt = f'[%(asctime)s] [%(levelname)s] [{self.name.upper()}] %(message)s'
         log_formatter = logging.Formatter(fmt=fmt)
@@ -95,9 +489,21 @@ class Proxy:
         logger_main.addHandler(console_handler)
 
     def add_client(self, reader, writer: asyncio.StreamWriter):
-        client = ProxyClient(reader, writer)
+        client = ProxyClient(reader, writer,
+                             max_queue_frames=self.max_client_queue_frames,
+                             max_queue_bytes=self.max_client_queue_bytes,
+                             overflow_policy=self.client_overflow_policy,
+                             conflate_feeds=self.conflate_client_feeds,
+                             scheduling=self.client_scheduling,
+                             priority_weights=self.client_priority_weights,
+                             write_high_watermark=self.client_write_high_watermark,
+                             socket_send_buffer=self.client_socket_send_buffer,
+                             logger=self._logger)
         self.clients.update({client.get_key(): client})
-        self._logger.info('Added new client')
+        self._subscribers_cache.clear()
+        self._logger.info(f'Added new client {client.name}')
+        if self.recorder is not None:
+            self.recorder.register_client(client.client_id, self.name, client.name)
         return client
 
     def remove_client(self, client):
@@ -105,128 +511,574 @@ class Proxy:
         if key in self.clients:
             client.stop()
             self.clients.pop(key)
-            self._logger.info('Removed client')
+            self._subscribers_cache.clear()
+            self._logger.info(f'Removed client {client.name}, dropped frames: {client.dropped_frames}')
 
-    def set_tcp_server_options(self, address, port):
+    def set_tcp_server_options(self, address, port, reuse_port=False):
         self.tcp_address = address
         self.tcp_port = port
-        self._logger.info(f'Server listen tcp socket set to {self.tcp_address}:{self.tcp_port}')
+        self.reuse_port = reuse_port
+        self._logger.info(f'Server listen tcp socket set to {self.tcp_address}:{self.tcp_port}'
+                          + (' (shared with other workers)' if reuse_port else ''))
+
+    def set_recorder(self, recorder: FlightRecorder):
+        self.recorder = recorder
+        self._logger.info(f'Recording forwarded frames to: {recorder.directory}')
 
     def set_frame_mirroring(self, state):
         self.mirror_frames = state
         self._logger.info(f'Frame mirroring set to: {self.mirror_frames}')
 
-    # Handle receiving data from ground station and forwarding it to clients
-    async def handle_station_receive(self):
-        while True:
+    def set_client_queue_limits(self, max_frames, max_bytes, policy: OverflowPolicy):
+        self.max_client_queue_frames = max_frames
+        self.max_client_queue_bytes = max_bytes
+        self.client_overflow_policy = policy
+        self._logger.info(f'Client queue limits set to: {max_frames} frames, {max_bytes} bytes, '
+                          f'overflow policy: {policy.value}')
 
-            if not self._external_receive_queue:
-                await asyncio.sleep(0)
-                continue
+    def set_client_feed_conflation(self, state):
+        self.conflate_client_feeds = state
+        self._logger.info(f'Default client feed conflation set to: {state}')
+
+    def set_client_scheduling(self, policy: SchedulingPolicy, priority_weights: Optional[dict] = None):
+        self.client_scheduling = policy
+        self.client_priority_weights = priority_weights
+        self._logger.info(f'Client scheduling set to: {policy.value}'
+                          + (f', weights: { {PriorityID(p).name: w for p, w in priority_weights.items()} }'
+                             if priority_weights else ''))
 
-            data = self.get_external_data_to_forward()
+    def set_client_write_watermark(self, high_watermark: int):
+        self.client_write_high_watermark = high_watermark
+        self._logger.info(f'Client write buffer high watermark set to: {high_watermark} bytes')
 
-            clients_to_drop = []
-            for client in self.clients.values():
-                try:
+    def set_client_send_buffer(self, size: Optional[int]):
+        self.client_socket_send_buffer = size
+        self._logger.info(f'Client socket send buffer set to: {size or "kernel default"}'
+                          + (' bytes' if size else ''))
+
+    def set_last_state_replay(self, state):
+        self.replay_last_state = state
+        self._logger.info(f'Last known state replay to new clients set to: {state}')
+
+    def get_subscribers(self, data: bytes, header=None) -> list[ProxyClient]:
+        header = header or GroundStationProtocol.peek_header(data)
+        key = (header.action, header.source, header.device_type, header.device_id)
+        subscribers = self._subscribers_cache.get(key)
+        if subscribers is None:
+            subscribers = [client for client in self.clients.values() if client.wants(*key)]
+            self._subscribers_cache[key] = subscribers
+        return subscribers
+
+    def send_last_state(self, client: ProxyClient, pattern: Optional[FramePattern] = None):
+        """
+        Queues the latest FEED frame of every device (matching pattern, if given) for the client.
+        """
+        try:
+            for (source, device_type, device_id), data in self.last_state.items():
+                if pattern is None or pattern.matches(ActionID.FEED, source, device_type, device_id):
                     client.push_data_to_send(data)
-                except ConnectionResetError:
-                    clients_to_drop.append(client)
-                    continue
-            for client in clients_to_drop:
-                self.remove_client(client)
+        except SlowClientError:
+            self.remove_client(client)
+
+    def handle_control_frame(self, client: ProxyClient, data: bytes):
+        header = GroundStationProtocol.peek_header(data)
+        operation = OperationID.PROXY.value
+        action = ActionID.ACK
+        subscribed_pattern = None
+
+        try:
+            if header.device_type != DeviceID.PROXY or header.data_type != DataTypeID.UINT32:
+                raise ValueError(f'device type {header.device_type} and data type {header.data_type} '
+                                 f'are not a proxy control frame')
+            # fields unknown to ids fail here, in Frame's checks
+            frame = self.protocol.decode(data)
+            if frame.operation == operation.CONFLATE:
+                client.set_feed_conflation(bool(frame.data))
+                self._logger.info(f'Client {client.name} feed conflation set to: {client.conflate_feeds}')
+            elif frame.operation in (operation.SUBSCRIBE, operation.UNSUBSCRIBE, operation.CLEAR_SUBSCRIPTIONS):
+                pattern = FramePattern.from_payload(frame.data)
+                if frame.operation == operation.SUBSCRIBE:
+                    client.subscriptions.add(pattern)
+                    subscribed_pattern = pattern
+                elif frame.operation == operation.UNSUBSCRIBE:
+                    client.subscriptions.discard(pattern)
+                else:
+                    client.subscriptions.clear()
+                self._subscribers_cache.clear()
+                self._logger.info(f'Client {client.name} subscriptions: '
+                                  f'{sorted(map(str, client.subscriptions)) or "all frames"}')
+            else:
+                raise ValueError(f'unknown operation {frame.operation}')
+        except (ValueError, KeyError, TypeError, AssertionError, ProtocolError) as err:
+            self._logger.warning(f'Rejected control frame {header} from client {client.name}: {err}')
+            action = ActionID.NACK
+
+        response = self.protocol.encode_reply(data, action)
+        try:
+            client.push_data_to_send(response)
+        except SlowClientError:
+            self.remove_client(client)
+            return
+        if subscribed_pattern is not None and self.replay_last_state:
+            self.send_last_state(client, subscribed_pattern)
+
+    # Queue the same bytes object for every subscribed client, it is never copied per client
+    def fan_out(self, data: bytes, exclude: Optional[ProxyClient] = None, arrival: Optional[float] = None):
+        header = GroundStationProtocol.peek_header(data)
+        if header.action == ActionID.FEED:
+            self.last_state[(header.source, header.device_type, header.device_id)] = data
+
+        clients_to_drop = []
+        for client in self.get_subscribers(data, header):
+            if client is exclude:
+                continue
+            try:
+                client.push_data_to_send(data, arrival)
+            except (ConnectionResetError, SlowClientError) as err:
+                self._logger.warning(f'Dropping client {client.name}: {err}')
+                clients_to_drop.append(client)
+        for client in clients_to_drop:
+            self.remove_client(client)
+
+    # Handle receiving data from ground station and forwarding it to clients
+    async def handle_station_receive(self):
+        while True:
+            await self.wait_for_external_data_to_forward()
+
+            entry = self.get_external_data_to_forward()
+            while entry is not None:
+                arrival, data = entry
+                self.fan_out(data, arrival=arrival)
+                entry = self.get_external_data_to_forward()
             await asyncio.sleep(0)
 
     async def handle_station_send(self):
         while True:
-            if not self._send_queue:
-                await asyncio.sleep(0)
-                continue
+            await self.wait_for_data_to_send()
 
-            data = self.get_data_to_send()
+            for priority, queue in self._send_queues.items():
+                if not queue:
+                    continue
+                frames = list(queue)
+                queue.clear()
+                if self.router is not None:
+                    self.forward_to_segments(frames, priority)
+                for listener in self._external_listeners:
+                    listener.push_external_frames_to_forward(frames, priority)
 
-            for listener in self._external_listeners:
-                listener.push_external_data_to_forward(data)
+    # Frames another worker process read from its clients of this segment
+    def push_bus_frames(self, frames: list, arrival: float):
+        self.frames_from_bus += len(frames)
+        self.push_frames_to_send(frames, arrival)
+        if self.mirror_frames:
+            for data in frames:
+                self.fan_out(data, arrival=arrival)
 
     # Handle receiving data from client and send it to ground station
     async def handle_client_receive(self, client):
         while not client.should_stop:
             try:
-                header = await client.readexactly(1)
-                if header != bytes([HEADER_ID]):
-                    self._logger.info('missing header')
-                    await asyncio.sleep(0)
-                    continue
-                raw_data = await client.readexactly(13)
+                chunk = await client.read()
             except ConnectionResetError:
                 break
             except ConnectionAbortedError:
                 self._logger.info('Client disconnected')
                 break
-            except asyncio.IncompleteReadError:
+
+            if not chunk:
                 break
 
-            self.push_data_to_send(header + raw_data)
+            arrival = time.monotonic()
+            corrupt_before = client.parser.corrupt_frames
+            frames = client.parser.feed(chunk)
+            corrupt_frames = client.parser.corrupt_frames - corrupt_before
+            if corrupt_frames:
+                self.corrupt_frames += corrupt_frames
+                self._logger.warning(f'Dropped {corrupt_frames} corrupt frames from client {client.name}')
+            forwarded_frames = []
+            for data in frames:
+                client.record_received(data)
+                if GroundStationProtocol.peek_header(data).destination == BoardID.PROXY:
+                    self.handle_control_frame(client, data)
+                else:
+                    forwarded_frames.append(data)
+            frames = forwarded_frames
+
+            if not frames:
+                continue
+
+            self.frames_in += len(frames)
+            self.bytes_in += sum(map(len, frames))
+            self.push_frames_to_send(frames, arrival)
+            if self.recorder is not None:
+                self.recorder.record_frames(FrameDirection.FROM_CLIENT, client.client_id, frames)
 
             if self.mirror_frames:
-                for remote_client in self.clients.values():
-                    if client == remote_client:
-                        continue
-                    remote_client.push_data_to_send(header + raw_data)
+                for data in frames:
+                    self.fan_out(data, exclude=client, arrival=arrival)
+
+            if self.bus is not None:
+                await self.bus.publish(self, frames, arrival)
+            # a client that keeps the read buffer full would otherwise never let the send tasks run
+            await asyncio.sleep(0)
 
         self.remove_client(client)
 
     # Handle sending data from ground station to client
     async def handle_client_send(self, client: ProxyClient):
         while not client.should_stop:
-            if not client.send_queue:
-                await asyncio.sleep(0)
-                continue
+            await client.wait_for_data_to_send()
+            if client.should_stop:
+                break
 
-            data = client.get_data_to_send()
+            batch = client.get_batch_to_send()
+            frames = [data for _, data in batch]
 
             try:
-                await client.write(data)
+                await client.write(frames)
             except ConnectionResetError:
                 break
+            client.record_written(batch)
+            if self.recorder is not None:
+                self.recorder.record_frames(FrameDirection.TO_CLIENT, client.client_id, frames)
 
         self.remove_client(client)
 
+    def stats_snapshot(self, reset_window: bool = False) -> dict:
+        return {
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'proxy': self.name,
+            'uptime_s': round(time.monotonic() - self.started_at, 3),
+            'frames_in': self.frames_in,
+            'bytes_in': self.bytes_in,
+            'frames_from_peer': self.frames_from_peer,
+            'frames_from_bus': self.frames_from_bus,
+            'corrupt_frames': self.corrupt_frames,
+            'unroutable_frames': self.unroutable_frames,
+            'last_state_entries': len(self.last_state),
+            'send_queue_frames': sum(map(len, self._send_queues.values())),
+            'peer_queue_frames': sum(map(len, self._external_receive_queues.values())),
+            'clients': [client.stats_snapshot(reset_window) for client in self.clients.values()],
+        }
+
+    def log_stats(self):
+        self._logger.info(json.dumps(self.stats_snapshot()))
+
+    # Append one JSON line with a stats snapshot every interval seconds
+    async def publish_stats(self, path, interval):
+        with open(path, 'a') as stats_file:
+            while True:
+                await asyncio.sleep(interval)
+                stats_file.write(json.dumps(self.stats_snapshot(reset_window=True)) + '\n')
+                stats_file.flush()
+
     # Handle new TCP client
     async def handle_new_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         client = self.add_client(reader, writer)
-        asyncio.create_task(self.handle_client_receive(client))
-        asyncio.create_task(self.handle_client_send(client))
+        if self.replay_last_state:
+            self.send_last_state(client)
+        self._start_task(self.handle_client_receive(client))
+        self._start_task(self.handle_client_send(client))
+
+    def _start_task(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
 
     async def serve(self):
-        server = await asyncio.start_server(self.handle_new_client, self.tcp_address, self.tcp_port)
-        asyncio.create_task(self.handle_station_receive())
-        asyncio.create_task(self.handle_station_send())
+        self._server = await asyncio.start_server(self.handle_new_client, self.tcp_address, self.tcp_port,
+                                                  reuse_port=self.reuse_port or None)
+        self._start_task(self.handle_station_receive())
+        self._start_task(self.handle_station_send())
         self._logger.info(f'Listening for tcp connections on socket: {self.tcp_address}:{self.tcp_port}')
-        async with server:
-            await server.serve_forever()
+        async with self._server:
+            await self._server.serve_forever()
 
+    async def close(self):
+        """
+        Stops listening, disconnects every client and waits for the station and client tasks to end,
+        for proxies started inside a longer running loop (e.g. proxy_benchmark.py).
+        """
+        if self._server is not None:
+            self._server.close()
+        for client in list(self.clients.values()):
+            self.remove_client(client)
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
 
-if __name__ == '__main__':
-    parser = ArgumentParser()
-    parser.add_argument('--tcp-address', default="127.0.0.1")
-    parser.add_argument('--tcp-port', default=3000)
-    cl_args = parser.parse_args()
-    software_proxy = Proxy(name='software')
-    software_proxy.set_tcp_server_options(cl_args.tcp_address, int(cl_args.tcp_port))
-    software_proxy.set_frame_mirroring(True)
 
-    hardware_proxy = Proxy(name='hardware')
-    hardware_proxy.set_tcp_server_options(cl_args.tcp_address, int(cl_args.tcp_port) + 1)
-    hardware_proxy.set_frame_mirroring(False)
+class Router:
+    """
+    Destination -> segment table shared by proxy segments. Every segment is a Proxy listening
+    on its own port and owning a set of BoardIDs. Frames are forwarded only to the segments
+    owning their destination, BROADCAST frames to every segment but the one they came from.
+    """
+
+    def __init__(self):
+        self.segments: list[Proxy] = []
+        self._owners: dict[int, list[Proxy]] = {}
+        # (source segment name, destination) -> segments to forward to
+        self._routes: dict[tuple, list[Proxy]] = {}
 
-    software_proxy.register_external_listener(hardware_proxy)
-    hardware_proxy.register_external_listener(software_proxy)
+    def add_segment(self, proxy: Proxy, boards: list):
+        self.segments.append(proxy)
+        for board in boards:
+            self._owners.setdefault(int(board), []).append(proxy)
+        self._routes.clear()
+        proxy.set_router(self, boards)
 
+    def is_owned_by(self, proxy: Proxy, destination: int) -> bool:
+        return proxy in self._owners.get(destination, ())
 
-    async def run_proxy():
-        await asyncio.gather(software_proxy.serve(),
-                             hardware_proxy.serve())
+    def route(self, source: Proxy, destination: int) -> list[Proxy]:
+        key = (source.name, destination)
+        segments = self._routes.get(key)
+        if segments is None:
+            if destination == BoardID.BROADCAST:
+                segments = self.segments
+            else:
+                segments = self._owners.get(destination, [])
+            segments = [segment for segment in segments if segment is not source]
+            self._routes[key] = segments
+        return segments
 
+    @staticmethod
+    def parse_board(board) -> int:
+        if isinstance(board, str):
+            try:
+                return int(BoardID[board.upper()])
+            except KeyError:
+                raise ValueError(f'Unknown board: "{board}"')
+        if not 0 <= int(board) <= BoardID.LAST_BOARD:
+            raise ValueError(f'Board id {board} is outside 0..{int(BoardID.LAST_BOARD)}')
+        return int(board)
+
+    @classmethod
+    def default_config(cls, port: int) -> dict:
+        """
+        The classic layout: ground software on port, every other board on port + 1.
+        """
+        return {'segments': {
+            'software': {'port': port, 'mirror_frames': True, 'boards': ['SOFTWARE']},
+            'hardware': {'port': port + 1, 'mirror_frames': False,
+                         'boards': list(range(BoardID.ROCKET, BoardID.LAST_BOARD + 1))},
+        }}
+
+    @classmethod
+    def from_config(cls, config: dict, address: str, reuse_port: bool = False) -> 'Router':
+        """
+        Builds one Proxy per entry of config['segments'], see proxy_config.yaml.
+        """
+        router = cls()
+        for name, segment in config['segments'].items():
+            proxy = Proxy(name=name)
+            proxy.set_tcp_server_options(address, int(segment['port']), reuse_port)
+            proxy.set_frame_mirroring(segment.get('mirror_frames', False))
+            router.add_segment(proxy, [cls.parse_board(board) for board in segment.get('boards', [])])
+        return router
+
+
+class ProxyBus:
+    """
+    Links the worker processes of a multi-process proxy. Every worker holds one Unix socket
+    to every other worker. Frames a worker reads from its clients are published to all peers
+    in one message per chunk, tagged with their segment, and each peer routes them to its own
+    clients. A client is served by one worker and every link is a stream, so frames from one
+    source keep their order.
+    """
+    # segment index, frame count, monotonic arrival time (CLOCK_MONOTONIC is shared by processes)
+    MESSAGE_HEADER = struct.Struct('<BId')
+
+    def __init__(self, worker_index: int, peer_sockets: list):
+        self.worker_index = worker_index
+        self._peer_sockets = peer_sockets
+        self._writers: list[asyncio.StreamWriter] = []
+        self._segments: list[Proxy] = []
+        self._segment_indexes: dict[str, int] = {}
+        self.frames_published = 0
+        self.frames_received = 0
+
+    async def start(self, router: Router):
+        self._segments = router.segments
+        self._segment_indexes = {proxy.name: index for index, proxy in enumerate(self._segments)}
+        for proxy in self._segments:
+            proxy.bus = self
+        for sock in self._peer_sockets:
+            reader, writer = await asyncio.open_unix_connection(sock=sock)
+            self._writers.append(writer)
+            asyncio.create_task(self._receive(reader))
+
+    async def publish(self, proxy: Proxy, frames: list, arrival: float):
+        message = self.MESSAGE_HEADER.pack(self._segment_indexes[proxy.name], len(frames), arrival) + b''.join(frames)
+        for writer in self._writers:
+            writer.write(message)
+        self.frames_published += len(frames)
+        for writer in self._writers:
+            await writer.drain()
+
+    async def _receive(self, reader: asyncio.StreamReader):
+        frame_length = GroundStationProtocol.FRAME_BYTE_LENGTH
+        while True:
+            try:
+                header = await reader.readexactly(self.MESSAGE_HEADER.size)
+                index, count, arrival = self.MESSAGE_HEADER.unpack(header)
+                data = await reader.readexactly(count * frame_length)
+            except (asyncio.IncompleteReadError, ConnectionResetError):
+                break
+            frames = [data[offset:offset + frame_length] for offset in range(0, len(data), frame_length)]
+            self.frames_received += count
+            self._segments[index].push_bus_frames(frames, arrival)
+
+
+def create_router(cl_args, reuse_port: bool = False) -> Router:
+    if cl_args.routing_config:
+        with open(cl_args.routing_config) as config_file:
+            routing_config = yaml.safe_load(config_file)
+    else:
+        routing_config = Router.default_config(int(cl_args.tcp_port))
+    router = Router.from_config(routing_config, cl_args.tcp_address, reuse_port)
+
+    client_queue_limits = (cl_args.client_queue_frames or None,
+                           cl_args.client_queue_bytes or None,
+                           OverflowPolicy(cl_args.client_overflow_policy))
+    client_scheduling = (SchedulingPolicy(cl_args.client_scheduling),
+                         {int(PriorityID.HIGH): max(cl_args.high_priority_weight, 1), int(PriorityID.LOW): 1})
+    for proxy in router.segments:
+        proxy.set_client_queue_limits(*client_queue_limits)
+        proxy.set_client_feed_conflation(cl_args.conflate_feeds)
+        proxy.set_client_scheduling(*client_scheduling)
+        proxy.set_last_state_replay(not cl_args.no_state_replay)
+        proxy.set_client_write_watermark(cl_args.client_write_watermark)
+        proxy.set_client_send_buffer(cl_args.client_sndbuf)
+    return router
+
+
+async def run_proxy(cl_args, bus: Optional[ProxyBus] = None):
+    router = create_router(cl_args, reuse_port=bus is not None)
+    if bus is not None:
+        await bus.start(router)
+
+    proxies = router.segments
+    recorder = None
+    if cl_args.record_dir:
+        # every worker process writes its own recording
+        directory = cl_args.record_dir if bus is None else os.path.join(cl_args.record_dir,
+                                                                         f'worker_{bus.worker_index}')
+        recorder = FlightRecorder(directory, cl_args.record_segment_mb * 1024 * 1024)
+        for proxy in proxies:
+            proxy.set_recorder(recorder)
+
+    tasks = [proxy.serve() for proxy in proxies]
+    if cl_args.stats_log:
+        tasks += [proxy.publish_stats(cl_args.stats_log, cl_args.stats_interval) for proxy in proxies]
+    try:
+        loop = asyncio.get_running_loop()
+        # on-demand snapshot: kill -USR1 <pid>
+        loop.add_signal_handler(signal.SIGUSR1, lambda: [proxy.log_stats() for proxy in proxies])
+        # let a terminated proxy finish its recording
+        loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except (NotImplementedError, AttributeError):
+        pass
+    try:
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+
+def run_worker(worker_index: int, bus_sockets: list, cl_args):
+    # keep only the ends of the links that belong to this worker
+    peer_sockets = []
+    for index, sockets in enumerate(bus_sockets):
+        for sock in sockets.values():
+            if index == worker_index:
+                peer_sockets.append(sock)
+            else:
+                sock.close()
+    try:
+        asyncio.run(run_proxy(cl_args, ProxyBus(worker_index, peer_sockets)))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(cl_args):
+    """
+    Starts cl_args.workers processes sharing the listening ports through SO_REUSEPORT,
+    so the kernel spreads client connections over them, linked into a full mesh ProxyBus.
+    """
+    bus_sockets = [{} for _ in range(cl_args.workers)]
+    for index in range(cl_args.workers):
+        for peer_index in range(index + 1, cl_args.workers):
+            bus_sockets[index][peer_index], bus_sockets[peer_index][index] = socket.socketpair()
+
+    # the workers inherit the bus sockets, so they have to be forked
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=run_worker, args=(index, bus_sockets, cl_args), daemon=True)
+               for index in range(cl_args.workers)]
+    for worker in workers:
+        worker.start()
+    for sockets in bus_sockets:
+        for sock in sockets.values():
+            sock.close()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers:
+            worker.terminate()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--tcp-address', default="127.0.0.1")
+    parser.add_argument('--tcp-port', default=3000)
+    parser.add_argument('--routing-config', default=None,
+                        help='YAML file with proxy segments and the boards they own, see proxy_config.yaml. '
+                             'Without it software listens on --tcp-port and hardware on --tcp-port + 1.')
+    parser.add_argument('--client-queue-frames', default=10000, type=int,
+                        help='Max frames queued per client, 0 = unlimited.')
+    parser.add_argument('--client-queue-bytes', default=0, type=int,
+                        help='Max bytes queued per client, 0 = unlimited.')
+    parser.add_argument('--client-overflow-policy', default=OverflowPolicy.DROP_OLDEST.value,
+                        choices=[policy.value for policy in OverflowPolicy])
+    parser.add_argument('--conflate-feeds', default=False, action='store_true',
+                        help='Keep only the newest queued LOW priority FEED frame per sensor for every client.')
+    parser.add_argument('--client-scheduling', default=SchedulingPolicy.STRICT.value,
+                        choices=[policy.value for policy in SchedulingPolicy],
+                        help='Order in which queued HIGH and LOW priority frames are sent to a client.')
+    parser.add_argument('--high-priority-weight', default=8, type=int,
+                        help='HIGH priority frames sent per LOW priority frame with weighted scheduling.')
+    parser.add_argument('--client-write-watermark', default=ProxyClient.WRITE_HIGH_WATERMARK, type=int,
+                        help='Bytes a client write may leave buffered before the proxy waits for it to drain. '
+                             'Larger batches raise throughput, smaller ones let HIGH priority frames overtake sooner.')
+    parser.add_argument('--client-sndbuf', default=None, type=int,
+                        help='SO_SNDBUF of client sockets in bytes, kernel default if not given. A small buffer '
+                             'keeps the backlog in the priority queues, but caps throughput on slow links.')
+    parser.add_argument('--no-state-replay', default=False, action='store_true',
+                        help='Do not send the latest FEED frame of every device to newly connected clients.')
+    parser.add_argument('--stats-log', default=None,
+                        help='Append a JSON-lines stats snapshot of every proxy segment to this file.')
+    parser.add_argument('--stats-interval', default=5.0, type=float)
+    parser.add_argument('--record-dir', default=None,
+                        help='Record every frame read from and written to clients into segmented files in '
+                             'this directory, which must be empty or not exist. Query them with flight_recorder.py.')
+    parser.add_argument('--record-segment-mb', default=64, type=int)
+    parser.add_argument('--workers', default=1, type=int,
+                        help='Worker processes sharing the listening ports, linked by a Unix socket bus.')
+    cl_args = parser.parse_args()
+    if cl_args.record_dir and os.path.isdir(cl_args.record_dir) and os.listdir(cl_args.record_dir):
+        parser.error(f'--record-dir "{cl_args.record_dir}" is not empty, record every session to a new directory')
 
-    asyncio.run(run_proxy())
\ No newline at end of file
+    if cl_args.workers > 1:
+        run_workers(cl_args)
+    else:
+        asyncio.run(run_proxy(cl_args))
@@ -4,17 +4,27 @@ import time
 import os
 import yaml
 from enum import Enum
+from collections import deque
 
 from communication_library.frame import ids, Frame
 from communication_library.communication_manager import CommunicationManager, TransportType
-from communication_library.exceptions import UnregisteredCallbackError
+from communication_library.exceptions import UnregisteredCallbackError, ChecksumMismatchError, MissingHeaderError
+from communication_library.protocol import GroundStationProtocol
 
 from communication_library.exceptions import TransportTimeoutError
 from communication_library.tcp_transport import TcpSettings
+from communication_library.transport import TransportSettings
+from communication_library.impaired_transport import NetworkImpairment
+
+from simulation_clock import SimulationClock, RealTimeClock
+from feed_publisher import FeedPublisher, FeedTemplate
+from physics_thread import PhysicsThread, GIL_SWITCH_INTERVAL
 
 from argparse import ArgumentParser
 
 import logging
+from dataclasses import dataclass, asdict, replace
+from functools import partial
 
 
 class SimulationState(Enum):
@@ -34,48 +44,150 @@ class SimulationState(Enum):
     LANDED = "LANDED"
 
 
+class Integrator(Enum):
+    # velocity first, then altitude with the new velocity, like the original update loop
+    EULER = "euler"
+    # altitude with the mean of the old and new velocity, exact for constant acceleration,
+    # and the step is split at burnout and apogee is interpolated, so larger steps stay accurate
+    TRAPEZOID = "trapezoid"
+
+
+@dataclass(slots=True)
+class SensorState:
+    fuel_level: float = 0.0
+    oxidizer_level: float = 0.0
+    altitude: float = 0.0
+    oxidizer_pressure: float = 0.0
+    angle: float = 2.0
+
+
+@dataclass(frozen=True, slots=True)
+class ServoConfig:
+    """
+    Servo entry of the hardware config with the thresholds the simulator compares positions against.
+    :param open_threshold: positions closer than this to open_pos count as open
+    """
+    name: str
+    device_id: int
+    open_pos: int
+    closed_pos: int
+    open_threshold: float
+
+    @classmethod
+    def from_config(cls, name: str, settings: dict) -> 'ServoConfig':
+        return cls(name, settings['device_id'], settings['open_pos'], settings['closed_pos'],
+                   abs(settings['open_pos'] - settings['closed_pos']) * 0.3)
+
+    def is_open(self, position: int) -> bool:
+        return abs(position - self.open_pos) < self.open_threshold
+
+    def is_closer_to_open(self, position: int) -> bool:
+        return abs(position - self.open_pos) < abs(position - self.closed_pos)
+
+
 class StandaloneMock:
+    # default simulated seconds between physics updates
+    PHYSICS_INTERVAL = 0.1
+    # virtual clocks accumulate float steps, don't skip an update because of rounding
+    TIME_EPSILON = 1e-9
+    # wall seconds the I/O loop sleeps when idle while physics runs on its own thread
+    IO_IDLE_SLEEP = 0.0005
+    # simulation times kept in a snapshot relative to the moment it was taken
+    SNAPSHOT_TIMERS = ('fuel_main_open_time', 'oxidizer_main_open_time', 'igniter_start_time', 'apogee_reached_time')
+
     def __init__(self, proxy_address: str,
                  proxy_port: int,
                  hardware_config: str,
                  feed_send_interval: float,
                  no_print: bool,
                  verbose: bool,
-                 time_multiplier: float):
-        
+                 time_multiplier: float,
+                 transport_type: TransportType = TransportType.TCP,
+                 transport_settings: TransportSettings = None,
+                 record_path: str = None,
+                 clock: SimulationClock = None,
+                 physics_rate: float = None,
+                 integrator: Integrator = Integrator.EULER,
+                 feed_deadband: float = 0.0,
+                 feed_heartbeat: float = 5.0,
+                 board: int = None,
+                 physics_thread: bool = False):
+        """
+        :param transport_type: None runs headless, without a connection, driven only through step()
+        :param clock: source of simulation time, by default the wall clock scaled by time_multiplier
+        :param physics_rate: physics steps per simulated second, by default 1 / PHYSICS_INTERVAL
+        :param integrator: how altitude follows velocity within a physics step
+        :param feed_deadband: feeds are sent when a value moves by more than this, see FeedPublisher
+        :param feed_heartbeat: seconds between feeds of every value, 0 sends every value every feed
+        :param board: board id all devices report from, by default the "board" of each device in the config
+        :param physics_thread: run physics and frame handling on a PhysicsThread, apart from the I/O loop
+        """
         with open(hardware_config, 'r') as config_file:
             self.config = yaml.safe_load(config_file)
         
+        if transport_settings is None and transport_type is not None:
+            transport_settings = TcpSettings(address=proxy_address, port=proxy_port)
+
         self.manager = CommunicationManager()
-        self.manager.change_transport_type(TransportType.TCP)
-        self.manager.connect(TcpSettings(address=proxy_address, port=proxy_port))
+        if transport_type is not None:
+            self.manager.change_transport_type(transport_type)
+            if record_path:
+                self.manager.record_transport(record_path)
+            self.manager.connect(transport_settings)
+        self.board = board
         self.setup_loggers()
-        self._logger = logging.getLogger("main")
+        self._logger = logging.getLogger("main" if board is None else f"main.board{board}")
         self.feed_send_delay = feed_send_interval
         self.no_print = no_print
         self.verbose = verbose
         self.time_multiplier = time_multiplier
-        self.last_feed_update = time.perf_counter()
-        self.last_physics_update = time.perf_counter()
+        self.clock = clock or RealTimeClock(time_multiplier)
+        # physics advances in fixed steps, last_physics_update is the simulated time it has reached
+        self.physics_interval = 1.0 / physics_rate if physics_rate else self.PHYSICS_INTERVAL
+        self.integrator = integrator
+        self.last_physics_update = self.clock.now()
+        self.physics_steps = 0
+        self.catch_up_steps = 0
+        self.max_catch_up_steps = 0
+        # simulated seconds every recent physics step ran after it was due
+        self.tick_lateness = deque(maxlen=1000)
+        self.max_tick_lateness = 0.0
         self.last_status_print = time.perf_counter()
         self.should_run = True
         
         self.state = SimulationState.IDLE
         
-        self.servos = {}
-        for servo_name, servo_config in self.config['devices']['servo'].items():
-            self.servos[servo_name] = servo_config['closed_pos']
-        
-        self.relays = {}
-        for relay_name in self.config['devices']['relay'].keys():
-            self.relays[relay_name] = 0
-        
-        self.sensors = {
-            'fuel_level': 0.0,
-            'oxidizer_level': 0.0,
-            'altitude': 0.0,
-            'oxidizer_pressure': 0.0,
-            'angle': 2.0
+        # the config is compiled once into lookups by device_id, frames and physics never walk it
+        self.servo_configs = {name: ServoConfig.from_config(name, settings)
+                              for name, settings in self.config['devices']['servo'].items()}
+        self.servo_configs_by_id = {servo.device_id: servo for servo in self.servo_configs.values()}
+        self.relay_names_by_id = {settings['device_id']: name
+                                  for name, settings in self.config['devices']['relay'].items()}
+
+        self.servos = {name: servo.closed_pos for name, servo in self.servo_configs.items()}
+        self.relays = {name: 0 for name in self.config['devices']['relay']}
+        self.sensors = SensorState()
+        # what the feeds send, the physics thread swaps in copies after every tick and command
+        self.feed_sensors = self.sensors
+        self.feed_servos = self.servos
+
+        self.feed_publisher = self.create_feed_publisher(feed_deadband, feed_heartbeat)
+        self.feed_publisher.set_state(self.state, self.clock.now())
+
+        self._frame_handlers = {
+            ids.DeviceID.SERVO: self.handle_servo_frame,
+            ids.DeviceID.RELAY: self.handle_relay_frame,
+        }
+        self._physics_handlers = {
+            SimulationState.IDLE: self.update_idle,
+            SimulationState.FILLING_OXIDIZER: self.update_filling_oxidizer,
+            SimulationState.OXIDIZER_FILLED: self.update_oxidizer_filled,
+            SimulationState.FILLING_FUEL: self.update_filling_fuel,
+            SimulationState.FUEL_FILLED: self.update_fuel_filled,
+            SimulationState.FLIGHT: self.update_flight,
+            SimulationState.APOGEE: self.update_apogee,
+            SimulationState.PARACHUTE_DEPLOYED: self.update_parachute_deployed,
+            SimulationState.FREEFALL: self.update_freefall,
         }
         
         self.oxidizer_filled = False
@@ -87,14 +199,21 @@ class StandaloneMock:
         self.max_altitude = 0.0
         self.velocity = 0.0
         self.thrust_multiplier = 1.0
+        self.physics_thread = PhysicsThread(self) if physics_thread else None
 
-        self._logger.info(
-            f'Rocket simulator is running connected to {proxy_address}:{proxy_port}')
+        if transport_settings is not None:
+            self._logger.info(
+                f'Rocket simulator is running connected to {transport_settings.address}:{transport_settings.port}')
+        else:
+            self._logger.info('Rocket simulator is running headless')
         self._logger.info(f'State: {self.state.value}')
 
     def setup_loggers(self):
         logger_main = logging.getLogger("main")
         logger_main.setLevel(logging.DEBUG)
+        if logger_main.handlers:
+            # another mock in this process has already set it up
+            return
 
         fmt = '[%(asctime)s] [%(levelname)s] %(message)s'
         log_formatter = logging.Formatter(fmt=fmt)
@@ -109,11 +228,11 @@ class StandaloneMock:
         self._logger.info("ROCKET STATUS:")
         self._logger.info(f"  State: {self.state.value}")
         self._logger.info(f"  Sensors:")
-        self._logger.info(f"    - Fuel Level: {self.sensors['fuel_level']:.1f}%")
-        self._logger.info(f"    - Oxidizer Level: {self.sensors['oxidizer_level']:.1f}%")
-        self._logger.info(f"    - Oxidizer Pressure: {self.sensors['oxidizer_pressure']:.1f} bar")
-        self._logger.info(f"    - Altitude: {self.sensors['altitude']:.1f} m")
-        self._logger.info(f"    - Angle: {self.sensors['angle']:.1f}°")
+        self._logger.info(f"    - Fuel Level: {self.sensors.fuel_level:.1f}%")
+        self._logger.info(f"    - Oxidizer Level: {self.sensors.oxidizer_level:.1f}%")
+        self._logger.info(f"    - Oxidizer Pressure: {self.sensors.oxidizer_pressure:.1f} bar")
+        self._logger.info(f"    - Altitude: {self.sensors.altitude:.1f} m")
+        self._logger.info(f"    - Angle: {self.sensors.angle:.1f}°")
         self._logger.info(f"  Servos:")
         for servo_name, position in self.servos.items():
             self._logger.info(f"    - {servo_name}: {position}")
@@ -121,6 +240,16 @@ class StandaloneMock:
         for relay_name, state in self.relays.items():
             self._logger.info(f"    - {relay_name}: {'OPEN' if state else 'CLOSED'}")
         self._logger.info(f"  Velocity: {self.velocity:.2f} m/s")
+        self._logger.info(f"  Physics: {self.physics_steps} steps of {self.physics_interval:g}s, "
+                          f"{self.catch_up_steps} to catch up (at most {self.max_catch_up_steps} at once)")
+        if self.tick_lateness:
+            lateness = sorted(self.tick_lateness)
+            self._logger.info(f"  Physics tick late by: mean {sum(lateness) / len(lateness) * 1000:.2f} ms, "
+                              f"p99 {lateness[int(len(lateness) * 0.99)] * 1000:.2f} ms, "
+                              f"max {self.max_tick_lateness * 1000:.2f} ms"
+                              + (" (own thread)" if self.physics_thread is not None else ""))
+        self._logger.info(f"  Feeds: {self.feed_publisher.sent_values} values sent, "
+                          f"{self.feed_publisher.suppressed_values} unchanged")
         self._logger.info("=" * 60)
 
     def explode(self, reason: str):
@@ -128,442 +257,541 @@ class StandaloneMock:
         self._logger.error(f'EXPLOSION: {reason}')
         self.print_rocket_status()
         self._logger.error('Simulation ended.')
-        time.sleep(2)
+        self.clock.sleep(2)
         self.should_run = False
 
+    def _ack(self, _frame: Frame) -> Frame:
+        replacements = {
+            'destination': _frame.source,
+            'source': _frame.destination,
+            'action': ids.ActionID.ACK
+        }
+        return Frame(**{**_frame.as_dict(), **replacements})
+
     def handle_frame(self, _frame) -> list[Frame]:
-        output_frames = []
-        handled = False
-        
         if self.verbose:
             self._logger.info(f'Received frame: {_frame}')
-        
-        if _frame.device_type == ids.DeviceID.SERVO:
-            servo_name = self.get_servo_name(_frame.device_id)
-            if servo_name:
-                if _frame.operation == ids.OperationID.SERVO.value.POSITION:
-                    old_val = self.servos[servo_name]
-                    new_position = int(_frame.data)
-                    self.servos[servo_name] = new_position
-                    
-                    servo_config = self.config['devices']['servo'][servo_name]
-                    open_pos = servo_config['open_pos']
-                    closed_pos = servo_config['closed_pos']
-                    
-                    self._logger.info(f'{servo_name} position set to {new_position} (was {old_val})')
-                    
-                    if abs(new_position - open_pos) < abs(new_position - closed_pos):
-                        if servo_name == 'fuel_main':
-                            self.fuel_main_open_time = time.perf_counter()
-                        elif servo_name == 'oxidizer_main':
-                            self.oxidizer_main_open_time = time.perf_counter()
-                    else:
-                        if servo_name == 'fuel_main':
-                            self.fuel_main_open_time = None
-                        elif servo_name == 'oxidizer_main':
-                            self.oxidizer_main_open_time = None
-                    
-                    handled = True
-                else:
-                    self._logger.warning(f'Unknown servo operation {_frame.operation} for {servo_name}')
-            else:
-                self._logger.warning(f'Unknown servo device_id {_frame.device_id}')
-            
-            if handled:
-                replacements = {
-                    'destination': _frame.source,
-                    'source': _frame.destination,
-                    'action': ids.ActionID.ACK
-                }
-                output_frames.append(Frame(**{**_frame.as_dict(), **replacements}))
-        
-        elif _frame.device_type == ids.DeviceID.RELAY:
-            relay_name = self.get_relay_name(_frame.device_id)
-            if relay_name:
-                if _frame.operation == ids.OperationID.RELAY.value.OPEN:
-                    old_val = self.relays[relay_name]
-                    self.relays[relay_name] = 1
-                    self._logger.info(f'{relay_name} relay opened (was {old_val}, now 1)')
-                    
-                    if relay_name == 'igniter':
-                        self.igniter_start_time = time.perf_counter()
-                    
-                    handled = True
-                        
-                elif _frame.operation == ids.OperationID.RELAY.value.CLOSE:
-                    old_val = self.relays[relay_name]
-                    self.relays[relay_name] = 0
-                    self._logger.info(f'{relay_name} relay closed (was {old_val}, now 0)')
-                    
-                    if relay_name == 'igniter':
-                        self.igniter_start_time = None
-                    
-                    handled = True
-                else:
-                    self._logger.warning(f'Unknown relay operation {_frame.operation} for {relay_name}')
-            else:
-                self._logger.warning(f'Unknown relay device_id {_frame.device_id}')
-            
-            if handled:
-                replacements = {
-                    'destination': _frame.source,
-                    'source': _frame.destination,
-                    'action': ids.ActionID.ACK
-                }
-                output_frames.append(Frame(**{**_frame.as_dict(), **replacements}))
-        
-        else:
+
+        handler = self._frame_handlers.get(_frame.device_type)
+        if handler is None:
             self._logger.warning(f'Unknown device_type {_frame.device_type}')
-        
-        return output_frames
+            return []
+        return [self._ack(_frame)] if handler(_frame) else []
+
+    def handle_servo_frame(self, _frame) -> bool:
+        servo = self.servo_configs_by_id.get(_frame.device_id)
+        if servo is None:
+            self._logger.warning(f'Unknown servo device_id {_frame.device_id}')
+            return False
+        if _frame.operation != ids.OperationID.SERVO.value.POSITION:
+            self._logger.warning(f'Unknown servo operation {_frame.operation} for {servo.name}')
+            return False
+
+        old_val = self.servos[servo.name]
+        new_position = int(_frame.data)
+        self.servos[servo.name] = new_position
+        self._logger.info(f'{servo.name} position set to {new_position} (was {old_val})')
+
+        open_time = self.clock.now() if servo.is_closer_to_open(new_position) else None
+        if servo.name == 'fuel_main':
+            self.fuel_main_open_time = open_time
+        elif servo.name == 'oxidizer_main':
+            self.oxidizer_main_open_time = open_time
+        return True
+
+    def handle_relay_frame(self, _frame) -> bool:
+        relay_name = self.relay_names_by_id.get(_frame.device_id)
+        if relay_name is None:
+            self._logger.warning(f'Unknown relay device_id {_frame.device_id}')
+            return False
+
+        if _frame.operation == ids.OperationID.RELAY.value.OPEN:
+            state = 1
+        elif _frame.operation == ids.OperationID.RELAY.value.CLOSE:
+            state = 0
+        else:
+            self._logger.warning(f'Unknown relay operation {_frame.operation} for {relay_name}')
+            return False
+
+        old_val = self.relays[relay_name]
+        self.relays[relay_name] = state
+        self._logger.info(f'{relay_name} relay {"opened" if state else "closed"} (was {old_val}, now {state})')
+        if relay_name == 'igniter':
+            self.igniter_start_time = self.clock.now() if state else None
+        return True
 
     def get_servo_name(self, device_id):
-        for name, settings in self.config['devices']['servo'].items():
-            if settings['device_id'] == device_id:
-                return name
-        return None
+        servo = self.servo_configs_by_id.get(device_id)
+        return servo.name if servo is not None else None
     
     def get_relay_name(self, device_id):
-        for name, settings in self.config['devices']['relay'].items():
-            if settings['device_id'] == device_id:
-                return name
-        return None
+        return self.relay_names_by_id.get(device_id)
 
     def is_servo_open(self, servo_name: str) -> bool:
-        servo_config = self.config['devices']['servo'][servo_name]
-        open_pos = servo_config['open_pos']
-        closed_pos = servo_config['closed_pos']
-        current_pos = self.servos[servo_name]
-        
-        threshold = abs(open_pos - closed_pos) * 0.3
-        return abs(current_pos - open_pos) < threshold
+        return self.servo_configs[servo_name].is_open(self.servos[servo_name])
+
+    def move(self, acceleration: float, dt: float, min_velocity: float = None):
+        old_velocity = self.velocity
+        self.velocity += acceleration * dt
+        if min_velocity is not None:
+            self.velocity = max(min_velocity, self.velocity)
+
+        if self.integrator == Integrator.TRAPEZOID:
+            self.sensors.altitude += (old_velocity + self.velocity) / 2 * dt
+        else:
+            self.sensors.altitude += self.velocity * dt
+
+    def change_state(self, state: SimulationState, note: str = None, level: int = logging.INFO):
+        self.state = state
+        self._logger.log(level, f'State: {state.value}' + (f' - {note}' if note else ''))
+        self.print_rocket_status()
 
     def update_physics(self, dt: float):
-        old_state = self.state
-        
-        if self.state == SimulationState.IDLE:
-            if self.is_servo_open('fuel_intake'):
-                self._logger.warning('PROPELLANT LOADING VIOLATION: Fuel intake opened before oxidizer is filled!')
-                self._logger.warning('Correct procedure: Fill oxidizer tank first, then fuel tank.')
-            elif self.is_servo_open('oxidizer_intake'):
-                self.state = SimulationState.FILLING_OXIDIZER
-                self._logger.info(f'State: {self.state.value}')
-                self.print_rocket_status()
-        
-        elif self.state == SimulationState.FILLING_OXIDIZER:
-            if self.is_servo_open('fuel_intake'):
-                self._logger.warning('PROPELLANT LOADING VIOLATION: Fuel intake opened before oxidizer is fully filled!')
-                self._logger.warning('Correct procedure: Complete oxidizer filling first.')
-            
-            if self.is_servo_open('oxidizer_intake'):
-                self.sensors['oxidizer_level'] = min(100.0, self.sensors['oxidizer_level'] + dt * 10.0)
-                self.sensors['oxidizer_pressure'] = min(40.0, self.sensors['oxidizer_pressure'] + dt * 2.0)
-                
-                if self.sensors['oxidizer_level'] >= 100.0:
-                    self.state = SimulationState.OXIDIZER_FILLED
-                    self._logger.info(f'State: {self.state.value}')
-                    self.print_rocket_status()
-            else:
-                if self.sensors['oxidizer_level'] >= 100.0:
-                    self.state = SimulationState.OXIDIZER_FILLED
-                    self._logger.info(f'State: {self.state.value}')
-                    self.print_rocket_status()
-                else:
-                    self.sensors['oxidizer_pressure'] = max(0.0, self.sensors['oxidizer_pressure'] - dt * 1.0)
-        
-        elif self.state == SimulationState.OXIDIZER_FILLED:
-            if self.relays['oxidizer_heater'] == 1:
-                self.sensors['oxidizer_pressure'] = min(90.0, self.sensors['oxidizer_pressure'] + dt * 2.5)
-                if self.sensors['oxidizer_pressure'] >= 90.0:
-                    self.explode("Oxidizer pressure too high (90 bars) - tank explosion")
-                    return
-            else:
-                self.sensors['oxidizer_pressure'] = max(30.0, self.sensors['oxidizer_pressure'] - dt * 1.0)
-            
-            if self.is_servo_open('fuel_intake'):
-                self.state = SimulationState.FILLING_FUEL
-                self._logger.info(f'State: {self.state.value}')
-                self.print_rocket_status()
-        
-        elif self.state == SimulationState.FILLING_FUEL:
-            if self.relays['oxidizer_heater'] == 1:
-                self.sensors['oxidizer_pressure'] = min(90.0, self.sensors['oxidizer_pressure'] + dt * 2.5)
-                if self.sensors['oxidizer_pressure'] >= 90.0:
-                    self.explode("Oxidizer pressure too high (90 bars) - tank explosion")
-                    return
-            else:
-                self.sensors['oxidizer_pressure'] = max(30.0, self.sensors['oxidizer_pressure'] - dt * 1.0)
-            
-            if self.is_servo_open('fuel_intake'):
-                self.sensors['fuel_level'] = min(100.0, self.sensors['fuel_level'] + dt * 10.0)
-                
-                if self.sensors['fuel_level'] >= 100.0:
-                    self.state = SimulationState.FUEL_FILLED
-                    self._logger.info(f'State: {self.state.value}')
-                    self.print_rocket_status()
-            else:
-                if self.sensors['fuel_level'] >= 100.0:
-                    self.state = SimulationState.FUEL_FILLED
-                    self._logger.info(f'State: {self.state.value}')
-                    self.print_rocket_status()
-        
-        elif self.state == SimulationState.FUEL_FILLED:
-            if self.relays['oxidizer_heater'] == 1:
-                self.sensors['oxidizer_pressure'] = min(90.0, self.sensors['oxidizer_pressure'] + dt * 2.5)
-                if self.sensors['oxidizer_pressure'] >= 90.0:
-                    self.explode("Oxidizer pressure too high (90 bars) - tank explosion")
-                    return
-            else:
-                self.sensors['oxidizer_pressure'] = max(30.0, self.sensors['oxidizer_pressure'] - dt * 1.0)
-            
-            if self.fuel_main_open_time and self.oxidizer_main_open_time:
-                time_diff = abs(self.fuel_main_open_time - self.oxidizer_main_open_time)
-                if time_diff > 1.0:
-                    if self.igniter_start_time:
-                        self.explode("Main valves opened with >1s difference - propellant imbalance explosion")
-                        return
-                
-                if self.igniter_start_time:
-                    igniter_delay_fuel = abs(self.igniter_start_time - self.fuel_main_open_time)
-                    igniter_delay_ox = abs(self.igniter_start_time - self.oxidizer_main_open_time)
-                    
-                    if igniter_delay_fuel > 1.0 or igniter_delay_ox > 1.0:
-                        self.explode("Igniter started >1s after main valves - engine flooded")
-                        return
-                    
-                    if self.igniter_start_time < min(self.fuel_main_open_time, self.oxidizer_main_open_time):
-                        self.explode("Igniter started before main valves - single propellant combustion")
-                        return
-                    
-                    if self.is_servo_open('fuel_intake') or self.is_servo_open('oxidizer_intake'):
-                        self.explode("Intake valves still open during ignition - catastrophic pressure loss")
-                        return
-                    
-                    pressure = self.sensors['oxidizer_pressure']
-                    
-                    if pressure < 40.0:
-                        self._logger.error(f"Ignition failed: Oxidizer pressure too low ({pressure:.1f} bars) - engine won't ignite")
-                        self.igniter_start_time = None
-                        return
-                    
-                    if pressure > 65.0:
-                        self.explode(f"Oxidizer pressure too high at ignition ({pressure:.1f} bars) - engine explosion")
-                        return
-                    
-                    if 55.0 <= pressure <= 65.0:
-                        self.thrust_multiplier = 1.0
-                        self._logger.info(f"Optimal pressure {pressure:.1f} bars - full thrust!")
-                    else:
-                        pressure_deviation = min(abs(pressure - 55.0), abs(pressure - 65.0))
-                        self.thrust_multiplier = max(0.5, 1.0 - (pressure_deviation / 15.0) * 0.5)
-                        self._logger.warning(f"Suboptimal pressure {pressure:.1f} bars - thrust reduced to {self.thrust_multiplier*100:.0f}%")
-                    
-                    self.state = SimulationState.FLIGHT
-                    self._logger.info(f'State: {self.state.value} - Engine ignited successfully!')
-                    self.print_rocket_status()
-        
-        elif self.state == SimulationState.FLIGHT:
-            if self.sensors['fuel_level'] > 0:
-                if self.relays['parachute'] == 1:
-                    self.explode("Parachute opened while engine is running - structural failure")
-                    return
-                
-                burn_rate = dt * 8.0
-                self.sensors['fuel_level'] = max(0.0, self.sensors['fuel_level'] - burn_rate)
-                self.sensors['oxidizer_level'] = max(0.0, self.sensors['oxidizer_level'] - burn_rate)
-                self.sensors['oxidizer_pressure'] = max(30.0, self.sensors['oxidizer_pressure'] - dt * 3.0)
-                
-                thrust = 15.0 * self.thrust_multiplier
-                gravity = 9.81
-                acceleration = thrust - gravity
-                self.velocity += acceleration * dt
-                self.sensors['altitude'] += self.velocity * dt
-                
-                self.sensors['angle'] = min(30.0, self.sensors['angle'] + dt * 2.0)
-            else:
-                if self.relays['parachute'] == 1:
-                    if self.velocity > 30.0:
-                        self._logger.error(f'Parachute deployed at too high velocity ({self.velocity:.1f} m/s) during ascent - parachute ripped!')
-                        self._logger.error('Continuing ballistic trajectory...')
-                    else:
-                        self.state = SimulationState.PARACHUTE_DEPLOYED
-                        self._logger.info(f'State: {self.state.value} - Early parachute deployment')
-                        self.print_rocket_status()
-                        return
-                
-                self.velocity -= 9.81 * dt
-                self.sensors['altitude'] += self.velocity * dt
-                
-                self.sensors['angle'] = min(90.0, self.sensors['angle'] + dt * 15.0)
-                
-                if self.sensors['altitude'] > self.max_altitude:
-                    self.max_altitude = self.sensors['altitude']
-                
-                if self.velocity <= 0 and self.apogee_reached_time is None:
-                    self.apogee_reached_time = time.perf_counter()
-                    self.state = SimulationState.APOGEE
-                    self._logger.info(f'State: {self.state.value} - Maximum altitude: {self.sensors["altitude"]:.2f}m')
-                    self.print_rocket_status()
-        
-        elif self.state == SimulationState.APOGEE:
-            time_since_apogee = time.perf_counter() - self.apogee_reached_time
-            
-            self.sensors['angle'] = min(180.0, self.sensors['angle'] + dt * 20.0)
-            
+        handler = self._physics_handlers.get(self.state)
+        if handler is not None:
+            handler(dt)
+
+    def update_idle(self, dt: float):
+        if self.is_servo_open('fuel_intake'):
+            self._logger.warning('PROPELLANT LOADING VIOLATION: Fuel intake opened before oxidizer is filled!')
+            self._logger.warning('Correct procedure: Fill oxidizer tank first, then fuel tank.')
+        elif self.is_servo_open('oxidizer_intake'):
+            self.change_state(SimulationState.FILLING_OXIDIZER)
+
+    def update_filling_oxidizer(self, dt: float):
+        sensors = self.sensors
+        if self.is_servo_open('fuel_intake'):
+            self._logger.warning('PROPELLANT LOADING VIOLATION: Fuel intake opened before oxidizer is fully filled!')
+            self._logger.warning('Correct procedure: Complete oxidizer filling first.')
+
+        if self.is_servo_open('oxidizer_intake'):
+            sensors.oxidizer_level = min(100.0, sensors.oxidizer_level + dt * 10.0)
+            sensors.oxidizer_pressure = min(40.0, sensors.oxidizer_pressure + dt * 2.0)
+        elif sensors.oxidizer_level < 100.0:
+            sensors.oxidizer_pressure = max(0.0, sensors.oxidizer_pressure - dt * 1.0)
+
+        if sensors.oxidizer_level >= 100.0:
+            self.change_state(SimulationState.OXIDIZER_FILLED)
+
+    def update_heater(self, dt: float) -> bool:
+        """
+        Oxidizer pressure on the pad once the tank is filled. Returns False if the tank exploded.
+        """
+        sensors = self.sensors
+        if self.relays['oxidizer_heater'] == 1:
+            sensors.oxidizer_pressure = min(90.0, sensors.oxidizer_pressure + dt * 2.5)
+            if sensors.oxidizer_pressure >= 90.0:
+                self.explode("Oxidizer pressure too high (90 bars) - tank explosion")
+                return False
+        else:
+            sensors.oxidizer_pressure = max(30.0, sensors.oxidizer_pressure - dt * 1.0)
+        return True
+
+    def update_oxidizer_filled(self, dt: float):
+        if self.update_heater(dt) and self.is_servo_open('fuel_intake'):
+            self.change_state(SimulationState.FILLING_FUEL)
+
+    def update_filling_fuel(self, dt: float):
+        if not self.update_heater(dt):
+            return
+
+        if self.is_servo_open('fuel_intake'):
+            self.sensors.fuel_level = min(100.0, self.sensors.fuel_level + dt * 10.0)
+        if self.sensors.fuel_level >= 100.0:
+            self.change_state(SimulationState.FUEL_FILLED)
+
+    def update_fuel_filled(self, dt: float):
+        if not self.update_heater(dt):
+            return
+        # 0.0 is a valid time on a virtual clock or right after restoring a snapshot
+        if None in (self.fuel_main_open_time, self.oxidizer_main_open_time, self.igniter_start_time):
+            return
+
+        if abs(self.fuel_main_open_time - self.oxidizer_main_open_time) > 1.0:
+            self.explode("Main valves opened with >1s difference - propellant imbalance explosion")
+            return
+
+        igniter_delay_fuel = abs(self.igniter_start_time - self.fuel_main_open_time)
+        igniter_delay_ox = abs(self.igniter_start_time - self.oxidizer_main_open_time)
+        if igniter_delay_fuel > 1.0 or igniter_delay_ox > 1.0:
+            self.explode("Igniter started >1s after main valves - engine flooded")
+            return
+
+        if self.igniter_start_time < min(self.fuel_main_open_time, self.oxidizer_main_open_time):
+            self.explode("Igniter started before main valves - single propellant combustion")
+            return
+
+        if self.is_servo_open('fuel_intake') or self.is_servo_open('oxidizer_intake'):
+            self.explode("Intake valves still open during ignition - catastrophic pressure loss")
+            return
+
+        pressure = self.sensors.oxidizer_pressure
+
+        if pressure < 40.0:
+            self._logger.error(f"Ignition failed: Oxidizer pressure too low ({pressure:.1f} bars) - engine won't ignite")
+            self.igniter_start_time = None
+            return
+
+        if pressure > 65.0:
+            self.explode(f"Oxidizer pressure too high at ignition ({pressure:.1f} bars) - engine explosion")
+            return
+
+        if 55.0 <= pressure <= 65.0:
+            self.thrust_multiplier = 1.0
+            self._logger.info(f"Optimal pressure {pressure:.1f} bars - full thrust!")
+        else:
+            pressure_deviation = min(abs(pressure - 55.0), abs(pressure - 65.0))
+            self.thrust_multiplier = max(0.5, 1.0 - (pressure_deviation / 15.0) * 0.5)
+            self._logger.warning(f"Suboptimal pressure {pressure:.1f} bars - thrust reduced to {self.thrust_multiplier*100:.0f}%")
+
+        self.change_state(SimulationState.FLIGHT, 'Engine ignited successfully!')
+
+    def update_flight(self, dt: float):
+        sensors = self.sensors
+        if sensors.fuel_level > 0:
             if self.relays['parachute'] == 1:
-                self.state = SimulationState.PARACHUTE_DEPLOYED
-                self._logger.info(f'State: {self.state.value}')
-                self.print_rocket_status()
-            elif time_since_apogee > 10.0:
-                self.state = SimulationState.FREEFALL
-                self._logger.info(f'State: {self.state.value} - Parachute not deployed in time!')
-                self.print_rocket_status()
+                self.explode("Parachute opened while engine is running - structural failure")
+                return
+
+            # with the trapezoid integrator the step is split at burnout instead of overshooting it
+            burn_time = dt
+            if self.integrator == Integrator.TRAPEZOID:
+                burn_time = min(dt, sensors.fuel_level / 8.0)
+
+            burn_rate = dt * 8.0
+            sensors.fuel_level = max(0.0, sensors.fuel_level - burn_rate)
+            sensors.oxidizer_level = max(0.0, sensors.oxidizer_level - burn_rate)
+            sensors.oxidizer_pressure = max(30.0, sensors.oxidizer_pressure - dt * 3.0)
+
+            thrust = 15.0 * self.thrust_multiplier
+            gravity = 9.81
+            acceleration = thrust - gravity
+            self.move(acceleration, burn_time)
+            if burn_time < dt:
+                self.move(-gravity, dt - burn_time)
+
+            sensors.angle = min(30.0, sensors.angle + dt * 2.0)
+            return
+
+        if self.relays['parachute'] == 1:
+            if self.velocity > 30.0:
+                self._logger.error(f'Parachute deployed at too high velocity ({self.velocity:.1f} m/s) during ascent - parachute ripped!')
+                self._logger.error('Continuing ballistic trajectory...')
             else:
-                self.velocity -= 9.81 * dt
-                self.sensors['altitude'] += self.velocity * dt
-        
-        elif self.state == SimulationState.PARACHUTE_DEPLOYED:
-            terminal_velocity = -5.0
-            self.velocity = max(terminal_velocity, self.velocity - 9.81 * dt)
-            self.sensors['altitude'] += self.velocity * dt
-            
-            if self.sensors['angle'] > 0:
-                self.sensors['angle'] = max(0.0, self.sensors['angle'] - dt * 30.0)
-            elif self.sensors['angle'] < 0:
-                self.sensors['angle'] = min(0.0, self.sensors['angle'] + dt * 30.0)
-            
-            if self.sensors['altitude'] <= 0:
-                self.sensors['altitude'] = 0.0
-                self.velocity = 0.0
-                self.state = SimulationState.LANDED
-                self._logger.info(f'State: {self.state.value} - Successful landing!')
-                self.print_rocket_status()
-                time.sleep(2)
-                self.should_run = False
-        
-        elif self.state == SimulationState.FREEFALL:
-            self.velocity -= 9.81 * dt
-            self.sensors['altitude'] += self.velocity * dt
-            
-            self.sensors['angle'] = min(180.0, self.sensors['angle'] + dt * 20.0)
-            
-            if self.relays['parachute'] == 1:
-                if abs(self.velocity) > 30.0:
-                    self._logger.error(f'Parachute deployed at too high velocity ({abs(self.velocity):.1f} m/s) - parachute ripped!')
-                    self._logger.error('Continuing freefall...')
-                else:
-                    self.state = SimulationState.PARACHUTE_DEPLOYED
-                    self._logger.info(f'State: {self.state.value} - Late parachute deployment successful')
-                    self.print_rocket_status()
-            
-            if self.sensors['altitude'] <= 0:
-                self.sensors['altitude'] = 0.0
-                self.velocity = 0.0
-                self.state = SimulationState.LANDED
-                self._logger.error(f'State: {self.state.value} - CRASH LANDING!')
-                self.print_rocket_status()
-                time.sleep(2)
-                self.should_run = False
+                self.change_state(SimulationState.PARACHUTE_DEPLOYED, 'Early parachute deployment')
+                return
 
-    def send_feed_frame(self):
-        conf_dict = self.config
-        sensors_config: dict = conf_dict["devices"]["sensor"]
-
-        for sensor_name, sensor_settings in sensors_config.items():
-            source = ids.BoardID[sensor_settings["board"].upper()]
-            device_id = sensor_settings["device_id"]
-            data_type = ids.DataTypeID[sensor_settings["data_type"].upper()]
-            
-            if sensor_name in self.sensors:
-                value = self.sensors[sensor_name]
+        self.move(-9.81, dt)
+        sensors.angle = min(90.0, sensors.angle + dt * 15.0)
+
+        if sensors.altitude > self.max_altitude:
+            self.max_altitude = sensors.altitude
+        old_velocity = self.velocity + 9.81 * dt
+        if self.integrator == Integrator.TRAPEZOID and self.velocity <= 0 < old_velocity:
+            # the peak of the parabola is within this step
+            old_altitude = sensors.altitude - (old_velocity + self.velocity) / 2 * dt
+            self.max_altitude = max(self.max_altitude, old_altitude + old_velocity ** 2 / (2 * 9.81))
+
+        if self.velocity <= 0 and self.apogee_reached_time is None:
+            self.apogee_reached_time = self.last_physics_update
+            self.change_state(SimulationState.APOGEE, f'Maximum altitude: {self.max_altitude:.2f}m')
+
+    def update_apogee(self, dt: float):
+        time_since_apogee = self.last_physics_update - self.apogee_reached_time
+        self.sensors.angle = min(180.0, self.sensors.angle + dt * 20.0)
+
+        if self.relays['parachute'] == 1:
+            self.change_state(SimulationState.PARACHUTE_DEPLOYED)
+        elif time_since_apogee > 10.0:
+            self.change_state(SimulationState.FREEFALL, 'Parachute not deployed in time!')
+        else:
+            self.move(-9.81, dt)
+
+    def update_parachute_deployed(self, dt: float):
+        sensors = self.sensors
+        terminal_velocity = -5.0
+        self.move(-9.81, dt, min_velocity=terminal_velocity)
+
+        if sensors.angle > 0:
+            sensors.angle = max(0.0, sensors.angle - dt * 30.0)
+        elif sensors.angle < 0:
+            sensors.angle = min(0.0, sensors.angle + dt * 30.0)
+
+        if sensors.altitude <= 0:
+            self.land('Successful landing!', logging.INFO)
+
+    def update_freefall(self, dt: float):
+        self.move(-9.81, dt)
+        self.sensors.angle = min(180.0, self.sensors.angle + dt * 20.0)
+
+        if self.relays['parachute'] == 1:
+            if abs(self.velocity) > 30.0:
+                self._logger.error(f'Parachute deployed at too high velocity ({abs(self.velocity):.1f} m/s) - parachute ripped!')
+                self._logger.error('Continuing freefall...')
             else:
-                value = 0.0
+                self.change_state(SimulationState.PARACHUTE_DEPLOYED, 'Late parachute deployment successful')
+
+        if self.sensors.altitude <= 0:
+            self.land('CRASH LANDING!', logging.ERROR)
+
+    def land(self, note: str, level: int):
+        self.sensors.altitude = 0.0
+        self.velocity = 0.0
+        self.change_state(SimulationState.LANDED, note, level)
+        self.clock.sleep(2)
+        self.should_run = False
+
+    def to_snapshot(self) -> dict:
+        """
+        Everything the physics depends on as plain data, timers in seconds relative to now.
+        """
+        now = self.clock.now()
+        timers = {}
+        for name in self.SNAPSHOT_TIMERS:
+            value = getattr(self, name)
+            timers[name] = None if value is None else value - now
+        return {'state': self.state.value,
+                'sensors': asdict(self.sensors),
+                'servos': dict(self.servos),
+                'relays': dict(self.relays),
+                'timers': timers,
+                'velocity': self.velocity,
+                'thrust_multiplier': self.thrust_multiplier,
+                'max_altitude': self.max_altitude}
+
+    def restore_snapshot(self, snapshot: dict):
+        """
+        Continues from a to_snapshot() result, taken now. Sections missing from it keep their current values.
+        """
+        unknown = ({f'servo {name}' for name in snapshot.get('servos', {}) if name not in self.servos}
+                   | {f'relay {name}' for name in snapshot.get('relays', {}) if name not in self.relays}
+                   | {f'sensor {name}' for name in snapshot.get('sensors', {}) if name not in SensorState.__slots__})
+        if unknown:
+            raise ValueError(f'Snapshot devices missing from the hardware config: {", ".join(sorted(unknown))}')
+
+        now = self.clock.now()
+        self.last_physics_update = now
+        # feed templates read these objects, they are updated in place
+        for name, value in snapshot.get('sensors', {}).items():
+            setattr(self.sensors, name, float(value))
+        self.servos.update(snapshot.get('servos', {}))
+        self.relays.update(snapshot.get('relays', {}))
+        for name, offset in snapshot.get('timers', {}).items():
+            if name not in self.SNAPSHOT_TIMERS:
+                raise ValueError(f'Unknown snapshot timer {name}')
+            setattr(self, name, None if offset is None else now + offset)
+        for name in ('velocity', 'thrust_multiplier', 'max_altitude'):
+            if name in snapshot:
+                setattr(self, name, snapshot[name])
+        self.change_state(SimulationState(snapshot.get('state', self.state.value)), 'restored from snapshot')
+
+    def save_snapshot(self, path: str):
+        with open(path, 'w') as snapshot_file:
+            yaml.safe_dump(self.to_snapshot(), snapshot_file, sort_keys=False)
+        self._logger.info(f'Snapshot saved to {path}')
 
+    def load_snapshot(self, path: str):
+        with open(path, 'r') as snapshot_file:
+            self.restore_snapshot(yaml.safe_load(snapshot_file))
+
+    def create_feed_publisher(self, deadband: float, heartbeat_interval: float) -> FeedPublisher:
+        """
+        One feed template per sensor and servo of the config. A device's own "deadband" entry
+        overrides the default deadband, "rate" (Hz) overrides the feed interval and
+        "state_rates" maps simulation states to the rate used while in them.
+        """
+        now = self.clock.now()
+        publisher = FeedPublisher(heartbeat_interval, now)
+        for sensor_name, sensor_settings in self.config["devices"]["sensor"].items():
             frame = Frame(destination=ids.BoardID.SOFTWARE,
                           priority=ids.PriorityID.LOW,
                           action=ids.ActionID.FEED,
-                          source=source,
+                          source=self.device_board(sensor_settings),
                           device_type=ids.DeviceID.SENSOR,
-                          device_id=device_id,
-                          data_type=data_type,
+                          device_id=sensor_settings["device_id"],
+                          data_type=ids.DataTypeID[sensor_settings["data_type"].upper()],
                           operation=ids.OperationID.SENSOR.value.READ,
-                          payload=(value,))
-            self.manager.push(frame)
-            try:
-                self.manager.send()
-            except TransportTimeoutError:
-                break
-
-            if self.verbose:
-                self._logger.info(f"sent feed frame: {frame}")
-
-        servos_config: dict = conf_dict["devices"]["servo"]
-        for servo_name, servo_settings in servos_config.items():
-            source = ids.BoardID[servo_settings["board"].upper()]
-            device_id = servo_settings["device_id"]
-            data_type = ids.DataTypeID.INT16
-            
-            if servo_name in self.servos:
-                value = int(self.servos[servo_name])
+                          payload=(0.0,))
+            if sensor_name in SensorState.__slots__:
+                read = partial(self.read_feed_sensor, sensor_name)
             else:
-                value = 0
+                read = partial(float, 0.0)
+            publisher.add(FeedTemplate(frame, read, *self.feed_intervals(sensor_settings),
+                                       sensor_settings.get("deadband", deadband)), now)
 
+        for servo_name, servo_settings in self.config["devices"]["servo"].items():
             frame = Frame(destination=ids.BoardID.SOFTWARE,
                           priority=ids.PriorityID.LOW,
                           action=ids.ActionID.FEED,
-                          source=source,
+                          source=self.device_board(servo_settings),
                           device_type=ids.DeviceID.SERVO,
-                          device_id=device_id,
-                          data_type=data_type,
+                          device_id=servo_settings["device_id"],
+                          data_type=ids.DataTypeID.INT16,
                           operation=ids.OperationID.SERVO.value.POSITION,
-                          payload=(value,))
-            self.manager.push(frame)
-            try:
-                self.manager.send()
-            except TransportTimeoutError:
+                          payload=(0,))
+            publisher.add(FeedTemplate(frame, partial(self.read_feed_servo, servo_name),
+                                       *self.feed_intervals(servo_settings),
+                                       servo_settings.get("deadband", deadband)), now)
+        return publisher
+
+    def device_board(self, device_settings: dict) -> int:
+        if self.board is not None:
+            return self.board
+        return ids.BoardID[device_settings["board"].upper()]
+
+    def feed_intervals(self, device_settings: dict) -> tuple[float, dict[SimulationState, float]]:
+        """
+        Feed interval of a device and its per-state overrides, from its "rate" and "state_rates".
+        """
+        rate = device_settings.get("rate")
+        interval = 1.0 / rate if rate else float(self.feed_send_delay)
+        state_intervals = {SimulationState[state.upper()]: 1.0 / state_rate
+                           for state, state_rate in device_settings.get("state_rates", {}).items()}
+        return interval, state_intervals
+
+    def read_feed_sensor(self, name: str) -> float:
+        return getattr(self.feed_sensors, name)
+
+    def read_feed_servo(self, name: str) -> int:
+        return self.feed_servos[name]
+
+    def publish_feed_values(self):
+        """
+        Makes the current sensor values and servo positions the ones the feeds send, for the physics thread.
+        """
+        self.feed_sensors = replace(self.sensors)
+        self.feed_servos = dict(self.servos)
+
+    def pending_feeds(self, now: float) -> list[tuple[FeedTemplate, object]]:
+        # the state may have changed on the physics thread, the publisher is only touched from this one
+        if self.feed_publisher.state != self.state:
+            self.feed_publisher.set_state(self.state, now)
+        return self.feed_publisher.pending(now)
+
+    def build_feed_data(self) -> bytes:
+        """
+        Encoded feed frames of the values the publisher has to send now, marked as sent.
+        """
+        now = self.clock.now()
+        pending = self.pending_feeds(now)
+        if not pending:
+            return b''
+        self.feed_publisher.mark_sent(pending, now)
+        if self.verbose:
+            for template, value in pending:
+                self._logger.info(f"sent feed frame: {template.as_frame(value)}")
+        return self.feed_publisher.encode(pending)
+
+    def send_feed_frame(self):
+        now = self.clock.now()
+        pending = self.pending_feeds(now)
+        if not pending:
+            return
+        try:
+            self.manager.send_encoded(self.feed_publisher.encode(pending))
+        except TransportTimeoutError:
+            self.feed_publisher.retry(pending, now)
+            return
+        self.feed_publisher.mark_sent(pending, now)
+
+        if self.verbose:
+            for template, value in pending:
+                self._logger.info(f"sent feed frame: {template.as_frame(value)}")
+
+    def update_physics_if_due(self) -> int:
+        """
+        Runs as many fixed physics steps as needed to catch up with the clock, so a slow
+        iteration never turns into one long step. Returns the number of steps taken.
+        """
+        steps = int((self.clock.now() - self.last_physics_update + self.TIME_EPSILON) / self.physics_interval)
+        for step in range(steps):
+            if not self.should_run:
+                steps = step
                 break
+            self.last_physics_update += self.physics_interval
+            lateness = self.clock.now() - self.last_physics_update
+            self.tick_lateness.append(lateness)
+            self.max_tick_lateness = max(self.max_tick_lateness, lateness)
+            self.update_physics(self.physics_interval)
 
-            if self.verbose:
-                self._logger.info(f"sent feed frame: {frame}")
+        self.physics_steps += steps
+        if steps > 1:
+            self.catch_up_steps += steps - 1
+            self.max_catch_up_steps = max(self.max_catch_up_steps, steps)
+        return steps
+
+    def step(self, dt: float, incoming_frames: list[Frame] = ()) -> bytes:
+        """
+        Advances a headless simulation by dt simulated seconds, without touching the transport.
+        Incoming frames are handled at the current time, then the clock moves forward and
+        physics and the feeds that are due are updated, like in run_once.
+        :param dt: simulated seconds, advances the clock (no-op for the real time clock)
+        :param incoming_frames: frames received from the ground since the previous step
+        :return: encoded ACKs of the incoming frames followed by the feed frames, ready for the wire
+        """
+        outgoing_data = b''
+        for frame in incoming_frames:
+            outgoing_data += b''.join(GroundStationProtocol.encode(response) for response in self.handle_frame(frame))
+
+        self.clock.advance(dt)
+        self.update_physics_if_due()
+        if self.should_run:
+            outgoing_data += self.build_feed_data()
+        return outgoing_data
 
     def receive_send_loop(self):
         while self.should_run:
-            current_time = time.perf_counter()
-            
-            if current_time > self.last_physics_update + 0.1:
-                dt = (current_time - self.last_physics_update) * self.time_multiplier
-                self.update_physics(dt)
-                self.last_physics_update = current_time
-            
-            if not self.verbose and current_time > self.last_status_print + 1.0:
-                self.print_rocket_status()
-                self.last_status_print = current_time
-            
+            self.run_once()
+        if self.physics_thread is not None and self.physics_thread.ident is not None:
+            self.physics_thread.join()
+
+    def send_responses(self, frames: list[Frame]):
+        for response_frame in frames:
+            self.manager.push(response_frame)
+            if self.verbose:
+                self._logger.info(f"pushed frame: {response_frame}")
             try:
-                frame = self.manager.receive()
+                self.manager.send()
             except TransportTimeoutError:
-                if current_time > self.last_feed_update + float(self.feed_send_delay):
-                    self.send_feed_frame()
-                    self.last_feed_update = current_time
                 continue
-            except UnregisteredCallbackError as e:
-                frame = e.frame
-            except KeyboardInterrupt:
-                sys.exit()
-
-            for response_frame in self.handle_frame(frame):
-                self.manager.push(response_frame)
-                if self.verbose:
-                    self._logger.info(f"pushed frame: {response_frame}")
-                try:
-                    self.manager.send()
-                except TransportTimeoutError:
-                    continue
-            
-            if current_time > self.last_feed_update + float(self.feed_send_delay):
-                self.send_feed_frame()
-                self.last_feed_update = current_time
 
+    def run_once(self):
+        if self.physics_thread is None:
+            self.update_physics_if_due()
+        elif self.physics_thread.ident is None:
+            self.physics_thread.start()
+
+        current_time = time.perf_counter()
+        if not self.verbose and current_time > self.last_status_print + 1.0:
+            self.print_rocket_status()
+            self.last_status_print = current_time
+        
+        try:
+            frame = self.manager.receive()
+        except TransportTimeoutError:
+            frame = None
+        except UnregisteredCallbackError as e:
+            frame = e.frame
+        except (ChecksumMismatchError, MissingHeaderError) as e:
+            # a corrupted frame is lost, the next receive looks for the next header
+            if self.verbose:
+                self._logger.warning(f'Dropped corrupted input: {e!r}')
+            return
+        except KeyboardInterrupt:
+            sys.exit()
+
+        if self.physics_thread is None:
+            if frame is not None:
+                self.send_responses(self.handle_frame(frame))
+        else:
+            if frame is not None:
+                self.physics_thread.commands.put(frame)
+            self.send_responses(self.physics_thread.take_responses())
+
+        self.send_feed_frame()
+        if self.physics_thread is not None and frame is None:
+            # nothing to do until the next frame or feed, give the CPU and the GIL to the physics
+            time.sleep(self.IO_IDLE_SLEEP)
 
 if __name__ == "__main__":
     parser = ArgumentParser()
@@ -576,12 +804,56 @@ if __name__ == "__main__":
                         help='Print all frames sent/received. If disabled, prints rocket status every second.')
     parser.add_argument('--time-multiplier', default=1.0, type=float,
                         help='Simulation speed multiplier. 1.0 = real-time, 2.0 = 2x faster, 0.5 = 2x slower.')
+    parser.add_argument('--record', default=None,
+                        help='Append every chunk read/written to this recording file.')
+    parser.add_argument('--physics-rate', default=1 / StandaloneMock.PHYSICS_INTERVAL, type=float,
+                        help='Fixed physics steps per simulated second, slow iterations are caught up in sub-steps.')
+    parser.add_argument('--integrator', default=Integrator.EULER.value, choices=[method.value for method in Integrator],
+                        help='trapezoid keeps altitude exact for constant acceleration, for larger steps.')
+    parser.add_argument('--feed-deadband', default=0.0, type=float,
+                        help='Feed a value only when it moved by more than this since it was last sent.')
+    parser.add_argument('--feed-heartbeat', default=5.0, type=float,
+                        help='Seconds between feeds of every value, changed or not. 0 feeds every value every time.')
+    parser.add_argument('--from-snapshot', default=None,
+                        help='Start from a snapshot file instead of IDLE, e.g. snapshots/ready_to_launch_58bar.yaml.')
+    parser.add_argument('--save-snapshot', default=None,
+                        help='Write a snapshot of the simulation to this file when it stops.')
+    parser.add_argument('--impairment-config', default=None,
+                        help='Delay, drop, duplicate, reorder and corrupt frames as in this file, see impairment_config.yaml.')
+    parser.add_argument('--latency-csv', default=None,
+                        help='With --impairment-config, write the latency of every frame to this file when it stops.')
+    parser.add_argument('--physics-thread', default=False, action='store_true',
+                        help='Run physics on its own thread, so frame I/O and status printing never delay it.')
     cl_args = parser.parse_args()
+    if cl_args.physics_thread:
+        # process wide, so set here and not by the thread, see GIL_SWITCH_INTERVAL
+        sys.setswitchinterval(min(sys.getswitchinterval(), GIL_SWITCH_INTERVAL))
     standalone_mock = StandaloneMock(cl_args.proxy_address,
                                      int(cl_args.proxy_port),
                                      cl_args.hardware_config,
                                      cl_args.feed_interval,
                                      cl_args.no_print,
                                      cl_args.verbose,
-                                     cl_args.time_multiplier)
-    standalone_mock.receive_send_loop()
\ No newline at end of file
+                                     cl_args.time_multiplier,
+                                     record_path=cl_args.record,
+                                     physics_rate=cl_args.physics_rate,
+                                     integrator=Integrator(cl_args.integrator),
+                                     feed_deadband=cl_args.feed_deadband,
+                                     feed_heartbeat=cl_args.feed_heartbeat,
+                                     physics_thread=cl_args.physics_thread)
+    if cl_args.from_snapshot:
+        standalone_mock.load_snapshot(cl_args.from_snapshot)
+    impairment = None
+    if cl_args.impairment_config:
+        with open(cl_args.impairment_config, 'r') as impairment_file:
+            impairment = NetworkImpairment(yaml.safe_load(impairment_file))
+        standalone_mock.manager.impair_transport(impairment, standalone_mock.clock.now)
+    try:
+        standalone_mock.receive_send_loop()
+    finally:
+        if cl_args.save_snapshot:
+            standalone_mock.save_snapshot(cl_args.save_snapshot)
+        if impairment is not None:
+            print(impairment.format_report())
+            if cl_args.latency_csv:
+                impairment.write_csv(cl_args.latency_csv)
\ No newline at end of file